@@ -0,0 +1,104 @@
+"""
+Throughput of the asyncio engine against 100, 1,000 and 5,000 simulated devices.
+Starts benchmarks.fake_ios_server in a separate process, then pushes a small
+config set and saves it on every simulated device, the same work
+command_sender.run_async_connection does. Use --engine thread to run the
+netmiko thread engine against the same server for comparison.
+
+Run from the repository root:
+    python -m benchmarks.bench_async_engine --latency 0.05
+"""
+import sys
+import time
+import socket
+import argparse
+import subprocess
+from src.engines import run_asyncio, run_threaded
+from src.scheduler import Scheduler
+from src.cisco_switches import check_string_not_present
+from benchmarks.fake_ios_server import raise_fd_limit
+
+DEVICE_COUNTS = (100, 1_000, 5_000)
+CMDS = ["interface Gi1/0/1", "spanning-tree guard none", "exit"]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_devices(port, latency):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_ios_server", "--port", str(port), "--latency", str(latency)],
+        stderr=subprocess.PIPE, text=True,
+    )
+    # the server reports on stderr once it is listening
+    server.stderr.readline()
+    return server
+
+
+def make_hosts(count, port):
+    return [
+        {'device_type': 'cisco_ios', 'host': '127.0.0.1', 'port': port, 'username': 'bench', 'password': 'bench'}
+        for _ in range(count)
+    ]
+
+
+async def push_async(host, results):
+    from src.async_ios import AsyncIOSConnection
+    connection = AsyncIOSConnection(**host)
+    try:
+        await connection.connect()
+        output = await connection.send_config_set(CMDS)
+        output += await connection.save_config()
+        results.append(check_string_not_present(output, "Loop guard"))
+    except Exception:
+        results.append(False)
+    finally:
+        await connection.disconnect()
+
+
+def push_threaded(host, results):
+    from netmiko import ConnectHandler
+    try:
+        connection = ConnectHandler(**host)
+        output = connection.send_config_set(CMDS)
+        output += connection.save_config()
+        connection.disconnect()
+        results.append(check_string_not_present(output, "Loop guard"))
+    except Exception:
+        results.append(False)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engine", choices=("asyncio", "thread"), default="asyncio")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per command")
+    parser.add_argument("--concurrency", type=int, default=1000, help="Sessions in flight at once")
+    parser.add_argument("--devices", type=int, nargs="*", default=DEVICE_COUNTS)
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    port = free_port()
+    server = start_fake_devices(port, args.latency)
+    try:
+        print(f"{'devices':>8} {'ok':>6} {'seconds':>9} {'devices/s':>10}")
+        for count in args.devices:
+            hosts = make_hosts(count, port)
+            results = []
+            start = time.perf_counter()
+            scheduler = Scheduler(max_concurrency=args.concurrency)
+            if args.engine == "asyncio":
+                run_asyncio(push_async, hosts, results, scheduler=scheduler)
+            else:
+                run_threaded(push_threaded, hosts, results, scheduler=scheduler)
+            elapsed = time.perf_counter() - start
+            print(f"{count:>8} {sum(results):>6} {elapsed:>9.2f} {count / elapsed:>10.1f}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
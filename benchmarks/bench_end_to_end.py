@@ -0,0 +1,206 @@
+"""
+End-to-end runs of command_sender.py and switch_finder.py against the
+in-process fake devices of benchmarks.fake_netmiko. Each scenario runs the
+real script in its own process, so the executor, the parsers and the
+Excel layer are all measured, and reports wall time, CPU time and the
+peak RSS of the script and its parser processes together, sampled from
+/proc every SAMPLE_INTERVAL seconds. Pages the processes share count once
+per process, so the sum is an upper bound. Where /proc isn't available
+(macOS) the peak is only that of the largest single process.
+
+Scenarios:
+    config_push  command_sender.py pushing a config set to every host
+    mac_scan     switch_finder.py scanning a MAC and ARP table of every host
+
+Run from the repository root:
+    python -m benchmarks.bench_end_to_end --hosts 1000 --mac-entries 10000 --latency 0.02
+Add --results FILE to append the numbers as JSON lines, for comparing commits.
+
+--max-rss checks the summed peak RSS against a target and exits with
+status 1 if a scenario went over it. The low memory target of switch_finder.py, 10k hosts with
+20k MAC and ARP entries each at --concurrency 50, is 512 MiB:
+    python -m benchmarks.bench_end_to_end --scenario mac_scan --hosts 10000 --mac-entries 20000 \
+        --arp-entries 20000 --inventory txt --concurrency 50 --max-rss 512 -- --low-memory
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import platform
+import tempfile
+import subprocess
+from pathlib import Path
+from benchmarks.fake_netmiko import add_device_arguments
+
+SCENARIOS = {
+    "config_push": ("command_sender.py", "Sheet 1"),
+    "mac_scan": ("switch_finder.py", "Sheet_name"),
+}
+CMDS = ["interface Gi1/0/1", "spanning-tree guard none", "exit"]
+
+# seconds between samples of the process tree's RSS
+SAMPLE_INTERVAL = 0.05
+
+
+def host_address(i):
+    return f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}"
+
+
+def write_inventory(directory, count, inventory, sheet):
+    if inventory == "xlsx":
+        # pandas is only needed for workbook inventories
+        import pandas as pd
+        path = directory / "hosts.xlsx"
+        pd.DataFrame({
+            "hostname": [f"sw{i}.example.net" for i in range(count)],
+            "status": [None] * count,
+            "ip": [host_address(i) for i in range(count)],
+        }).to_excel(path, sheet_name=sheet, index=False)
+    else:
+        path = directory / "hosts.txt"
+        path.write_text("".join(f"{host_address(i)}\n" for i in range(count)))
+    return path
+
+
+def tree_rss(pid):
+    """
+    :return: bytes of RSS of pid and every process below it, None without /proc
+    """
+    total = 0
+    pending = [pid]
+    while pending:
+        pid = pending.pop()
+        try:
+            with open(f"/proc/{pid}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+            for task in os.listdir(f"/proc/{pid}/task"):
+                with open(f"/proc/{pid}/task/{task}/children") as children:
+                    pending.extend(int(child) for child in children.read().split())
+        except (FileNotFoundError, ProcessLookupError):
+            # exited between listing and reading, e.g. a parser process at shutdown
+            continue
+        except OSError:
+            return None
+    return total
+
+
+class TreeSampler(threading.Thread):
+    """
+    Keeps the highest summed RSS of a process tree until stopped
+    """
+
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.peak = 0
+        self.supported = os.path.isdir("/proc/self/task")
+        self.done = threading.Event()
+
+    def run(self):
+        while self.supported and not self.done.wait(SAMPLE_INTERVAL):
+            rss = tree_rss(self.pid)
+            if rss is None:
+                self.supported = False
+                return
+            self.peak = max(self.peak, rss)
+
+    def stop(self):
+        self.done.set()
+        self.join()
+
+
+def device_args(args):
+    argv = ["--latency", str(args.latency), "--mac-entries", str(args.mac_entries),
+            "--arp-entries", str(args.arp_entries), "--auth-failure-rate", str(args.auth_failure_rate),
+            "--timeout-rate", str(args.timeout_rate)]
+    if args.connect_latency is not None:
+        argv += ["--connect-latency", str(args.connect_latency)]
+    if args.timeout_delay is not None:
+        argv += ["--timeout-delay", str(args.timeout_delay)]
+    return argv
+
+
+def run_scenario(name, args, directory):
+    """
+    Run one scenario in a child process
+    :return: dict of the measurements
+    """
+    script, sheet = SCENARIOS[name]
+    hosts_path = write_inventory(directory, args.hosts, args.inventory, sheet)
+    cmd_path = directory / "commands.txt"
+    cmd_path.write_text("\n".join(CMDS))
+    script_args = [str(hosts_path), str(cmd_path), "--log-file", str(directory / f"{name}.log")]
+    if args.concurrency:
+        script_args += ["--concurrency", str(args.concurrency)]
+    script_args += args.script_args
+
+    command = [sys.executable, "-m", "benchmarks.fake_netmiko"] + device_args(args) + [script] + script_args
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    sampler = TreeSampler(process.pid)
+    sampler.start()
+    # wait4 reports the CPU time of this child and of the parser processes it waited for,
+    # but ru_maxrss only the peak of the largest of them
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    sampler.stop()
+    process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    largest_rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    return {
+        "scenario": name,
+        "hosts": args.hosts,
+        "mac_entries": args.mac_entries,
+        "latency": args.latency,
+        "inventory": args.inventory,
+        "exit_code": process.returncode,
+        "seconds": elapsed,
+        "user_cpu": usage.ru_utime,
+        "system_cpu": usage.ru_stime,
+        "peak_rss": sampler.peak if sampler.supported else largest_rss,
+        "largest_process_rss": largest_rss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenario", choices=SCENARIOS, nargs="*", default=list(SCENARIOS))
+    parser.add_argument("--hosts", type=int, default=1000)
+    parser.add_argument("--inventory", choices=("txt", "xlsx"), default="xlsx",
+                        help="Hosts file format. xlsx also measures the Excel layer")
+    parser.add_argument("--concurrency", type=int, help="--concurrency for the scripts")
+    parser.add_argument("--results", help="Append each scenario's numbers to this file as JSON lines")
+    parser.add_argument("--max-rss", type=float, help="Exit with status 1 if a scenario's peak RSS exceeds this many MiB")
+    add_device_arguments(parser)
+    parser.add_argument("script_args", nargs=argparse.REMAINDER,
+                        help="Further arguments for the scripts, after --")
+    parser.set_defaults(mac_entries=10_000, arp_entries=10_000)
+    args = parser.parse_args()
+    if args.script_args[:1] == ["--"]:
+        args.script_args = args.script_args[1:]
+
+    exceeded = False
+    print(f"{'scenario':<12} {'hosts':>6} {'exit':>5} {'seconds':>9} {'user':>8} {'system':>8} {'peak MiB':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.scenario:
+            result = run_scenario(name, args, Path(tmp))
+            result["python"] = platform.python_version()
+            print(f"{name:<12} {result['hosts']:>6} {result['exit_code']:>5} {result['seconds']:>9.2f} "
+                  f"{result['user_cpu']:>8.2f} {result['system_cpu']:>8.2f} {result['peak_rss'] / 2 ** 20:>9.1f}"
+                  f"{'  OVER --max-rss' if args.max_rss and result['peak_rss'] > args.max_rss * 2 ** 20 else ''}")
+            exceeded |= bool(args.max_rss) and result["peak_rss"] > args.max_rss * 2 ** 20
+            if args.results:
+                with open(args.results, "a") as file:
+                    file.write(json.dumps(result) + "\n")
+
+    sys.exit(1 if exceeded else 0)
+
+
+if __name__ == '__main__':
+    main()
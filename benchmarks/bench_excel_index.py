@@ -0,0 +1,59 @@
+"""
+Microbenchmark for ExcelProcessor row updates.
+Compares the indexed update (ExcelProcessor.set_value) with the old
+boolean-mask update for sheets of 1k to 100k rows.
+The indexed cost per update should stay flat as the sheet grows.
+
+Run from the repository root:
+    python -m benchmarks.bench_excel_index
+"""
+import time
+import random
+import tempfile
+from pathlib import Path
+import pandas as pd
+from src.excel_processor import ExcelProcessor
+
+SIZES = (1_000, 10_000, 100_000)
+UPDATES = 1_000
+SHEET = "Sheet 1"
+
+
+def build_sheet(path, rows):
+    df = pd.DataFrame({
+        "hostname": [f"sw{i}.example.net" for i in range(rows)],
+        "status": [None] * rows,
+        "ip": [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(rows)],
+    })
+    df.to_excel(path, sheet_name=SHEET, index=False)
+
+
+def time_per_update(func, keys):
+    start = time.perf_counter()
+    for key in keys:
+        func(key)
+    return (time.perf_counter() - start) / len(keys) * 1e6
+
+
+def main():
+    print(f"{'rows':>8} {'indexed us/update':>18} {'mask us/update':>15}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in SIZES:
+            path = Path(tmp) / f"hosts-{rows}.xlsx"
+            build_sheet(path, rows)
+            # flush thresholds high enough that nothing is written during the benchmark
+            excel = ExcelProcessor(path, SHEET, None, None, flush_every=10 ** 9, flush_interval=10 ** 6)
+            keys = random.sample(list(excel.index), UPDATES)
+
+            indexed = time_per_update(lambda key: excel.set_value(key, "status", "success"), keys)
+
+            def mask_update(key):
+                excel.data.loc[excel.data["ip"] == key, "status"] = "failed"
+            mask = time_per_update(mask_update, keys)
+
+            excel.close()
+            print(f"{rows:>8} {indexed:>18.2f} {mask:>15.2f}")
+
+
+if __name__ == '__main__':
+    main()
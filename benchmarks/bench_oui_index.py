@@ -0,0 +1,70 @@
+"""
+Load time and per-lookup cost of the compiled OUI index against the
+dict built by read_and_parse_mac_vendor_file, and of the index behind
+the VendorLookup cache the parsers use.
+
+Run from the repository root:
+    python -m benchmarks.bench_oui_index
+"""
+import time
+import random
+import tempfile
+from pathlib import Path
+from src.cisco_switches import read_and_parse_mac_vendor_file, find_mac_vendor, VendorLookup
+from src.oui_index import build_index, OuiIndex
+
+VENDOR_FILE = Path() / "data_files" / "vendor-mac-data.txt"
+LOOKUPS = 200_000
+LOADS = 20
+# distinct OUIs in a typical fleet's MAC tables, the working set of VendorLookup's cache
+FLEET_OUIS = 200
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def random_macs(ouis):
+    macs = []
+    for _ in range(LOOKUPS):
+        oui = random.choice(ouis) if random.random() < 0.9 else f"{random.getrandbits(24):06X}"
+        mac = f"{oui}{random.getrandbits(24):06x}".lower()
+        macs.append(f"{mac[0:4]}.{mac[4:8]}.{mac[8:12]}")
+    return macs
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        target = Path(tmp) / "vendor-mac-data.idx"
+        build_seconds, _ = timed(lambda: build_index(VENDOR_FILE, target), 1)
+
+        dict_load, vendors = timed(lambda: read_and_parse_mac_vendor_file(VENDOR_FILE), LOADS)
+        index_load, index = timed(lambda: OuiIndex(target), LOADS)
+
+        # mostly known OUIs in Cisco notation, plus 10% unknown
+        known = list(vendors)
+        macs = random_macs(known)
+        fleet_macs = random_macs(random.sample(known, FLEET_OUIS))
+
+        dict_lookup, _ = timed(lambda: [find_mac_vendor(mac, vendors) for mac in macs], 1)
+        index_lookup, _ = timed(lambda: [find_mac_vendor(mac, index) for mac in macs], 1)
+        fleet_dict_lookup, _ = timed(lambda: [find_mac_vendor(mac, vendors) for mac in fleet_macs], 1)
+        fleet_cached_lookup, _ = timed(lambda: VendorLookup(index).lookup_many(fleet_macs), 1)
+
+        mismatches = sum(find_mac_vendor(mac, vendors) != find_mac_vendor(mac, index) for mac in macs[:10_000])
+
+    print(f"index build (once):      {build_seconds * 1e3:8.2f} ms")
+    print(f"load, dict:              {dict_load * 1e3:8.2f} ms")
+    print(f"load, mmap index:        {index_load * 1e3:8.2f} ms")
+    print(f"lookup, dict:            {dict_lookup / LOOKUPS * 1e9:8.0f} ns")
+    print(f"lookup, mmap index:      {index_lookup / LOOKUPS * 1e9:8.0f} ns")
+    print(f"{FLEET_OUIS} OUIs, dict:          {fleet_dict_lookup / LOOKUPS * 1e9:8.0f} ns")
+    print(f"{FLEET_OUIS} OUIs, VendorLookup:  {fleet_cached_lookup / LOOKUPS * 1e9:8.0f} ns")
+    print(f"mismatches in 10k:       {mismatches:8d}")
+
+
+if __name__ == '__main__':
+    main()
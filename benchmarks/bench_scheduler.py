@@ -0,0 +1,83 @@
+"""
+Simulated-latency benchmark for the Scheduler.
+Each fake host takes --latency seconds to process. For increasing
+concurrency the total wall time should drop, while the number of logins
+started in any window never exceeds what --login-rate allows.
+Exits with status 1 if the login rate was ever exceeded.
+
+Run from the repository root:
+    python -m benchmarks.bench_scheduler --hosts 400 --latency 0.5 --login-rate 100
+"""
+import sys
+import time
+import argparse
+import threading
+from src.engines import run_threaded, run_asyncio
+from src.scheduler import Scheduler
+
+CONCURRENCY = (4, 16, 64, 256)
+
+
+def max_in_window(timestamps, window):
+    timestamps = sorted(timestamps)
+    most = 0
+    start = 0
+    for end, stamp in enumerate(timestamps):
+        while stamp - timestamps[start] >= window:
+            start += 1
+        most = max(most, end - start + 1)
+    return most
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engine", choices=("thread", "asyncio"), default="thread")
+    parser.add_argument("--hosts", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.5, help="Simulated seconds per host")
+    parser.add_argument("--login-rate", type=float, default=100.0)
+    parser.add_argument("--login-burst", type=int, default=1)
+    args = parser.parse_args()
+
+    hosts = [{'host': f"10.0.{i >> 8}.{i & 255}"} for i in range(args.hosts)]
+    # logins in any one second may reach the rate plus the burst, the 1% covers timer jitter
+    allowed = int(args.login_rate * 1.01 + args.login_burst)
+    failed = False
+
+    print(f"{'concurrency':>11} {'seconds':>9} {'max logins/s':>13}")
+    for concurrency in CONCURRENCY:
+        logins = []
+        lock = threading.Lock()
+
+        def record():
+            with lock:
+                logins.append(time.monotonic())
+
+        async def record_async():
+            logins.append(time.monotonic())
+
+        def login(host):
+            scheduler.login(record)
+            time.sleep(args.latency)
+
+        async def login_async(host):
+            import asyncio
+            await scheduler.login_async(record_async)
+            await asyncio.sleep(args.latency)
+
+        scheduler = Scheduler(max_concurrency=concurrency, login_rate=args.login_rate, login_burst=args.login_burst)
+        start = time.perf_counter()
+        if args.engine == "asyncio":
+            run_asyncio(login_async, hosts, scheduler=scheduler)
+        else:
+            run_threaded(login, hosts, scheduler=scheduler)
+        elapsed = time.perf_counter() - start
+
+        peak = max_in_window(logins, 1.0)
+        failed |= peak > allowed
+        print(f"{concurrency:>11} {elapsed:>9.2f} {peak:>13}{'  RATE EXCEEDED' if peak > allowed else ''}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Status updates per second on a 10k row inventory, before and after the
+status store.
+
+    before  every batch of 50 updates is set in the sheet and the whole
+            workbook rewritten, as ExcelProcessor did before the store
+    after   updates go through ExcelProcessor to the status store and the
+            workbook is written once, on close()
+
+Rewriting a 10k row workbook takes about a second, so the before case only
+makes --before-updates updates. Run from the repository root:
+    python -m benchmarks.bench_status_store
+    python -m benchmarks.bench_status_store --rows 100000 --before-updates 200
+"""
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+from benchmarks.bench_excel_index import build_sheet, SHEET
+from src.excel_processor import ExcelProcessor
+
+FLUSH_EVERY = 50
+
+
+def keys_for(rows, count):
+    return [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in random.sample(range(rows), count)]
+
+
+def before(path, keys):
+    """
+    The workbook round trip per batch, with the store only holding the hosts
+    :return: seconds
+    """
+    excel = ExcelProcessor(path, SHEET, None, None, flush_every=10 ** 9, flush_interval=10 ** 6)
+    start = time.perf_counter()
+    for first in range(0, len(keys), FLUSH_EVERY):
+        for key in keys[first:first + FLUSH_EVERY]:
+            excel.set_value(key, "status", "success")
+        excel.write_to_file()
+    elapsed = time.perf_counter() - start
+    excel.close()
+    return elapsed
+
+
+def after(path, keys):
+    """
+    Updates queued to the writer thread, the store, and the one export on close()
+    :return: seconds
+    """
+    excel = ExcelProcessor(path, SHEET, None, None, flush_every=FLUSH_EVERY)
+    start = time.perf_counter()
+    for key in keys:
+        excel.update_process_column(key, True)
+    excel.close()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000, help="Inventory rows, every row is updated after")
+    parser.add_argument("--before-updates", type=int, default=500, help="Updates made in the before case")
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'case':>7} {'updates':>8} {'seconds':>9} {'updates/s':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "hosts.xlsx"
+        for case, run, count in (("before", before, min(args.before_updates, args.rows)),
+                                 ("after", after, args.rows)):
+            build_sheet(path, args.rows)
+            seconds = run(path, keys_for(args.rows, count))
+            print(f"{args.rows:>8} {case:>7} {count:>8} {seconds:>9.2f} {count / seconds:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
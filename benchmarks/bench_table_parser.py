@@ -0,0 +1,62 @@
+"""
+Parse 100k line 'show mac address-table' and 'show ip arp' outputs with
+the original multi-pass chain (line_parser, sort_by_mac, ...,
+sort_and_order_data) and with the single pass table_parser.scan_device.
+Reports time and peak traced memory for each.
+
+Run from the repository root:
+    python -m benchmarks.bench_table_parser
+"""
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+import src.cisco_switches as sw
+from src.oui_index import load_oui_index
+from src.table_parser import scan_device
+from benchmarks.synthetic_output import mac_table, arp_table
+
+ENTRIES = 100_000
+VENDOR_FILE = Path() / "data_files" / "vendor-mac-data.txt"
+
+
+def multi_pass(mac_output, arp_output, vendors):
+    data = sw.line_parser(mac_output)
+    mac_addresses = sw.sort_by_mac(data)
+    port_count = sw.count_mac_address_by_port(data)
+    ordered_ports = Counter(port_count).most_common()
+    data = sw.line_parser(arp_output, search_term="Internet")
+    ip_information = sw.parse_mac_and_arp_data(data)
+    host_data = sw.map_hosts_to_ip(mac_addresses, ip_information, vendors)
+    return sw.sort_and_order_data(ordered_ports, host_data)
+
+
+def measure(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    # separate run for memory, tracing slows everything down
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    vendors = load_oui_index(VENDOR_FILE)
+    mac_output = mac_table(ENTRIES)
+    arp_output = arp_table(ENTRIES)
+
+    old, old_seconds, old_peak = measure(multi_pass, mac_output, arp_output, vendors)
+    new, new_seconds, new_peak = measure(scan_device, mac_output, arp_output, vendors)
+
+    same = {port: len(hosts) for port, hosts in old.items()} == {port: len(hosts) for port, hosts in new.items()}
+    print(f"{ENTRIES} MAC and ARP entries")
+    print(f"multi pass:   {old_seconds:6.2f} s  peak {old_peak / 2 ** 20:7.1f} MiB")
+    print(f"single pass:  {new_seconds:6.2f} s  peak {new_peak / 2 ** 20:7.1f} MiB")
+    print(f"same ports and counts: {same}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+A local stand-in for a farm of Cisco IOS switches, served over real SSH.
+Every connection gets its own IOS like shell with exec and config modes,
+'terminal', 'show run | i hostname', 'show mac address-table',
+'show ip arp' and 'write memory'. Any password is accepted except 'bad'.
+
+Run from the repository root:
+    python -m benchmarks.fake_ios_server --port 8022 --latency 0.05
+"""
+import sys
+import asyncio
+import argparse
+import resource
+import itertools
+from benchmarks.synthetic_output import mac_table, arp_table
+
+try:
+    import asyncssh
+except ImportError:
+    raise ImportError('asyncssh package must be installed to run the fake IOS server. `pip install asyncssh`')
+
+BAD_PASSWORD = "bad"
+_session_ids = itertools.count(1)
+
+
+def raise_fd_limit():
+    # thousands of simulated devices need thousands of sockets
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+class FakeIOSServer(asyncssh.SSHServer):
+
+    def begin_auth(self, username):
+        return True
+
+    def password_auth_supported(self):
+        return True
+
+    def validate_password(self, username, password):
+        return password != BAD_PASSWORD
+
+
+class FakeIOSShell:
+    """
+    One simulated device. Responds to each line with some output and a prompt
+    """
+
+    def __init__(self, hostname, mac_entries=100, arp_entries=100, latency=0.0):
+        self.hostname = hostname
+        self.mac_entries = mac_entries
+        self.arp_entries = arp_entries
+        self.latency = latency
+        self.mode = ""
+
+    @property
+    def prompt(self):
+        return f"{self.hostname}{self.mode}#"
+
+    def respond(self, command):
+        if not command or command.startswith("terminal"):
+            return ""
+        if command in ("configure terminal", "conf t"):
+            self.mode = "(config)"
+            return "Enter configuration commands, one per line.  End with CNTL/Z."
+        if command == "end":
+            self.mode = ""
+            return ""
+        if command == "exit":
+            self.mode = "(config)" if self.mode not in ("", "(config)") else ""
+            return ""
+        if command in ("write memory", "wr", "copy running-config startup-config"):
+            return "Building configuration...\r\n[OK]"
+        if command.startswith("do "):
+            return self.respond(command[3:])
+        if command.startswith("show run | i hostname"):
+            return f"hostname {self.hostname}"
+        if command.startswith("show mac address-table"):
+            return mac_table(self.mac_entries)
+        if command.startswith("show ip arp"):
+            return arp_table(self.arp_entries)
+        if self.mode:
+            if command.startswith("int"):
+                self.mode = "(config-if)"
+            return ""
+        return "                    ^\r\n% Invalid input detected at '^' marker."
+
+    async def run(self, process):
+        process.stdout.write(f"\r\n{self.prompt}")
+        while True:
+            try:
+                line = await process.stdin.readline()
+            except (asyncssh.BreakReceived, asyncssh.SignalReceived, asyncssh.TerminalSizeChanged):
+                continue
+            except asyncssh.Error:
+                break
+            if not line:
+                break
+            output = self.respond(line.strip())
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            process.stdout.write(f"{output}\r\n{self.prompt}" if output else f"\r\n{self.prompt}")
+        process.exit(0)
+
+
+async def start_server(host="127.0.0.1", port=8022, mac_entries=100, arp_entries=100, latency=0.0):
+    key = asyncssh.generate_private_key("ssh-ed25519")
+
+    async def handle(process):
+        shell = FakeIOSShell(f"sw{next(_session_ids)}", mac_entries, arp_entries, latency)
+        await shell.run(process)
+
+    return await asyncssh.listen(host, port, server_host_keys=[key], server_factory=FakeIOSServer,
+                                 process_factory=handle, backlog=8192)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8022, help="Port to listen on")
+    parser.add_argument("--mac-entries", type=int, default=100, help="Entries in 'show mac address-table'")
+    parser.add_argument("--arp-entries", type=int, default=100, help="Entries in 'show ip arp'")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every command")
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(start_server(args.host, args.port, args.mac_entries, args.arp_entries, args.latency))
+    print(f"Fake IOS devices listening on {args.host}:{args.port}", file=sys.stderr, flush=True)
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""
+An in-process stand-in for netmiko's ConnectHandler, for benchmarking the
+scripts without switches or sockets. Each fake session answers the MAC,
+ARP and hostname show commands, config sets and 'write memory' after a
+configurable latency. A configurable share of hosts fail to log in or
+time out; which hosts fail depends only on the host address, so every
+run fails the same hosts.
+
+run_script() runs command_sender.py or switch_finder.py with every
+session opened through the fake. Run from the repository root:
+    python -m benchmarks.fake_netmiko --latency 0.01 --mac-entries 10000 \\
+        switch_finder.py hosts.txt commands.txt
+"""
+import sys
+import time
+import zlib
+import runpy
+import argparse
+from functools import lru_cache
+from benchmarks.synthetic_output import mac_table, arp_table
+
+try:
+    from netmiko.ssh_exception import NetmikoAuthenticationException, NetmikoTimeoutException
+except ImportError:
+    raise ImportError('Netmiko package must be installed. `pip install netmiko`')
+
+
+# the output is the same for every device of a size, build it once
+mac_output = lru_cache(maxsize=None)(mac_table)
+arp_output = lru_cache(maxsize=None)(arp_table)
+
+
+def host_fraction(address, salt):
+    # stable value in [0, 1) per host, so the failing hosts are the same in every run
+    return zlib.crc32(f"{salt}:{address}".encode()) / 2 ** 32
+
+
+class FakeDevices:
+    """
+    How the simulated devices behave
+    """
+
+    def __init__(self, latency=0.0, connect_latency=None, mac_entries=100, arp_entries=100,
+                 auth_failure_rate=0.0, timeout_rate=0.0, timeout_delay=None):
+        """
+        :param latency: seconds added to every command
+        :param connect_latency: seconds a login takes. Default is the command latency
+        :param mac_entries: entries in 'show mac address-table'
+        :param arp_entries: entries in 'show ip arp'
+        :param auth_failure_rate: share of hosts rejecting the login, 0 to 1
+        :param timeout_rate: share of hosts that never answer the connect, 0 to 1
+        :param timeout_delay: seconds before a connect times out. Default is the host's conn_timeout
+        """
+        self.latency = latency
+        self.connect_latency = latency if connect_latency is None else connect_latency
+        self.mac_entries = mac_entries
+        self.arp_entries = arp_entries
+        self.auth_failure_rate = auth_failure_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_delay = timeout_delay
+
+    def connect(self, host, timings=None):
+        """
+        Drop-in replacement for src.sessions.netmiko_connect
+        """
+        address = host["host"]
+        if host_fraction(address, "timeout") < self.timeout_rate:
+            delay = self.timeout_delay if self.timeout_delay is not None else host.get("conn_timeout") or 5
+            time.sleep(delay)
+            raise NetmikoTimeoutException(f"TCP connection to device failed: {address}")
+        if timings is not None:
+            with timings.phase("ssh_login", address):
+                time.sleep(self.connect_latency)
+        else:
+            time.sleep(self.connect_latency)
+        if host_fraction(address, "auth") < self.auth_failure_rate:
+            raise NetmikoAuthenticationException(f"Authentication to device failed: {address}")
+        return FakeConnection(self, address)
+
+
+class FakeConnection:
+    """
+    The part of netmiko's BaseConnection the scripts use
+    """
+
+    def __init__(self, devices, address):
+        self.devices = devices
+        self.hostname = f"sw-{address.replace('.', '-')}"
+        self.connected = True
+        # a copy waiting for its destination file name to be confirmed
+        self.copying = False
+
+    def _respond(self, command):
+        time.sleep(self.devices.latency)
+        if command.startswith("show run | i hostname"):
+            return f"hostname {self.hostname}"
+        # a fresh copy of the table per command, as a real session reads it off the wire,
+        # so memory measurements see one string per output
+        if command.startswith("show mac address-table"):
+            return (mac_output(self.devices.mac_entries) + "\n")[:-1]
+        if command.startswith("show ip arp"):
+            return (arp_output(self.devices.arp_entries) + "\n")[:-1]
+        # --rollback checkpoints and restores
+        if command.startswith("copy running-config"):
+            self.copying = True
+            return f"Destination filename [{command.rpartition(':')[2]}]? "
+        if self.copying and command == "\n":
+            self.copying = False
+            return "4096 bytes copied in 0.120 secs (34133 bytes/sec)"
+        if command.startswith("configure replace"):
+            return "Total number of passes: 1\nRollback Done"
+        return ""
+
+    def send_command(self, command, **kwargs):
+        return self._respond(command)
+
+    def send_command_timing(self, command, **kwargs):
+        return self._respond(command)
+
+    def send_config_set(self, config_commands, cmd_verify=True, **kwargs):
+        # one round trip per line, as netmiko waits for the prompt after each,
+        # or one for the whole set without cmd_verify
+        output = [f"{self.hostname}#configure terminal"]
+        for command in config_commands:
+            output.append(f"{self.hostname}(config)#{command}")
+            output.append(self._respond(command) if cmd_verify else "")
+        if not cmd_verify:
+            time.sleep(self.devices.latency)
+        output.append(f"{self.hostname}(config)#end")
+        return "\n".join(output)
+
+    def save_config(self, *args, **kwargs):
+        time.sleep(self.devices.latency)
+        return f"write mem\nBuilding configuration...\n[OK]\n{self.hostname}#"
+
+    def is_alive(self):
+        return self.connected
+
+    def disconnect(self):
+        self.connected = False
+
+
+def run_script(script, argv, devices):
+    """
+    Run script as __main__ with sys.argv set to argv, every session opened through devices
+    """
+    import src.sessions
+    # the scripts import netmiko_connect from src.sessions, so patch it before they run
+    src.sessions.netmiko_connect = devices.connect
+    sys.argv = [script] + list(argv)
+    runpy.run_path(script, run_name="__main__")
+
+
+def add_device_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every command")
+    parser.add_argument("--connect-latency", type=float, help="Seconds a login takes. Default is --latency")
+    parser.add_argument("--mac-entries", type=int, default=100, help="Entries in 'show mac address-table'")
+    parser.add_argument("--arp-entries", type=int, default=100, help="Entries in 'show ip arp'")
+    parser.add_argument("--auth-failure-rate", type=float, default=0.0, help="Share of hosts rejecting the login")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Share of hosts timing out on connect")
+    parser.add_argument("--timeout-delay", type=float, help="Seconds before a connect times out. "
+                                                            "Default is the host's conn_timeout")
+
+
+def devices_from_args(args):
+    return FakeDevices(latency=args.latency, connect_latency=args.connect_latency,
+                       mac_entries=args.mac_entries, arp_entries=args.arp_entries,
+                       auth_failure_rate=args.auth_failure_rate, timeout_rate=args.timeout_rate,
+                       timeout_delay=args.timeout_delay)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_device_arguments(parser)
+    parser.add_argument("script", help="command_sender.py or switch_finder.py")
+    parser.add_argument("script_args", nargs=argparse.REMAINDER, help="Arguments for the script")
+    args = parser.parse_args()
+    run_script(args.script, args.script_args, devices_from_args(args))
+
+
+if __name__ == '__main__':
+    main()
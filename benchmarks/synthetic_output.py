@@ -0,0 +1,33 @@
+"""
+Synthetic Cisco IOS command output for benchmarks
+"""
+
+
+def mac_address(i):
+    i &= 0xFFFFFFFFFFFF
+    return f"{i >> 32 & 0xFFFF:04x}.{i >> 16 & 0xFFFF:04x}.{i & 0xFFFF:04x}"
+
+
+def mac_table(entries, vlan=60, ports=48):
+    """
+    'show mac address-table' output in IOS layout with the given number of dynamic entries
+    """
+    lines = [
+        "          Mac Address Table",
+        "-------------------------------------------",
+        "",
+        "Vlan    Mac Address       Type        Ports",
+        "----    -----------       --------    -----",
+    ]
+    for i in range(entries):
+        lines.append(f"  {vlan:<4}  {mac_address(0x00505600_0000 + i)}    DYNAMIC     Gi1/0/{i % ports + 1}")
+    lines.append(f"Total Mac Addresses for this criterion: {entries}")
+    return "\r\n".join(lines)
+
+
+def arp_table(entries, vlan=60):
+    lines = ["Protocol  Address          Age (min)  Hardware Addr   Type   Interface"]
+    for i in range(entries):
+        ip = f"10.{vlan}.{i >> 8 & 255}.{i & 255}"
+        lines.append(f"Internet  {ip:<15}  {i % 240:>9}   {mac_address(0x00505600_0000 + i)}  ARPA   Vlan{vlan}")
+    return "\r\n".join(lines)
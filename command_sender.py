@@ -1,16 +1,31 @@
-import sys
+import re
+import os
+import time
 import logging
 import argparse
-import concurrent.futures
+import itertools
 from pathlib import Path
-from netmiko import ConnectHandler
-from netmiko.ssh_exception import NetmikoAuthenticationException, NetmikoTimeoutException
-from src.cisco_switches import parse_commands_file, check_string_not_present
-from src.excel_processor import ExcelProcessor
+from src.inventory import open_inventory, is_spreadsheet
+from src.results_writer import NullResults
+from src.engines import ENGINES, run_threaded, run_asyncio
+from src.scheduler import add_scheduler_arguments, scheduler_from_args
+from src.retry import RetryPolicy
+from src.journal import Journal, STARTED, SUCCESS, FAILED
+from src.sharding import parse_shard, in_shard, partial_path, PartialResults
+from src.sessions import SessionPool, netmiko_connect, netmiko_exceptions
+from src.timing import Timings
+from src.logging_setup import setup_logging, LogBlock
+from src.verification import Verifier, Rule, FORBID, parse_command_set, ios_error_rules
 
 # from datetime import datetime
 # startTime = datetime.now()
 
+PUSH_MODES = ("line", "block")
+
+# the running config is copied here before a push when --rollback is given. One file per run,
+# so a failed copy can never leave a checkpoint of an earlier run to be restored
+ROLLBACK_CHECKPOINT = f"flash:command-sender-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.cfg"
+
 # Parse the args
 parser = argparse.ArgumentParser()
 parser.add_argument("hosts_file", help="The hosts file containing switch IP/DNS entry")
@@ -19,6 +34,27 @@ parser.add_argument("--sheet", help="The Excel sheet name to be processed. Defau
 parser.add_argument("--username", help="Username for switch login")
 parser.add_argument("--password", help="Password for switch login")
 parser.add_argument("--log-file", help="Log file")
+parser.add_argument("--log-json", action="store_true", help="Write the log file as JSON lines")
+parser.add_argument("--trace", help="Write the timing of every phase of every host to this file "
+                                    "as a Chrome trace (chrome://tracing)")
+parser.add_argument("--engine", choices=ENGINES, help="thread (netmiko, default) or asyncio (asyncssh)")
+parser.add_argument("--push-mode", choices=PUSH_MODES, help="line (default) waits for each command to be accepted, "
+                                                            "block sends the config set at once and checks the "
+                                                            "output for IOS errors afterwards")
+parser.add_argument("--save-batch", help="Push to this many switches, then save all their configurations, "
+                                         "instead of saving each switch straight after its push")
+parser.add_argument("--rollback", action="store_true",
+                    help="Checkpoint the running config before the push and restore it if the output fails "
+                         "verification. Needs IOS 'configure replace'")
+add_scheduler_arguments(parser)
+parser.add_argument("--retries", help="Retries for a switch that times out on connect. Default is 0")
+parser.add_argument("--retry-delay", help="Base seconds of the exponential backoff between retries. Default is 2")
+parser.add_argument("--journal", help="Append-only file recording each switch's progress. "
+                                      "Switches recorded as successful are skipped on the next run")
+parser.add_argument("--shard", help="Process only shard i of N of the hosts, e.g. 2/4, so N runs split the "
+                                    "inventory. Results go to a partial file merged with python -m src.sharding")
+parser.add_argument("--flush-every", help="Write results to the status store after this many updates. Default is 50")
+parser.add_argument("--flush-interval", help="Write results to the status store at least every N seconds. Default is 5")
 args = parser.parse_args()
 
 if not args.hosts_file or not args.cmd_file:
@@ -27,122 +63,346 @@ if not args.hosts_file or not args.cmd_file:
 
 username = args.username if args.username else None
 password = args.password if args.password else None
+scheduler = scheduler_from_args(args)
+retry_policy = RetryPolicy(attempts=int(args.retries) + 1 if args.retries else 1,
+                           base_delay=float(args.retry_delay) if args.retry_delay else 2.0)
+journal = Journal(args.journal)
+try:
+    shard = parse_shard(args.shard) if args.shard else None
+except ValueError as e:
+    print(e)
+    exit(1)
+timings = Timings()
+trace_file = args.trace if args.trace else None
+flush_every = int(args.flush_every) if args.flush_every else 50
+flush_interval = float(args.flush_interval) if args.flush_interval else 5.0
+engine = args.engine if args.engine else "thread"
+push_mode = args.push_mode if args.push_mode else "line"
+save_batch = int(args.save_batch) if args.save_batch else None
+rollback = args.rollback
+if engine == "asyncio" and (save_batch or rollback):
+    print("--save-batch and --rollback need the thread engine")
+    exit(1)
+# sessions are opened through open_connection and all disconnected when main() finishes.
+# A batch keeps every session open until its save
+sessions = SessionPool(connect=lambda host: open_connection(host), max_idle=max(save_batch or 0, 100))
 sheet = args.sheet if args.sheet else "Sheet 1"
 print(f"Using default sheet name: {sheet}")
 
-# Build the logger
+# Build the logger. One listener thread writes the log for every module
 log_file = args.log_file if args.log_file else 'results.log'
-file_handler = logging.FileHandler(log_file)
-stream_handler = logging.StreamHandler(sys.stdout)
-file_handler.setLevel(logging.DEBUG)
-stream_handler.setLevel(logging.ERROR)
-# formatting for loggers
-file_handler_format = logging.Formatter('%(levelname)s - %(asctime)s - %(message)s')
-stream_handler_format = logging.Formatter('%(levelname)s - %(asctime)s - %(message)s')
-file_handler.setFormatter(file_handler_format)
-stream_handler.setFormatter(stream_handler_format)
-
+setup_logging(log_file, stream_level=logging.ERROR, json_lines=args.log_json)
 logger = logging.getLogger(__name__)
-logger.addHandler(file_handler)
-logger.addHandler(stream_handler)
-logger.setLevel(logging.DEBUG)
 
 
 # the files
 hosts_path = Path() / args.hosts_file
 cmd_path = Path() / args.cmd_file
 
-# what we are checking for
-# effectively we want to confirm wether some string in present in another string
-# for example, by looking at the output of 'show spanning-tree summary'
-# we want to confirm whether 'Loopguard Default' is enabled or disabled.
-config_to_check = "Loopguard Default"
-confirmation_string = "is disabled"
-check_does_not_contain = "Loop guard"
+# what we are checking for, when the commands file has no '! expect:' or '! forbid:' lines
+# of its own. See src.verification. For example, to confirm from the output of
+# 'show spanning-tree summary' that 'Loopguard Default' is disabled:
+#   Rule(EXPECT, r"Loopguard Default\s+is disabled", regex=True)
+default_rules = [Rule(FORBID, "Loop guard")]
 
 
 def main():
     # open and read files, and handle errors if necessary
     try:
-        excel = ExcelProcessor(hosts_path, sheet, username, password, ignore_status=False)
-        hosts = excel.run_sheet_read()
+        # hosts are yielded while the inventory is still being read
+        hosts = open_inventory(hosts_path, sheet, username, password, ignore_status=False)
     except (FileExistsError, FileNotFoundError):
         logger.error(f"Hosts file {hosts_path.name} not found or failed to open")
         return
 
-    # this is for reading from a text file containing hosts
-    # try:
-    #     with hosts_path.open() as file:
-    #         hosts = parse_hosts_file(file, username, password)
-    # except (FileExistsError, FileNotFoundError):
-    #     logger.error(f"Hosts file {hosts_path.name} not found or failed to open")
-    #     exit(1)
+    # resume: skip anything a previous run already completed, without touching the sheet
+    completed = journal.completed()
+    if completed:
+        logger.debug(f"Skipping {len(completed)} hosts already completed in {journal.path}")
+        hosts = (host for host in hosts if host["host"] not in completed)
+
+    if shard:
+        hosts = in_shard(hosts, *shard)
+
+    if is_spreadsheet(hosts_path) and shard:
+        # shards never write the workbook, each appends to its own file for merging afterwards
+        excel = PartialResults(partial_path(hosts_path, *shard))
+    elif is_spreadsheet(hosts_path):
+        # pandas is only imported for workbooks, text and CSV inventories start faster without it
+        from src.excel_processor import ExcelProcessor
+        excel = ExcelProcessor(hosts_path, sheet, username, password, ignore_status=False,
+                               flush_every=flush_every, flush_interval=flush_interval, stream=True,
+                               timings=timings)
+    else:
+        excel = NullResults()
 
     try:
         with cmd_path.open() as file:
-            cmds = parse_commands_file(file)
+            cmds, rules = parse_command_set(file)
     except (FileExistsError, FileNotFoundError):
         logger.error(f"Commands file {cmd_path.name} not found or failed to open")
         exit(1)
 
-    # Here we are using threading, as we are I/O bound.
-    # Netmiko and Paramiko are blocking, so asyncio not possible
-    # On an asyncio note, asyncssh package looks interesting
+    if push_mode == "block":
+        # commands aren't checked as they are sent, the output has to show they were all accepted
+        rules = (rules or default_rules) + ios_error_rules()
+    try:
+        verifier = Verifier(rules or default_rules)
+    except re.error as e:
+        logger.error(f"Invalid pattern in commands file {cmd_path.name}: {e}")
+        exit(1)
+
+    # We are I/O bound. The thread engine runs blocking Netmiko/Paramiko sessions
+    # on a thread pool, the asyncio engine runs asyncssh sessions on one event loop
     # loop over all hosts and execute necessary commands
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        for host in hosts:
-            # run_ssh_connection(host, cmds, excel)
-            executor.submit(run_ssh_connection, host, cmds, excel)
+    try:
+        if engine == "asyncio":
+            run_asyncio(run_async_connection, hosts, cmds, excel, verifier, scheduler=scheduler)
+        else:
+            # fail now, not once per host, if netmiko is missing
+            netmiko_exceptions()
+            if save_batch:
+                for batch in batches(hosts, save_batch):
+                    # pushed switches wait here for the save at the end of the batch
+                    unsaved = {}
+                    run_threaded(run_ssh_connection, batch, cmds, excel, verifier, unsaved, scheduler=scheduler)
+                    # the saves reuse the pooled sessions of the push, only a reconnect takes a login token
+                    run_threaded(save_connection, [host for host, _ in unsaved.values()], unsaved, excel,
+                                 scheduler=scheduler)
+            else:
+                run_threaded(run_ssh_connection, hosts, cmds, excel, verifier, scheduler=scheduler)
+    finally:
+        # flush outstanding results and save excel file to disk
+        sessions.close_all()
+        logger.debug(f"Session pool: {sessions.stats()}")
+        excel.close()
+        journal.close()
 
-    # save excel file to disk
-    excel.append_df_to_excel(truncate_sheet=True, index=False, startrow=0)
+    report_timings()
 
-    # print script execution duration
-    # print(datetime.now() - startTime)
 
+def batches(hosts, size):
+    hosts = iter(hosts)
+    while True:
+        batch = list(itertools.islice(hosts, size))
+        if not batch:
+            return
+        yield batch
 
-def run_ssh_connection(host, cmds, excel: ExcelProcessor):
+
+def run_ssh_connection(host, cmds, excel, verifier, unsaved=None):
     """
     Connect to the host and execute the list of commands
     Log results
     :param host: DNS or IP address of a host
     :param cmds: A list where each element represents a command to run on the device
     :param excel: the instance of the excel reader parsing the excel hosts file
+    :param verifier: src.verification.Verifier checking the output
+    :param unsaved: Dict to leave the host and its verification in, keeping the session open,
+                    when the save happens at the end of the batch. None saves straight away
     :return: None
     """
+    NetmikoAuthenticationException, NetmikoTimeoutException = netmiko_exceptions()
+    journal.record(host["host"], STARTED)
+    verification = verifier.stream()
     try:
-        connection = ConnectHandler(**host)
-        output = connection.send_config_set(cmds)
-        output += connection.save_config()
-
-        # check output record result
-        if check_string_not_present(output, check_does_not_contain):
-            excel.update_process_column(host["host"], True)
-            logger.debug(f"Successfully processed {host['host']}")
-            print(f"Successfully processed {host['host']}")
-        else:
-            excel.update_process_column(host["host"], False)
-            logger.debug(f"Failed to  process {host['host']}")
-            print(f"Failed to  process {host['host']}")
+        # nothing else runs on this device, disconnect as soon as we are done unless the save is still to come
+        with sessions.session(host, keep=unsaved is not None) as connection:
+            if rollback:
+                with timings.phase("checkpoint", host["host"]):
+                    copied, output = checkpoint(connection)
+                if not copied:
+                    # without a checkpoint there is nothing to roll back to, don't touch the config
+                    logger.error(f"Failed to checkpoint the configuration of {host['host']}, not pushing: {output!r}")
+                    set_status(host["host"], False, excel)
+                    return None
+            try:
+                output = push_config(connection, cmds, host)
+                # don't save a config whose output already failed verification
+                if verification.feed(output):
+                    if rollback:
+                        with timings.phase("rollback", host["host"]):
+                            restored, replaced = restore_checkpoint(connection)
+                        output += replaced
+                        if restored:
+                            logger.error(f"Rolled back the configuration of {host['host']}")
+                        else:
+                            logger.error(f"Failed to roll back the configuration of {host['host']}: {replaced!r}")
+                elif unsaved is not None:
+                    unsaved[host["host"]] = (host, verification)
+                    return output
+                else:
+                    with timings.phase("save_config", host["host"]):
+                        saved = connection.save_config()
+                    verification.feed(saved)
+                    output += saved
+            finally:
+                if rollback:
+                    delete_checkpoint(connection)
+
+        record_result(host, verification.close(), excel)
+
+    except NetmikoAuthenticationException:
+        logger.error(f"Auth error exception as {host['host']}")
+        set_status(host["host"], False, excel)
+        return None
+    except NetmikoTimeoutException:
+        logger.error(f"Timeout error exception {host['host']}")
+        set_status(host["host"], False, excel)
+        return None
+
+    return output
 
+
+def save_connection(host, unsaved, excel):
+    """
+    Save the configuration pushed by run_ssh_connection earlier in the batch, over the same session
+    Log results
+    :param unsaved: Dict of host IP -> (host, verification) filled by run_ssh_connection
+    """
+    NetmikoAuthenticationException, NetmikoTimeoutException = netmiko_exceptions()
+    _, verification = unsaved[host["host"]]
+    try:
+        with sessions.session(host, keep=False) as connection:
+            with timings.phase("save_config", host["host"]):
+                saved = connection.save_config()
     except NetmikoAuthenticationException:
         logger.error(f"Auth error exception as {host['host']}")
-        excel.update_process_column(host["host"], False)
+        set_status(host["host"], False, excel)
         return None
     except NetmikoTimeoutException:
         logger.error(f"Timeout error exception {host['host']}")
-        excel.update_process_column(host["host"], False)
+        set_status(host["host"], False, excel)
+        return None
+
+    verification.feed(saved)
+    record_result(host, verification.close(), excel)
+    return saved
+
+
+def push_config(connection, cmds, host):
+    if push_mode == "block":
+        # every line is written without waiting for it to be accepted, the output is read once at the end
+        with timings.phase("send_config_block", host["host"]):
+            return connection.send_config_set(cmds, cmd_verify=False)
+    with timings.phase("send_config_set", host["host"]):
+        return connection.send_config_set(cmds)
+
+
+def checkpoint(connection):
+    """
+    Copy the running config to ROLLBACK_CHECKPOINT
+    :return: (True if the copy completed, output)
+    """
+    output = connection.send_command_timing(f"copy running-config {ROLLBACK_CHECKPOINT}")
+    # copy asks to confirm the destination file name, then whether to overwrite an existing file
+    if "Destination filename" in output:
+        output += connection.send_command_timing("\n")
+    if "[confirm]" in output:
+        output += connection.send_command_timing("\n")
+    return "bytes copied" in output, output
+
+
+def restore_checkpoint(connection):
+    """
+    Replace the running config with ROLLBACK_CHECKPOINT
+    :return: (True if IOS reported the rollback done, output)
+    """
+    # configure replace can take a while on a large config
+    output = connection.send_command_timing(f"configure replace {ROLLBACK_CHECKPOINT} force", delay_factor=4)
+    return "Rollback Done" in output and "Rollback aborted" not in output, output
+
+
+def delete_checkpoint(connection):
+    try:
+        connection.send_command_timing(f"delete /force {ROLLBACK_CHECKPOINT}")
+    except Exception as e:
+        logger.debug(f"Failed to delete {ROLLBACK_CHECKPOINT}: {e!r}")
+
+
+def open_connection(host):
+    # connect, retrying timeouts as configured. Every attempt waits for a login token
+    _, NetmikoTimeoutException = netmiko_exceptions()
+    return retry_policy.call(lambda: scheduler.login(netmiko_connect, host, timings), NetmikoTimeoutException,
+                             host["host"], on_retry=journal.retry_recorder(host["host"]))
+
+
+async def run_async_connection(host, cmds, excel, verifier):
+    """
+    asyncio engine version of run_ssh_connection, with the same semantics.
+    Output is verified after every command, the rest of the commands
+    are skipped as soon as a forbidden pattern shows up
+    :param host: netmiko style host dict
+    :param cmds: A list where each element represents a command to run on the device
+    :param excel: the instance of the excel reader parsing the excel hosts file
+    :param verifier: src.verification.Verifier checking the output
+    :return: None
+    """
+    # asyncssh is optional, only the asyncio engine needs it
+    from src.async_ios import AsyncIOSConnection, AsyncAuthenticationError, AsyncTimeoutError
+
+    connection = AsyncIOSConnection(**host)
+    journal.record(host["host"], STARTED)
+    verification = verifier.stream()
+    try:
+        with timings.phase("connect", host["host"]):
+            # every attempt waits for a login token
+            await retry_policy.call_async(lambda: scheduler.login_async(connection.connect), AsyncTimeoutError,
+                                          host["host"], on_retry=journal.retry_recorder(host["host"]))
+        if push_mode == "block":
+            with timings.phase("send_config_block", host["host"]):
+                output = await connection.send_config_block(cmds)
+            verification.feed(output)
+        else:
+            with timings.phase("send_config_set", host["host"]):
+                output = await connection.send_config_set(cmds, stop=verification.feed)
+        if not verification.failed:
+            with timings.phase("save_config", host["host"]):
+                saved = await connection.save_config()
+            verification.feed(saved)
+            output += saved
+    except AsyncAuthenticationError:
+        logger.error(f"Auth error exception as {host['host']}")
+        set_status(host["host"], False, excel)
+        return None
+    except AsyncTimeoutError:
+        logger.error(f"Timeout error exception {host['host']}")
+        set_status(host["host"], False, excel)
         return None
+    finally:
+        await connection.disconnect()
 
+    record_result(host, verification.close(), excel)
     return output
 
-    # # determine whether the results are as expected, and log
-    # if validate(output, config_to_check, confirmation_string):
-    #     logger.debug(f"{host['host']} configured successfully")
-    # else:
-    #     logger.debug(
-    #         f"{host['host']} loopguard either still enabled or loopguard not observed in spanning tree output"
-    #     )
+
+def record_result(host, verdict, excel):
+    # record the src.verification.Verdict of the host's output
+    if verdict.passed:
+        set_status(host["host"], True, excel)
+        logger.debug(f"Successfully processed {host['host']}")
+        print(f"Successfully processed {host['host']}")
+    else:
+        set_status(host["host"], False, excel)
+        logger.debug(f"Failed to  process {host['host']}: {', '.join(verdict.reasons())}")
+        print(f"Failed to  process {host['host']}")
+
+
+def report_timings():
+    # p50/p95/p99 per phase, the slowest hosts and hosts/sec
+    with LogBlock(logger) as block:
+        for line in timings.summary():
+            print(line)
+            block.debug(line)
+    if trace_file:
+        timings.write_chrome_trace(trace_file)
+        logger.debug(f"Wrote timing trace to {trace_file}")
+
+
+def set_status(ip, result, excel):
+    # record the outcome in the sheet and the journal
+    excel.update_process_column(ip, result)
+    journal.record(ip, SUCCESS if result else FAILED)
 
 
 if __name__ == '__main__':
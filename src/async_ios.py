@@ -0,0 +1,171 @@
+import re
+import asyncio
+import logging
+
+try:
+    import asyncssh
+except ImportError:
+    raise ImportError('asyncssh package must be installed to use the asyncio engine. `pip install asyncssh`')
+
+logger = logging.getLogger(__name__)
+
+# any IOS style prompt at the end of the buffer, e.g. 'switch>', 'switch#' or 'switch(config-if)#'
+ANY_PROMPT = re.compile(r"[\w.\-@/:]+(\([^)]*\))?[>#]\s*$")
+# a prompt starting a line anywhere in the output, each command sent is echoed after one
+LINE_PROMPT = re.compile(r"^[\w.\-@/:]+(\([^)]*\))?[>#]", re.MULTILINE)
+
+
+class AsyncAuthenticationError(Exception):
+    pass
+
+
+class AsyncTimeoutError(Exception):
+    pass
+
+
+class AsyncIOSConnection:
+    """
+    A minimal asyncio counterpart to netmiko's ConnectHandler for Cisco IOS.
+    Takes the same host dict as netmiko and offers the handful of methods
+    the scripts use: send_command, send_config_set, save_config and disconnect.
+    Thousands of these can share a single event loop
+    """
+
+    def __init__(self, host, username=None, password=None, port=22,
+                 conn_timeout=10, timeout=60, **kwargs):
+        """
+        :param host: DNS or IP address of the device
+        :param conn_timeout: seconds allowed for TCP connect and authentication
+        :param timeout: seconds allowed for a command to return to the prompt
+        :param kwargs: other netmiko arguments such as device_type, ignored here
+        """
+        self.host = host
+        self.username = username
+        self.password = password
+        self.port = port
+        self.conn_timeout = conn_timeout
+        self.timeout = timeout
+        self.conn = None
+        self.stdin = None
+        self.stdout = None
+        self.base_prompt = None
+        self.prompt = ANY_PROMPT
+
+    async def connect(self):
+        # a retry reconnects the same object, don't leave the previous connection open
+        await self.disconnect()
+        try:
+            self.conn = await asyncio.wait_for(
+                asyncssh.connect(self.host, port=self.port, username=self.username,
+                                 password=self.password, known_hosts=None),
+                self.conn_timeout,
+            )
+        except asyncssh.PermissionDenied as e:
+            raise AsyncAuthenticationError(f"Authentication to {self.host} failed") from e
+        except (asyncio.TimeoutError, OSError, asyncssh.Error) as e:
+            raise AsyncTimeoutError(f"Connection to {self.host} failed: {e}") from e
+
+        try:
+            self.stdin, self.stdout, _ = await self.conn.open_session(term_type="vt100", term_size=(511, 24))
+            # IOS prints any banner followed by the exec prompt as soon as the shell opens
+            banner = await self._read_until_prompt(prompt=ANY_PROMPT)
+            self._set_prompt(banner)
+            await self.send_command("terminal length 0")
+            await self.send_command("terminal width 511")
+        except BaseException:
+            await self.disconnect()
+            raise
+        return self
+
+    def _set_prompt(self, output):
+        # the last line is the exec prompt, e.g. 'switch#'
+        self.base_prompt = output.strip().splitlines()[-1].strip()[:-1]
+        self.prompt = re.compile(re.escape(self.base_prompt) + r"(\([^)]*\))?[>#]\s*$")
+
+    async def send_command(self, command, timeout=None):
+        """
+        Run a command at the exec prompt
+        :return: the output without the echoed command and trailing prompt
+        """
+        self.stdin.write(command + "\n")
+        output = await self._read_until_prompt(timeout)
+        return self._strip_command_and_prompt(output, command)
+
+    async def send_config_set(self, cmds, stop=None):
+        """
+        Enter config mode, send each command and wait for the prompt, then leave config mode.
+        Any prompt ends a command, so a hostname command doesn't leave it waiting
+        :param stop: optional callable given the output of each command as it arrives.
+                     When it returns True the remaining commands are skipped and config mode is left
+        :return: the full session text, as netmiko's send_config_set does
+        """
+        output = []
+        for command in ["configure terminal", *cmds]:
+            self.stdin.write(command + "\n")
+            output.append(await self._read_until_prompt(prompt=ANY_PROMPT))
+            if stop is not None and stop(output[-1]):
+                break
+        self.stdin.write("end\n")
+        output.append(await self._read_until_prompt(prompt=ANY_PROMPT))
+        self._set_prompt(output[-1])
+        return "".join(output)
+
+    async def send_config_block(self, cmds):
+        """
+        Send the whole config set at once and read the output once, instead of
+        waiting for the prompt after each command. Each line sent is answered
+        by one prompt, so the output is complete once they have all arrived.
+        Prompts are counted whatever their hostname, which a hostname command changes
+        :return: the full session text, as send_config_set
+        """
+        lines = ["configure terminal", *cmds, "end"]
+        self.stdin.write("".join(line + "\n" for line in lines))
+        chunks = []
+        while True:
+            chunks.append(await self._read_until_prompt(prompt=ANY_PROMPT))
+            output = "".join(chunks)
+            if len(LINE_PROMPT.findall(output)) >= len(lines):
+                self._set_prompt(output)
+                return output
+
+    async def save_config(self, command="write memory"):
+        # saving can take much longer than a normal command on large configs
+        self.stdin.write(command + "\n")
+        return await self._read_until_prompt(self.timeout * 2)
+
+    async def disconnect(self):
+        if self.conn is None:
+            return
+        self.conn.close()
+        try:
+            await asyncio.wait_for(self.conn.wait_closed(), self.conn_timeout)
+        except asyncio.TimeoutError:
+            logger.debug(f"Timed out waiting for {self.host} to close the connection")
+        self.conn = None
+
+    async def _read_until_prompt(self, timeout=None, prompt=None):
+        timeout = timeout or self.timeout
+        prompt = prompt or self.prompt
+        chunks = []
+        tail = ""
+        while True:
+            try:
+                chunk = await asyncio.wait_for(self.stdout.read(65536), timeout)
+            except asyncio.TimeoutError as e:
+                raise AsyncTimeoutError(f"Timed out waiting for the prompt on {self.host}") from e
+            if not chunk:
+                raise AsyncTimeoutError(f"{self.host} closed the session")
+            chunks.append(chunk)
+            # only the end of the buffer can hold the prompt
+            tail = (tail + chunk)[-256:]
+            if prompt.search(tail):
+                return "".join(chunks).replace("\r\n", "\n")
+
+    @staticmethod
+    def _strip_command_and_prompt(output, command):
+        lines = output.split("\n")
+        if lines and command in lines[0]:
+            lines = lines[1:]
+        if lines and ANY_PROMPT.search(lines[-1]):
+            lines = lines[:-1]
+        return "\n".join(lines)
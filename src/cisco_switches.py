@@ -1,4 +1,6 @@
+import threading
 from collections import namedtuple, OrderedDict
+from src.oui_index import mac_to_int
 
 
 class CiscoCommandSender:
@@ -17,16 +19,25 @@ class CiscoCommandSender:
 
 
 def parse_hosts_file(file, username, password, device_type='cisco_ios'):
-    hosts_array = []
+    return list(iter_hosts_file(file, username, password, device_type))
+
+
+def iter_hosts_file(file, username, password, device_type='cisco_ios'):
+    """
+    Lazily yield netmiko host dicts from a file with one host per line
+    Blank lines are skipped
+    """
     for line in file:
+        line = line.strip()
+        if not line:
+            continue
         host = {
             'device_type': device_type,
-            'host': line.strip(),
+            'host': line,
             'username': username,
             'password': password,
         }
-        hosts_array.append(host)
-    return hosts_array
+        yield host
 
 
 def parse_commands_file(file):
@@ -57,12 +68,11 @@ def line_parser(data, search_term="DYNAMIC", delimter="\n"):
     return [line.split() for line in relevant_lines]
 
 
+VENDOR_NOT_FOUND = "MAC not found in Vendor DB"
+
+
 def strip_mac_address(mac):
-    mac_separators = ":.-_"
-    output = mac
-    for char in mac_separators:
-        output = output.replace(char, "")
-    return output.upper()
+    return mac.replace(":", "").replace(".", "").replace("-", "").replace("_", "").upper()
 
 
 def parse_mac_line_data(line):
@@ -87,11 +97,112 @@ def read_and_parse_mac_vendor_file(file):
 
 
 def find_mac_vendor(mac, vendor_dict):
-    mac_key = strip_mac_address(mac)[:6]
-    try:
-        return vendor_dict[mac_key]
-    except KeyError:
-        return "MAC not found in Vendor DB"
+    """
+    :param vendor_dict: dict from read_and_parse_mac_vendor_file,
+                        or an OuiIndex, which also matches 28 and 36 bit prefixes
+    """
+    lookup = getattr(vendor_dict, "lookup", None)
+    if lookup is not None:
+        return lookup(mac) or VENDOR_NOT_FOUND
+    return vendor_dict.get(strip_mac_address(mac)[:6], VENDOR_NOT_FOUND)
+
+
+# cache markers: not cached, and an OUI with longer prefixes registered under it
+_MISSING = object()
+_REFINED = object()
+
+
+class VendorLookup:
+    """
+    Vendor lookups shared by every thread of a process, with a bounded LRU
+    cache keyed on the MAC address as given, cut after the OUI. A run sees
+    the same few OUIs over and over, so most lookups never normalise the MAC.
+    Unknown OUIs are cached too. OUIs with 28 or 36 bit prefixes registered
+    under them are cached per 36 bit prefix instead
+    """
+
+    def __init__(self, vendors, max_size=4096):
+        """
+        :param vendors: OuiIndex, or dict from read_and_parse_mac_vendor_file
+        :param max_size: most prefixes kept in the cache
+        """
+        self.vendors = vendors
+        self.max_size = max_size
+        self.lookup_int = getattr(vendors, "lookup_int", None)
+        refined_ouis = getattr(vendors, "refined_ouis", None)
+        self.refined = refined_ouis() if refined_ouis else frozenset()
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, mac):
+        """
+        :param mac: a MAC address in any common notation
+        :return: the vendor, or None if it isn't known
+        """
+        with self.lock:
+            return self._lookup(mac)
+
+    def lookup_many(self, macs, default=VENDOR_NOT_FOUND):
+        """
+        Resolve all MACs of a device at once, taking the lock once
+        :return: list of vendors in the order of macs, default for unknown ones
+        """
+        with self.lock:
+            return [self._lookup(mac) or default for mac in macs]
+
+    @staticmethod
+    def _prefix_lengths(mac):
+        # characters holding the first 6 and 9 hex digits (24 and 36 bits) in each notation
+        if mac[2:3] in (":", "-"):
+            return 8, 13
+        if mac[4:5] == ".":
+            return 7, 11
+        return 6, 9
+
+    def _lookup(self, mac):
+        oui_length, long_length = self._prefix_lengths(mac)
+        key = mac[:oui_length]
+        vendor = self.cache.get(key, _MISSING)
+        refined = vendor is _REFINED
+        if refined:
+            self.cache.move_to_end(key)
+            key = mac[:long_length]
+            vendor = self.cache.get(key, _MISSING)
+        if vendor is not _MISSING:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return vendor
+
+        self.misses += 1
+        value = mac_to_int(mac)
+        if value is None:
+            # not a MAC address, nothing worth caching
+            return None
+        if self.lookup_int is not None:
+            vendor = self.lookup_int(value)
+        else:
+            vendor = self.vendors.get(f"{value >> 24:06X}")
+        if not refined and value >> 24 in self.refined:
+            self._store(key, _REFINED)
+            key = mac[:long_length]
+        self._store(key, vendor)
+        return vendor
+
+    def _store(self, key, vendor):
+        self.cache[key] = vendor
+        if len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+    def take_counts(self):
+        """
+        :return: Dict of hits and misses since the last call
+        """
+        with self.lock:
+            counts = {"vendor_hits": self.hits, "vendor_misses": self.misses}
+            self.hits = self.misses = 0
+        return counts
 
 
 def sort_by_mac(data, mac_idx=1, port_idx=3):
@@ -0,0 +1,120 @@
+import os
+import logging
+import threading
+import concurrent.futures
+from src.scheduler import Scheduler
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ("thread", "asyncio")
+
+# hosts in flight on the asyncio engine when no concurrency is configured
+DEFAULT_ASYNC_CONCURRENCY = 1000
+
+# hosts queued for the thread engine per thread, beyond those being processed
+QUEUED_PER_THREAD = 1
+
+# hosts of full groups waiting for their group per thread (asyncio: per task), see GroupGate
+GROUP_BACKLOG_PER_THREAD = 4
+
+
+def run_threaded(job, hosts, *args, scheduler=None):
+    """
+    Run job(host, *args) for every host on a netmiko friendly thread pool
+    :param job: a blocking function taking a host dict as its first argument
+    :param hosts: iterable of netmiko host dicts
+    :param scheduler: Scheduler with the concurrency, login rate and timeouts to apply
+    :return: None
+    """
+    scheduler = scheduler or Scheduler()
+    # ThreadPoolExecutor's own default
+    workers = scheduler.max_concurrency or min(32, (os.cpu_count() or 1) + 4)
+    # don't pull the next host off the inventory until there is room for it,
+    # so a large inventory never turns into as many queued futures
+    capacity = workers * (1 + QUEUED_PER_THREAD)
+    slots = threading.BoundedSemaphore(capacity)
+    # hosts of a full group wait in the gate rather than in a pool thread,
+    # so a site sorted inventory doesn't park every thread on one site
+    gate = scheduler.group_gate()
+    backlog = threading.BoundedSemaphore(workers * GROUP_BACKLOG_PER_THREAD)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        def start(host):
+            future = executor.submit(scheduler.run_job, job, host, *args)
+            future.add_done_callback(lambda _: finished(host))
+
+        def finished(host):
+            # the next host of the group takes over the slot
+            following = gate.done(host) if gate else None
+            if following is None:
+                slots.release()
+            else:
+                backlog.release()
+                start(following)
+
+        try:
+            for host in hosts:
+                if gate:
+                    backlog.acquire()
+                    if not gate.admit(host):
+                        continue
+                    backlog.release()
+                slots.acquire()
+                start(host)
+        finally:
+            # queued hosts start from done callbacks, so wait for every slot
+            # to come back before the executor stops taking work, also when
+            # reading the inventory failed
+            for _ in range(capacity):
+                slots.acquire()
+
+
+def run_asyncio(job, hosts, *args, scheduler=None):
+    """
+    Run the coroutine job(host, *args) for every host on a single event loop
+    :param job: a coroutine function taking a host dict as its first argument
+    :param hosts: iterable of netmiko host dicts
+    :param scheduler: Scheduler with the concurrency, login rate and timeouts to apply
+    :return: None
+    """
+    # asyncio (and ssl with it) is only imported by the asyncio engine, for a faster start
+    import asyncio
+    asyncio.run(_run_all(job, hosts, args, scheduler or Scheduler()))
+
+
+async def _run_all(job, hosts, args, scheduler):
+    import asyncio
+    concurrency = scheduler.max_concurrency or DEFAULT_ASYNC_CONCURRENCY
+    semaphore = asyncio.Semaphore(concurrency)
+    gate = scheduler.group_gate()
+    backlog = asyncio.Semaphore(concurrency * GROUP_BACKLOG_PER_THREAD)
+    tasks = set()
+
+    async def run_one(host):
+        try:
+            # run the hosts queued for this host's group in turn
+            while host is not None:
+                try:
+                    await scheduler.run_job_async(job, host, *args)
+                except Exception:
+                    logger.exception(f"Unhandled error processing {host['host']}")
+                host = gate.done(host) if gate else None
+                if host is not None:
+                    backlog.release()
+        finally:
+            semaphore.release()
+
+    for host in hosts:
+        if gate:
+            await backlog.acquire()
+            if not gate.admit(host):
+                continue
+            backlog.release()
+        # don't pull the next host off the inventory until there is room for it
+        await semaphore.acquire()
+        task = asyncio.create_task(run_one(host))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.gather(*tasks)
@@ -1,47 +1,92 @@
-import typing
 import logging
-import sys
 import pandas as pd
-from openpyxl import load_workbook
+from openpyxl import Workbook, load_workbook
+from src.results_writer import ResultsWriter
+from src.status_store import StatusStore, store_path
+from src.timing import Timings
 # from collections import namedtuple
 #
 # Columns = namedtuple('column', 'hostname, ip, status')
 
-# Build the logger
-log_file = "results.log"
-file_handler = logging.FileHandler(log_file)
-stream_handler = logging.StreamHandler(sys.stdout)
-file_handler.setLevel(logging.DEBUG)
-stream_handler.setLevel(logging.ERROR)
-# formatting for loggers
-file_handler_format = logging.Formatter('%(levelname)s - %(asctime)s - %(message)s')
-stream_handler_format = logging.Formatter('%(levelname)s - %(asctime)s - %(message)s')
-file_handler.setFormatter(file_handler_format)
-stream_handler.setFormatter(stream_handler_format)
-
+# handlers are set up once for every module, see src.logging_setup
 logger = logging.getLogger(__name__)
-logger.addHandler(file_handler)
-logger.addHandler(stream_handler)
-logger.setLevel(logging.DEBUG)
-
-
-class Column(typing.NamedTuple):
-    hostname: str
-    status: str
-    ip: str
 
 
 class ExcelProcessor:
-
-    def __init__(self, spreadsheet, sheet, username, password, ignore_status=False):
+    """
+    Imports the sheet's hosts into a src.status_store.StatusStore when it is
+    loaded and exports the results back to the sheet on close(). In between
+    results only go to the store, the workbook isn't touched
+    """
+
+    def __init__(self, spreadsheet, sheet, username, password, ignore_status=False,
+                 flush_every=50, flush_interval=5.0, stream=False, timings=None, status_db=None):
+        """
+        :param flush_every: write queued results to the status store after this many
+        :param flush_interval: write queued results to the status store at least every N seconds
+        :param stream: defer reading the sheet until the first result is written.
+                       Use when hosts come from src.inventory.open_inventory
+        :param timings: src.timing.Timings to record the write of the workbook in, as phase 'excel_write'
+        :param status_db: the status store's file. Default is <workbook>.status.db next to the workbook
+        """
         self.spreadsheet = spreadsheet
         self.username = username
         self.password = password
         self.ignore_status = ignore_status
         self.sheet = sheet
+        self.timings = timings if timings is not None else Timings()
         # self.sheet = sheet_name
         # self.named_tuple: = Column()
-        self.data = self.read_sheet()
+        self._data = None
+        self.index = None
+        self.store = StatusStore(status_db or store_path(spreadsheet))
+        # results a killed run left in the store go to the sheet before it is read for hosts
+        self.recovered = self.recover()
+        if not stream and self._data is None:
+            self.load()
+        # all writes to the status store happen on the writer thread
+        self.writer = ResultsWriter(self.apply_updates, flush_every, flush_interval)
+
+    @property
+    def data(self):
+        if self._data is None:
+            # streamed inventories already dropped duplicate IPs, don't fail the writer over them
+            self.load(strict=False)
+        return self._data
+
+    def load(self, strict=True):
+        self._data = self.read_sheet()
+        self.index = self.build_index(strict)
+        self.import_hosts()
+
+    def import_hosts(self):
+        """
+        Add the sheet's hosts to the status store, see StatusStore.import_hosts
+        """
+        data = self.data
+        ips = self.clean_column(data["ip"])
+        hostnames = self.clean_column(data["hostname"]) if "hostname" in data.columns else [None] * len(data)
+        statuses = self.clean_column(data["status"]) if "status" in data.columns else [None] * len(data)
+        rows = ((position, str(ip), self.text(hostname), self.text(status))
+                for position, (ip, hostname, status) in enumerate(zip(ips, hostnames, statuses)) if ip is not None)
+        count = self.store.import_hosts(rows)
+        logger.debug(f"Imported {count} hosts from {self.spreadsheet} into {self.store.path}")
+
+    def recover(self):
+        """
+        Write results left in the status store by a run that never exported them to the sheet
+        :return: number of updates written
+        """
+        updates, until = self.store.unexported()
+        if not updates:
+            return 0
+        logger.warning(f"Writing {len(updates)} results of an interrupted run from {self.store.path} "
+                       f"to {self.spreadsheet}")
+        self._data = self.read_sheet()
+        self.index = self.build_index(strict=False)
+        self.export(updates, until)
+        self.import_hosts()
+        return len(updates)
 
     def read_sheet(self):
         # right method
@@ -53,129 +98,157 @@ class ExcelProcessor:
                 # print(df.head())
         return df
 
-    def run_sheet_read(self):
-        hosts = []
-        for index, row in self.data.iterrows():
-            data: Column = self.parse_case_sheet(Column, row)
-            if not self.is_row_sane(data) or not self.process_row(data):
+    def build_index(self, strict=True):
+        """
+        Map each host IP to its row position so updates don't scan the sheet
+        Raise ValueError if an IP appears on more than one row,
+        or only log it and keep the first row if strict is False
+        return: Dict of ip -> row position
+        """
+        index = {}
+        duplicates = set()
+        for position, ip in enumerate(self.clean_column(self.data["ip"])):
+            if ip is None:
                 continue
-            # if not self.process_row(data):
-            #     continue
-            hosts.append(self.parse_hosts_for_netmiko(data.ip))
-        return hosts
-
-    def parse_hosts_for_netmiko(self, host, device_type='cisco_ios'):
-        host = {
-            'device_type': device_type,
-            'host': host,
-            'username': self.username,
-            'password': self.password,
-        }
-        return host
-
-    @staticmethod
-    def is_row_sane(row):
-        if row.hostname is None or row.ip is None:
-            return False
-        # if '.ngbutikk.net' not in row.hostname:
-        #     return False
-        return True
+            if ip in index:
+                duplicates.add(ip)
+                continue
+            index[ip] = position
+        if duplicates and not strict:
+            logger.error(f"Duplicate IP addresses in {self.spreadsheet}: {', '.join(sorted(map(str, duplicates)))}")
+        elif duplicates:
+            raise ValueError(f"Duplicate IP addresses in {self.spreadsheet}: {', '.join(sorted(map(str, duplicates)))}")
+        return index
 
     def update_process_column(self, key, result):
         status = "success" if result else "failed"
-        row = self.data.loc[self.data["ip"] == key, "status"] = status
-        self.write_to_file()
-        return row
+        return self.update_sheet(key, status, "status")
 
     def update_sheet(self, key, value, column):
-        row = self.data.loc[self.data["ip"] == key, column] = value
+        self.writer.put(key, column, value)
+        return value
+
+    def apply_updates(self, updates):
+        """
+        Write a batch of queued updates to the status store in one transaction.
+        Only ever called from the writer thread
+        :param updates: list of (key, column, value) tuples
+        :return: None
+        """
+        # the sheet's hosts must be in the store before their results
+        if self._data is None:
+            self.load(strict=False)
+        applied = self.store.update_many(updates)
+        logger.debug(f"Flushed {applied} of {len(updates)} updates to {self.store.path}")
+
+    def export(self, updates=None, until=None):
+        """
+        Set the results in the sheet and write the workbook once
+        :param updates: list of (key, column, value) tuples. Default is every result not yet exported
+        :param until: the time unexported returned with updates
+        :return: number of updates written
+        """
+        if updates is None:
+            updates, until = self.store.unexported()
+        if not updates:
+            return 0
+        for key, column, value in updates:
+            self.set_value(key, column, value)
         self.write_to_file()
-        return row
+        self.store.mark_exported(until)
+        logger.debug(f"Exported {len(updates)} updates from {self.store.path} to {self.spreadsheet}")
+        return len(updates)
+
+    def set_value(self, key, column, value):
+        """
+        Set a single cell, looking the row up by host IP
+        :param key: the host IP
+        :param column: the column name. Created if it doesn't exist yet
+        :param value: the value to write
+        :return: True if the host was found in the sheet
+        """
+        data = self.data
+        position = self.index.get(key)
+        if position is None:
+            logger.debug(f"{key} not found in {self.spreadsheet}, not updating {column}")
+            return False
+        data.iat[position, self.column_position(column)] = value
+        return True
+
+    def column_position(self, column):
+        # status/ports may be missing or read as all-NaN floats, make them hold strings
+        if column not in self.data.columns:
+            self.data[column] = None
+        elif self.data[column].dtype != object:
+            self.data[column] = self.data[column].astype(object)
+        return self.data.columns.get_loc(column)
+
+    def close(self):
+        """
+        Flush any outstanding updates to the status store, stop the writer thread
+        and write the results to the workbook
+        """
+        self.writer.close()
+        try:
+            self.export()
+        finally:
+            self.store.close()
 
     def update_ports_column(self, key, port_info):
         ports = " ".join(port_info)
         self.update_sheet(key, ports, "ports")
 
     def write_to_file(self, index=False):
-        # self.data.to_excel(self.spreadsheet, index=index)
-        self.append_df_to_excel(index=index)
-
-    def process_row(self, row):
-        if self.ignore_status:
-            return True
-        if row.status == 'success':
-            print(f"ignoring row {row}")
-            logger.debug(f"ignoring row {row}")
-            return False
-        return True
+        # the write is a full snapshot of the sheet, so replace rather than append
+        with self.timings.phase("excel_write"):
+            self.write_sheet(index=index)
 
     @staticmethod
-    def clean_data(row):
-        for key, value in row.items():
-            if isinstance(value, str):
-                value = value.strip()
-            if pd.isna(value) or value == "" or value == "null":
-                row[key] = None
-        return row
-
-    def parse_case_sheet(self, obj, row):
-        return obj(**self.clean_data(row))
-
-    def append_df_to_excel(self, startrow=None,
-                           truncate_sheet=False,
-                           **to_excel_kwargs):
-        """
-        Append a DataFrame [df] to existing Excel file [filename]
-        into [sheet_name] Sheet.
-        If [filename] doesn't exist, then this function will create it.
-
-        Parameters:
-          startrow : upper left cell row to dump data frame.
-                     Per default (startrow=None) calculate the last row
-                     in the existing DF and write to the next row...
-          truncate_sheet : truncate (remove and recreate) [sheet_name]
-                           before writing DataFrame to Excel file
-          to_excel_kwargs : arguments which will be passed to `DataFrame.to_excel()`
-                            [can be dictionary]
-
-        Returns: None
-        """
-        # ignore [engine] parameter if it was passed
-        if 'engine' in to_excel_kwargs:
-            to_excel_kwargs.pop('engine')
-
-        writer = pd.ExcelWriter(self.spreadsheet, engine='openpyxl')
+    def text(value):
+        return None if value is None else str(value)
 
+    @staticmethod
+    def clean_column(column):
+        """
+        Column-wise version of src.inventory.clean_value.
+        Strip strings and turn NaN, empty and "null" cells into None.
+        The stripped value is kept, so ' 10.0.0.7' is read as '10.0.0.7'
+        :param column: a pandas Series
+        :return: a new Series of dtype object
+        """
+        column = column.astype(object)
         try:
-            # try to open an existing workbook
-            writer.book = load_workbook(self.spreadsheet)
-
-            # get the last row in the existing Excel sheet
-            # if it was not specified explicitly
-            if startrow is None and self.sheet in writer.book.sheetnames:
-                startrow = writer.book[self.sheet].max_row
-
-            # truncate sheet
-            if truncate_sheet and self.sheet in writer.book.sheetnames:
-                # index of [sheet_name] sheet
-                idx = writer.book.sheetnames.index(self.sheet)
-                # remove [sheet_name]
-                writer.book.remove(writer.book.worksheets[idx])
-                # create an empty sheet [sheet_name] using old index
-                writer.book.create_sheet(self.sheet, idx)
-
-            # copy existing sheets
-            writer.sheets = {ws.title: ws for ws in writer.book.worksheets}
-        except FileNotFoundError:
-            # file does not exist yet, we will create it
+            stripped = column.str.strip()
+            column = stripped.where(stripped.notna(), column)
+        except AttributeError:
+            # no string values in this column, nothing to strip
             pass
+        column = column.astype(object)
+        column[column.isna() | column.isin(["", "null"])] = None
+        return column
 
-        if startrow is None:
-            startrow = 0
-
-        # write out the new sheet
-        # self.data.reset_index()
-        self.data.to_excel(writer, self.sheet, startrow=startrow, **to_excel_kwargs)
-
-        # save the workbook
-        writer.save()
+    def write_sheet(self, index=False):
+        """
+        Replace the sheet with self.data, keeping the workbook's other sheets.
+        Written with openpyxl directly, pandas' ExcelWriter no longer
+        accepts an already loaded workbook (writer.book, writer.save())
+        """
+        try:
+            workbook = load_workbook(self.spreadsheet)
+        except FileNotFoundError:
+            workbook = Workbook()
+            workbook.remove(workbook.active)
+
+        position = len(workbook.sheetnames)
+        if self.sheet in workbook.sheetnames:
+            position = workbook.sheetnames.index(self.sheet)
+            workbook.remove(workbook[self.sheet])
+        worksheet = workbook.create_sheet(self.sheet, position)
+
+        data = self.data.reset_index() if index else self.data
+        worksheet.append([str(column) for column in data.columns])
+        # NaN cells are written empty, as to_excel does
+        values = data.astype(object).where(data.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            worksheet.append(row)
+        workbook.save(self.spreadsheet)
@@ -0,0 +1,23 @@
+"""
+Files written whole, so readers never see a partial one, with the
+permissions any other file the user creates would get.
+"""
+import os
+import tempfile
+
+# read once at import: os.umask can only be read by setting it, which would race other threads
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def write_atomic(path, data):
+    """
+    Write data to a temporary file next to path, then rename it over path
+    :param path: pathlib.Path of the file
+    :param data: bytes
+    """
+    with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as file:
+        file.write(data)
+    # NamedTemporaryFile creates files 0600, which would keep other users of a shared cache or index out
+    os.chmod(file.name, 0o666 & ~_UMASK)
+    os.replace(file.name, path)
@@ -0,0 +1,122 @@
+import csv
+import typing
+import logging
+from pathlib import Path
+from src.cisco_switches import iter_hosts_file
+
+logger = logging.getLogger(__name__)
+
+TEXT_SUFFIXES = (".txt",)
+CSV_SUFFIXES = (".csv",)
+
+
+class Column(typing.NamedTuple):
+    hostname: str
+    status: str
+    ip: str
+
+
+def is_spreadsheet(path):
+    return Path(path).suffix.lower() not in TEXT_SUFFIXES + CSV_SUFFIXES
+
+
+def clean_value(value):
+    """
+    Strip strings and turn NaN, empty and "null" cells into None.
+    The stripped value is kept, so ' 10.0.0.7' connects to 10.0.0.7 and a
+    status of ' success ' counts as success. Before, only the check was
+    made on the stripped value and the host connected to ' 10.0.0.7'
+    """
+    if isinstance(value, str):
+        value = value.strip()
+    # value != value is only true for NaN
+    if value is None or value != value or value == "" or value == "null":
+        return None
+    return value
+
+
+def iter_sheet_rows(path, sheet):
+    """
+    Stream the rows of a worksheet as dicts keyed by the header row.
+    The workbook is opened in read-only mode, so rows are parsed as
+    they are consumed rather than all up front
+    """
+    # only workbooks need openpyxl, text and CSV inventories never import it
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook[sheet].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [clean_value(name) for name in header]
+        for values in rows:
+            yield dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def iter_csv_rows(path):
+    with open(path, newline="") as file:
+        yield from csv.DictReader(file)
+
+
+def iter_inventory_hosts(rows, username, password, ignore_status=False, device_type='cisco_ios'):
+    """
+    Turn inventory rows (hostname, status, ip) into netmiko host dicts.
+    Rows missing a hostname or IP are skipped, as are rows already marked
+    as 'success' unless ignore_status is set. Repeated IPs are only yielded once
+    """
+    seen = set()
+    for row in rows:
+        row = Column(clean_value(row.get("hostname")), clean_value(row.get("status")), clean_value(row.get("ip")))
+        if row.hostname is None or row.ip is None:
+            continue
+        if not ignore_status and row.status == 'success':
+            print(f"ignoring row {row}")
+            logger.debug(f"ignoring row {row}")
+            continue
+        if row.ip in seen:
+            logger.error(f"Duplicate IP {row.ip} in inventory, ignoring row {row}")
+            continue
+        seen.add(row.ip)
+        yield {
+            'device_type': device_type,
+            'host': row.ip,
+            'username': username,
+            'password': password,
+        }
+
+
+def _iter_text_hosts(path, username, password):
+    with open(path) as file:
+        yield from iter_hosts_file(file, username, password)
+
+
+def open_inventory(path, sheet, username, password, ignore_status=False):
+    """
+    Open a host inventory and return a generator of netmiko host dicts.
+    Hosts are yielded while the file is still being read, so jobs can be
+    submitted before the whole inventory is loaded.
+    Supported formats are a plain text file with one host per line (.txt),
+    a CSV file and an Excel workbook with hostname, status and ip columns
+    :param path: path to the inventory
+    :param sheet: the sheet to read when the inventory is a workbook
+    :param username: username for switch login
+    :param password: password for switch login
+    :param ignore_status: process rows even when their status is 'success'
+    :return: generator of host dicts
+    """
+    path = Path(path)
+    # fail here rather than on the first next() of the generator
+    if not path.is_file():
+        raise FileNotFoundError(path)
+
+    suffix = path.suffix.lower()
+    if suffix in TEXT_SUFFIXES:
+        return _iter_text_hosts(path, username, password)
+    if suffix in CSV_SUFFIXES:
+        rows = iter_csv_rows(path)
+    else:
+        rows = iter_sheet_rows(path, sheet)
+    return iter_inventory_hosts(rows, username, password, ignore_status)
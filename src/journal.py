@@ -0,0 +1,84 @@
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+STARTED = "started"
+RETRY = "retry"
+SUCCESS = "success"
+FAILED = "failed"
+
+
+class Journal:
+    """
+    Append-only JSON lines record of per-host state transitions
+    (started, retry, success, failed). Every line is flushed as it is written,
+    so a killed run loses at most the line being written.
+    A Journal without a path records nothing
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self.lock = threading.Lock()
+        # line buffered, each record reaches the OS as soon as it is written
+        self.file = self.path.open("a", buffering=1) if self.path else None
+        if self.file is not None and _ends_mid_line(self.path):
+            # end the partial line of a killed run, so the first record of this one stays readable
+            self.file.write("\n")
+
+    def record(self, host, state, **details):
+        if self.file is None:
+            return
+        line = json.dumps({"time": round(time.time(), 3), "host": host, "state": state, **details})
+        with self.lock:
+            self.file.write(line + "\n")
+
+    def retry_recorder(self, host):
+        """
+        :return: an on_retry callback for RetryPolicy that records the retry against host
+        """
+        def on_retry(attempt, exception, delay):
+            self.record(host, RETRY, attempt=attempt, error=type(exception).__name__)
+        return on_retry
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def completed(self):
+        """
+        :return: set of hosts whose last recorded state is success
+        """
+        return {host for host, state in load_states(self.path).items() if state == SUCCESS}
+
+
+def _ends_mid_line(path):
+    with open(path, "rb") as file:
+        if file.seek(0, 2) == 0:
+            return False
+        file.seek(-1, 2)
+        return file.read(1) != b"\n"
+
+
+def load_states(path):
+    """
+    Replay a journal file
+    :return: Dict of host -> last recorded state, empty if there is no journal yet
+    """
+    states = {}
+    if not path or not Path(path).is_file():
+        return states
+    with open(path) as file:
+        for line_number, line in enumerate(file, 1):
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # a run killed mid-write leaves a partial last line
+                logger.debug(f"Skipping unreadable journal line {line_number} in {path}")
+                continue
+            states[entry["host"]] = entry["state"]
+    return states
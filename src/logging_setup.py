@@ -0,0 +1,208 @@
+"""
+One logging setup for every script and module.
+
+Loggers hand their records to a queue and return straight away, unless
+the listener has fallen QUEUE_CHARS characters of messages behind. A single listener
+thread formats them and does all the writing, to the log file and the
+terminal, so worker threads never wait on disk and each file is opened
+once. Lines about one host can be collected in a LogBlock and are then
+written together, so they never interleave with lines about other hosts.
+"""
+import sys
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+
+TEXT_FORMAT = '%(levelname)s - %(asctime)s - %(message)s'
+
+# characters of messages waiting for the listener. A LogBlock of a large switch can be
+# megabytes, so loggers wait for room rather than let the queue grow while the listener falls behind
+QUEUE_CHARS = 4 * 1024 * 1024
+
+
+class LineFormatter(logging.Formatter):
+    """
+    Formats a record logged by LogBlock as one line per collected message,
+    leaving out messages below level. Any other record is formatted as usual
+    """
+
+    def __init__(self, fmt=None, level=logging.NOTSET):
+        super().__init__(fmt)
+        self.level = level
+
+    def format(self, record):
+        lines = getattr(record, "lines", None)
+        if lines is None:
+            return self.format_line(record)
+        formatted = []
+        for levelno, message in lines:
+            if levelno < self.level:
+                continue
+            line = logging.makeLogRecord(record.__dict__)
+            line.levelno, line.levelname, line.msg, line.args = levelno, logging.getLevelName(levelno), message, None
+            formatted.append(self.format_line(line))
+        return "\n".join(formatted)
+
+    def format_line(self, record):
+        return super().format(record)
+
+
+class JsonFormatter(LineFormatter):
+    """
+    One JSON object per line: time, level, logger, host (when known) and message
+    """
+
+    def format_line(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        host = getattr(record, "host", None)
+        if host is not None:
+            entry["host"] = host
+        return json.dumps(entry)
+
+
+class LoggerFilter(logging.Filter):
+    """
+    Passes every record of the named loggers and their children, and the
+    records of other loggers at other_level and above
+    """
+
+    def __init__(self, names, other_level=logging.WARNING):
+        super().__init__()
+        self.filters = [logging.Filter(name) for name in names]
+        self.other_level = other_level
+
+    def filter(self, record):
+        return record.levelno >= self.other_level or any(name_filter.filter(record) for name_filter in self.filters)
+
+
+class RecordQueue(queue.Queue):
+    """
+    Queue of log records bounded by the length of their messages instead of their number.
+    A record is let in while the queue holds less than maxsize characters, so one
+    larger than maxsize still gets through on its own
+    """
+
+    def _init(self, maxsize):
+        super()._init(maxsize)
+        self.chars = 0
+
+    def _qsize(self):
+        # what Queue compares with maxsize, and tests for empty
+        return self.chars
+
+    def _put(self, record):
+        super()._put(record)
+        self.chars += self.weight(record)
+
+    def _get(self):
+        record = super()._get()
+        self.chars -= self.weight(record)
+        return record
+
+    @staticmethod
+    def weight(record):
+        # the listener's stop sentinel is None
+        return len(record.msg) + 1 if isinstance(getattr(record, "msg", None), str) else 1
+
+
+class BlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Waits for room in a bounded queue instead of failing when it is full
+    """
+
+    def enqueue(self, record):
+        self.queue.put(record)
+
+
+class BlockingQueueListener(logging.handlers.QueueListener):
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+    def stop(self):
+        # also run at exit, when a caller may have stopped it already
+        if self._thread is not None:
+            super().stop()
+
+
+class LogBlock:
+    """
+    Collects the lines logged about one host and logs them as a single record
+    when flushed or when the with block ends
+    """
+
+    def __init__(self, logger, host=None):
+        self.logger = logger
+        self.host = host
+        self.lines = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    def log(self, level, message):
+        self.lines.append((level, message))
+
+    def debug(self, message):
+        self.log(logging.DEBUG, message)
+
+    def info(self, message):
+        self.log(logging.INFO, message)
+
+    def error(self, message):
+        self.log(logging.ERROR, message)
+
+    def flush(self):
+        if not self.lines:
+            return
+        level = max(levelno for levelno, _ in self.lines)
+        # the message is for handlers without a LineFormatter
+        self.logger.log(level, "\n".join(message for _, message in self.lines),
+                        extra={"lines": self.lines, "host": self.host})
+        self.lines = []
+
+
+def setup_logging(log_file="results.log", file_level=logging.DEBUG, stream_level=logging.ERROR,
+                  file_format=TEXT_FORMAT, stream_format=TEXT_FORMAT, json_lines=False,
+                  loggers=("__main__", "src"), stream_loggers=None):
+    """
+    Send the records of loggers, and their children, through a queue to one listener thread
+    writing log_file and stdout. The listener is stopped, and the queue drained, at exit
+    :param json_lines: write log_file as JSON lines instead of file_format
+    :param loggers: names of the loggers to set up. Third party loggers are left alone
+    :param stream_loggers: names of the loggers written to stdout at stream_level, other loggers only
+                           reach it with warnings and errors. Default is all of loggers
+    :return: the running QueueListener
+    """
+    file_handler = logging.FileHandler(log_file)
+    file_handler.setLevel(file_level)
+    file_handler.setFormatter(JsonFormatter(level=file_level) if json_lines else LineFormatter(file_format, file_level))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setLevel(stream_level)
+    stream_handler.setFormatter(LineFormatter(stream_format, stream_level))
+    if stream_loggers is not None:
+        stream_handler.addFilter(LoggerFilter(stream_loggers))
+
+    records = RecordQueue(maxsize=QUEUE_CHARS)
+    queue_handler = BlockingQueueHandler(records)
+    for name in loggers:
+        logger = logging.getLogger(name)
+        logger.addHandler(queue_handler)
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+
+    listener = BlockingQueueListener(records, file_handler, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,240 @@
+"""
+Compiled MAC vendor (OUI) index.
+
+The text vendor file is compiled once into a binary index next to it
+(vendor-mac-data.txt -> vendor-mac-data.idx) and memory-mapped on
+later runs, so startup does not reparse ~23k lines.
+The index holds one sorted array of prefixes per prefix length:
+24 bit MA-L (OUI), 28 bit MA-M and 36 bit MA-S, and lookups try the
+longest prefix first.
+
+Loading takes well under a millisecond instead of tens of milliseconds
+for the dict, but a lookup bisects the keys and costs about three times
+a dict lookup. src.cisco_switches.VendorLookup, which caches per OUI,
+is the intended front end, and brings the cost back close to the dict's
+(benchmarks/bench_oui_index.py).
+
+Layout, little endian, every section 8 byte aligned:
+    header   magic, version, entry count per prefix length, name count, name bytes
+    per prefix length: keys (uint64, sorted), vendor ids (uint32) and a
+             directory (uint32, 4097) of where each value of the top 12 key
+             bits starts, so a lookup only bisects a handful of keys
+    name offsets (uint32, name count + 1) then the UTF-8 names
+"""
+import sys
+import mmap
+import struct
+import logging
+import argparse
+from bisect import bisect_left
+from pathlib import Path
+from src.files import write_atomic
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"OUIX"
+VERSION = 2
+PREFIX_BITS = (36, 28, 24)
+DIRECTORY_BITS = 12
+HEADER = struct.Struct(f"<4sI{len(PREFIX_BITS)}III")
+
+# separators removed from a prefix in the vendor file
+_PREFIX_STRIP = str.maketrans("", "", ":.-_ ")
+
+
+def mac_to_int(mac):
+    """
+    Normalise a MAC in any common notation (0011.2233.4455, 00:11:22:33:44:55,
+    00-11-22-33-44-55, 001122334455) to a 48 bit integer
+    :return: the integer, or None if mac isn't a MAC address
+    """
+    # chained replace is several times faster than str.translate for short strings
+    digits = mac.replace(".", "").replace(":", "").replace("-", "")
+    if len(digits) != 12:
+        return None
+    try:
+        return int(digits, 16)
+    except ValueError:
+        return None
+
+
+def parse_prefix(token):
+    """
+    Parse a vendor file prefix: 6, 7 or 9 hex digits (24, 28 or 36 bits),
+    optionally with separators, or a full address with an explicit length
+    such as 00:1B:C5:00:00:00/36
+    :return: (bits, prefix value)
+    """
+    digits, _, length = token.partition("/")
+    digits = digits.translate(_PREFIX_STRIP)
+    bits = int(length) if length else len(digits) * 4
+    if bits not in PREFIX_BITS:
+        raise ValueError(f"Unsupported prefix length {bits} in {token!r}")
+    return bits, int(digits[:bits // 4], 16)
+
+
+def _pad(data):
+    return data + b"\0" * (-len(data) % 8)
+
+
+def directory(keys, bits):
+    """
+    :return: for each value of the top DIRECTORY_BITS bits, the position of the
+             first key with that value, followed by len(keys)
+    """
+    shift = bits - DIRECTORY_BITS
+    starts = []
+    for bucket in range(2 ** DIRECTORY_BITS + 1):
+        starts.append(bisect_left(keys, bucket << shift))
+    return starts
+
+
+def build_index(source, target):
+    """
+    Compile a vendor text file into a binary index file
+    :param source: text file with one 'PREFIX Vendor name' per line
+    :param target: where to write the index. Written atomically
+    :return: number of prefixes in the index
+    """
+    entries = {bits: {} for bits in PREFIX_BITS}
+    names = {}
+    with open(source, 'r') as vendor_file:
+        for line in vendor_file:
+            fields = line.split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            bits, prefix = parse_prefix(fields[0])
+            vendor = " ".join(fields[1:])
+            # intern: every vendor name is stored once, entries refer to it by id
+            entries[bits][prefix] = names.setdefault(vendor, len(names))
+
+    encoded = [name.encode() for name in names]
+    offsets = [0]
+    for name in encoded:
+        offsets.append(offsets[-1] + len(name))
+    blob = b"".join(encoded)
+
+    sections = [HEADER.pack(MAGIC, VERSION, *(len(entries[bits]) for bits in PREFIX_BITS), len(names), len(blob))]
+    for bits in PREFIX_BITS:
+        keys = sorted(entries[bits])
+        sections.append(struct.pack(f"<{len(keys)}Q", *keys))
+        sections.append(struct.pack(f"<{len(keys)}I", *(entries[bits][key] for key in keys)))
+        sections.append(struct.pack(f"<{2 ** DIRECTORY_BITS + 1}I", *directory(keys, bits)))
+    sections.append(struct.pack(f"<{len(offsets)}I", *offsets))
+    sections.append(blob)
+
+    write_atomic(Path(target), b"".join(_pad(section) for section in sections))
+    return sum(len(prefixes) for prefixes in entries.values())
+
+
+class OuiIndex:
+    """
+    Read-only view over a memory-mapped index file.
+    Look vendors up through src.cisco_switches.VendorLookup, not one by one
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.map)
+
+        magic, version, *counts, name_count, blob_size = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{self.path} is not a version {VERSION} OUI index")
+
+        offset = len(_pad(bytes(HEADER.size)))
+        self.tables = []
+        for bits, count in zip(PREFIX_BITS, counts):
+            keys = view[offset:offset + count * 8].cast("Q")
+            offset += len(_pad(bytes(count * 8)))
+            ids = view[offset:offset + count * 4].cast("I")
+            offset += len(_pad(bytes(count * 4)))
+            size = (2 ** DIRECTORY_BITS + 1) * 4
+            starts = view[offset:offset + size].cast("I")
+            offset += len(_pad(bytes(size)))
+            if count:
+                self.tables.append((48 - bits, bits - DIRECTORY_BITS, keys, ids, starts))
+        self.name_offsets = view[offset:offset + (name_count + 1) * 4].cast("I")
+        offset += len(_pad(bytes((name_count + 1) * 4)))
+        self.blob = view[offset:offset + blob_size]
+        # names are decoded and interned on first use
+        self.names = [None] * name_count
+
+    def __len__(self):
+        return sum(len(table[2]) for table in self.tables)
+
+    def refined_ouis(self):
+        """
+        :return: set of 24 bit OUIs with 28 or 36 bit prefixes registered under them
+        """
+        ouis = set()
+        for shift, _, keys, _, _ in self.tables:
+            if shift < 24:
+                ouis.update(key >> (24 - shift) for key in keys)
+        return frozenset(ouis)
+
+    def vendor_name(self, vendor_id):
+        name = self.names[vendor_id]
+        if name is None:
+            start, end = self.name_offsets[vendor_id], self.name_offsets[vendor_id + 1]
+            name = self.names[vendor_id] = sys.intern(str(self.blob[start:end], "utf-8"))
+        return name
+
+    def lookup_int(self, value):
+        for shift, bucket_shift, keys, ids, starts in self.tables:
+            prefix = value >> shift
+            bucket = prefix >> bucket_shift
+            end = starts[bucket + 1]
+            position = bisect_left(keys, prefix, starts[bucket], end)
+            if position < end and keys[position] == prefix:
+                return self.vendor_name(ids[position])
+        return None
+
+    def lookup(self, mac):
+        """
+        :param mac: a MAC address in any common notation
+        :return: the vendor of the longest matching prefix, or None
+        """
+        value = mac_to_int(mac)
+        return None if value is None else self.lookup_int(value)
+
+    def __getitem__(self, oui):
+        # dict style access by 6 hex digit OUI, like the dict from read_and_parse_mac_vendor_file
+        vendor = self.lookup(oui + "000000")
+        if vendor is None:
+            raise KeyError(oui)
+        return vendor
+
+
+def index_path(source):
+    return Path(source).with_suffix(".idx")
+
+
+def load_oui_index(source):
+    """
+    Load the compiled index for a vendor text file, compiling it first
+    if it is missing or older than the text file
+    :param source: path of the vendor text file
+    :return: OuiIndex
+    """
+    source = Path(source)
+    target = index_path(source)
+    if not target.is_file() or target.stat().st_mtime < source.stat().st_mtime:
+        count = build_index(source, target)
+        logger.debug(f"Compiled {count} vendor prefixes from {source} into {target}")
+    return OuiIndex(target)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a MAC vendor text file into a binary OUI index")
+    parser.add_argument("source", help="Vendor text file, one 'PREFIX Vendor name' per line")
+    parser.add_argument("--output", help="Index file. Default is the source with an .idx suffix")
+    args = parser.parse_args()
+    target = args.output if args.output else index_path(args.source)
+    count = build_index(args.source, target)
+    print(f"Wrote {count} prefixes to {target}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""
+On-disk cache of show command output, keyed by (host, command).
+
+Outputs are stored once per distinct content, named by their SHA-256,
+so a switch whose MAC table hasn't changed between runs costs no extra
+space. index.json maps each (host, command) to its content hash and the
+time it was fetched, in least to most recently used order.
+
+Several processes, such as the shards of one scan, may share a cache.
+Each merges its entries into the index on disk under index.lock when it
+closes, and only removes objects no entry refers to that are older than
+its own run.
+
+    cache/
+        index.json
+        index.lock
+        objects/<sha256>
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from src.files import write_atomic
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, processes sharing a cache there may lose each other's index updates
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+LOCK_FILE = "index.lock"
+OBJECTS_DIR = "objects"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+@contextmanager
+def _locked(path):
+    # exclusive across processes, held while the index is merged and objects removed
+    with open(path, "a") as file:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+
+class OutputCache:
+    """
+    Thread-safe cache of command output with a TTL per command.
+    The least recently used entries are evicted once the stored content
+    exceeds max_bytes. The index is merged with the one on disk and written,
+    and evicted objects removed, on close()
+    """
+
+    def __init__(self, directory, ttls=None, default_ttl=0, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        :param directory: cache directory, created if missing
+        :param ttls: Dict of command prefix -> seconds an output stays fresh
+        :param default_ttl: seconds for commands not matching any prefix in ttls
+        :param max_bytes: most bytes of output kept on disk
+        """
+        self.directory = Path(directory)
+        self.objects = self.directory / OBJECTS_DIR
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.started = time.time()
+        # entries read or written by this run, the only ones it adds to the index on disk
+        self.touched = set()
+        self.entries = self._load_index()
+        # every entry referencing a hash shares its object file
+        self.sizes = {}
+        for digest, _, size in self.entries.values():
+            self.sizes[digest] = size
+
+    def _load_index(self):
+        path = self.directory / INDEX_FILE
+        if not path.is_file():
+            return OrderedDict()
+        try:
+            with path.open() as file:
+                data = json.load(file)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Ignoring unreadable output cache index {path}: {e!r}")
+            return OrderedDict()
+        return OrderedDict(((host, command), (digest, fetched, size))
+                           for host, command, digest, fetched, size in data)
+
+    def ttl(self, command):
+        """
+        :return: seconds the output of command stays fresh, from the longest matching prefix in ttls
+        """
+        best = None
+        for prefix in self.ttls:
+            if command.startswith(prefix) and (best is None or len(prefix) > len(best)):
+                best = prefix
+        return self.ttls[best] if best is not None else self.default_ttl
+
+    def get(self, host, command, any_age=False):
+        """
+        :param any_age: return the output however old it is, as in offline mode
+        :return: the cached output, or None if there is none or it has expired
+        """
+        key = (host, command)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or (not any_age and time.time() - entry[1] > self.ttl(command)):
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.touched.add(key)
+        try:
+            output = (self.objects / entry[0]).read_text()
+        except OSError:
+            # object removed from under us, treat as a miss
+            with self.lock:
+                self.entries.pop(key, None)
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return output
+
+    def put(self, host, command, output):
+        if output is None:
+            return
+        data = output.encode()
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.objects / digest
+        with self.lock:
+            known = digest in self.sizes
+        # write outside the lock, so other threads' hits and puts don't wait on
+        # multi-MB outputs. Objects are only removed on close, and a racing put
+        # of the same content writes the same bytes
+        if not known:
+            write_atomic(path, data)
+        else:
+            try:
+                # newer than the run of any other process, so its clean up leaves it alone
+                os.utime(path)
+            except OSError:
+                write_atomic(path, data)
+        with self.lock:
+            self.sizes[digest] = len(data)
+            key = (host, command)
+            self.entries.pop(key, None)
+            self.entries[key] = (digest, time.time(), len(data))
+            self.touched.add(key)
+            # evicted objects are removed on close, another process may still refer to them
+            self._evict()
+
+    def _evict(self):
+        """
+        Drop least recently used entries until the content fits in max_bytes. Called with the lock held
+        :return: hashes no entry refers to any more, whose object files can be removed
+        """
+        stored = sum(self.sizes.values())
+        if stored <= self.max_bytes:
+            return []
+        referenced = {}
+        for digest, _, _ in self.entries.values():
+            referenced[digest] = referenced.get(digest, 0) + 1
+        # content whose entries were overwritten by newer output
+        unused = [digest for digest in self.sizes if digest not in referenced]
+        for digest in unused:
+            stored -= self.sizes.pop(digest)
+        while stored > self.max_bytes and len(self.entries) > 1:
+            _, (digest, _, _) = self.entries.popitem(last=False)
+            referenced[digest] -= 1
+            if not referenced[digest]:
+                stored -= self.sizes.pop(digest)
+                unused.append(digest)
+        return unused
+
+    def close(self):
+        """
+        Merge this run's entries into the index on disk, write it, and remove
+        object files no entry refers to that are older than this run
+        """
+        with _locked(self.directory / LOCK_FILE):
+            # what other processes sharing the cache wrote since this one started
+            merged = self._load_index()
+            with self.lock:
+                for key, entry in self.entries.items():
+                    if key not in self.touched:
+                        continue
+                    current = merged.pop(key, None)
+                    # most recently used last, keeping the newer output
+                    merged[key] = current if current is not None and current[1] > entry[1] else entry
+                self.entries = merged
+                self.sizes = {digest: size for digest, _, size in merged.values()}
+                self._evict()
+                data = [[host, command, digest, fetched, size]
+                        for (host, command), (digest, fetched, size) in self.entries.items()]
+                referenced = set(self.sizes)
+            write_atomic(self.directory / INDEX_FILE, json.dumps(data).encode())
+            for path in self.objects.iterdir():
+                if path.name in referenced:
+                    continue
+                try:
+                    # a newer object may belong to a run still going, whose entries aren't in the index yet
+                    if path.stat().st_mtime < self.started:
+                        path.unlink()
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries),
+                    "bytes": sum(self.sizes.values())}
+
+
+class NullCache:
+    """
+    Stands in for OutputCache when no cache directory is given. Caches nothing
+    """
+
+    def get(self, host, command, any_age=False):
+        return None
+
+    def put(self, host, command, output):
+        pass
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {}
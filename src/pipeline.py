@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import typing
+import logging
+import threading
+import concurrent.futures
+from collections import Counter
+from functools import partial
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class RawOutput(typing.NamedTuple):
+    host: str
+    hostname: str
+    mac_output: str
+    arp_output: str
+
+
+def save_raw_output(raw, directory):
+    path = Path(directory) / f"{raw.host}.json"
+    with path.open("w") as file:
+        json.dump(raw._asdict(), file)
+
+
+def load_raw_outputs(directory):
+    """
+    Lazily yield the RawOutput saved by an earlier run, one per device
+    """
+    for path in sorted(Path(directory).glob("*.json")):
+        with path.open() as file:
+            yield RawOutput(**json.load(file))
+
+
+def _timed(analyse, counters, *args):
+    # runs in the parser process, the time and counts are sent back with the result
+    start = time.perf_counter()
+    result = analyse(*args)
+    return result, time.perf_counter() - start, counters() if counters else None
+
+
+class AnalysisPipeline:
+    """
+    Second stage of a scan. SSH threads only collect raw output and submit it here.
+    Parsing runs on a process pool so it never holds the GIL the SSH threads need,
+    and on_result is called with each parsed result back in this process.
+    At most max_pending outputs are queued or being parsed at once, beyond that
+    submit blocks, which holds back the SSH threads instead of buffering without limit.
+    A thread that calls reserve() before reading an output has it counted from then on,
+    so max_pending also bounds the output being read
+    """
+
+    def __init__(self, analyse, on_result, on_error=None, workers=None, max_pending=None,
+                 initializer=None, initargs=(), raw_dir=None, timings=None, counters=None):
+        """
+        :param analyse: module level function taking (mac_output, arp_output)
+        :param on_result: called with (raw, result) for each parsed output. raw has no output any more
+        :param on_error: called with (raw, exception) if parsing fails. raw has no output any more
+        :param workers: parser processes. None for one per CPU, 0 to parse in the calling thread
+        :param max_pending: outputs allowed to queue for the parsers. Default is twice the workers
+        :param initializer: run once in each parser process, e.g. to load the vendor index
+        :param raw_dir: if set, every raw output is also saved here for re-analysis later
+        :param timings: src.timing.Timings to record each parse in, as phase 'parse'
+        :param counters: module level function run in the parser after each parse, returning
+                         a Dict of counts since its last call. The counts are summed in stats()
+        """
+        self.analyse = analyse
+        self.on_result = on_result
+        self.on_error = on_error
+        self.timings = timings
+        self.counters = counters
+        self.counts = Counter()
+        self.counts_lock = threading.Lock()
+        self.raw_dir = Path(raw_dir) if raw_dir else None
+        if self.raw_dir:
+            self.raw_dir.mkdir(parents=True, exist_ok=True)
+
+        if workers == 0:
+            self.executor = None
+            if initializer:
+                initializer(*initargs)
+        else:
+            workers = workers or os.cpu_count() or 1
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=initializer,
+                                                                   initargs=initargs)
+        self.slots = threading.BoundedSemaphore(max_pending or 2 * max(workers, 1))
+
+    def reserve(self):
+        """
+        Take a slot for an output before reading it, waiting while max_pending outputs are held.
+        Pass reserved=True to the submit of the output, or call release() if it is never submitted
+        :return: True
+        """
+        self.slots.acquire()
+        return True
+
+    def release(self):
+        self.slots.release()
+
+    def submit(self, raw, reserved=False):
+        """
+        :param reserved: a slot was taken for raw with reserve(). From here on the slot
+                         is submit's, it is given back however submit ends
+        """
+        if self.raw_dir:
+            try:
+                save_raw_output(raw, self.raw_dir)
+            except BaseException:
+                if reserved:
+                    self.release()
+                raise
+
+        if self.executor is None:
+            try:
+                result, seconds, counts = _timed(self.analyse, self.counters, raw.mac_output, raw.arp_output)
+            except Exception as e:
+                raw = raw._replace(mac_output=None, arp_output=None)
+                self._failed(raw, e)
+                return
+            finally:
+                if reserved:
+                    self.release()
+            self._count(counts)
+            if self.timings is not None:
+                self.timings.add("parse", raw.host, seconds, threading.get_ident())
+            self.on_result(raw._replace(mac_output=None, arp_output=None), result)
+            return
+
+        # backpressure: wait here while the parsers are busy
+        if not reserved:
+            self.slots.acquire()
+        try:
+            future = self.executor.submit(_timed, self.analyse, self.counters, raw.mac_output, raw.arp_output)
+        except BaseException:
+            self.release()
+            raise
+        # the callbacks only need the host and hostname, don't keep the output alive until the parse is done
+        future.add_done_callback(partial(self._done, raw._replace(mac_output=None, arp_output=None)))
+
+    def _done(self, raw, future):
+        self.slots.release()
+        try:
+            result, seconds, counts = future.result()
+        except Exception as e:
+            self._failed(raw, e)
+            return
+        self._count(counts)
+        if self.timings is not None:
+            self.timings.add("parse", raw.host, seconds)
+        try:
+            self.on_result(raw, result)
+        except Exception:
+            logger.exception(f"Failed to record the results of {raw.host}")
+
+    def _count(self, counts):
+        if counts:
+            with self.counts_lock:
+                self.counts.update(counts)
+
+    def stats(self):
+        """
+        :return: Dict of the counts summed over every parse, see counters
+        """
+        with self.counts_lock:
+            return dict(self.counts)
+
+    def _failed(self, raw, exception):
+        logger.error(f"Failed to parse output from {raw.host}: {exception!r}")
+        if self.on_error:
+            self.on_error(raw, exception)
+
+    def close(self):
+        """
+        Wait for every submitted output to be parsed and recorded
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
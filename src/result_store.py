@@ -0,0 +1,218 @@
+"""
+Columnar store of every host record found by switch_finder.
+
+Each run writes to its own directory in the store,
+scan-YYYYmmdd-HHMMSS-<pid>, or scan-YYYYmmdd-HHMMSS-<pid>-shard-i-of-N
+for a sharded run, with one row per MAC address:
+
+    switch, hostname, port, vlan, mac, ip, vendor, scan_time
+
+Rows are buffered and written as a complete Parquet file, part-NNNNN.parquet,
+every batch_rows rows or flush_interval seconds. A run killed part way
+keeps every part written before it was killed, the buffered rows are
+lost. Query the store from the repository root:
+
+    python -m src.result_store results/ --busiest 20
+    python -m src.result_store results/ --mac 0011.2233.4455
+    python -m src.result_store results/ --vendors
+"""
+import os
+import re
+import time
+import argparse
+import logging
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from src.oui_index import mac_to_int
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    raise ImportError('pyarrow package must be installed to use the result store. `pip install pyarrow`')
+
+logger = logging.getLogger(__name__)
+
+RUN_NAME = re.compile(r"scan-\d{8}-\d{6}-\d+(?:-shard-(?P<index>\d+)-of-(?P<count>\d+))?$")
+
+SCHEMA = pa.schema([
+    ("switch", pa.string()),
+    ("hostname", pa.string()),
+    ("port", pa.string()),
+    ("vlan", pa.int16()),
+    ("mac", pa.string()),
+    ("ip", pa.string()),
+    ("vendor", pa.string()),
+    ("scan_time", pa.timestamp("s", tz="UTC")),
+])
+
+
+class ResultStore:
+    """
+    Appends the host records of each scanned switch to this run's directory.
+    Rows are buffered per column and written as a closed Parquet file every
+    batch_rows rows or flush_interval seconds, whichever comes first
+    """
+
+    def __init__(self, directory, batch_rows=100_000, flush_interval=60.0, shard=None):
+        """
+        :param directory: store directory, created if missing
+        :param batch_rows: most rows per part file
+        :param flush_interval: seconds rows may wait in the buffer, checked as switches are added
+        :param shard: (i, N) of a sharded run, from src.sharding.parse_shard
+        """
+        self.directory = Path(directory)
+        # the pid keeps runs started in the same second, such as the shards of one scan, apart
+        name = f"scan-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        if shard:
+            name += f"-shard-{shard[0]}-of-{shard[1]}"
+        self.path = self.directory / name
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.columns = {name: [] for name in SCHEMA.names}
+        self.rows = 0
+        self.parts = 0
+        self.flushed = time.monotonic()
+
+    def add_device(self, switch, hostname, vlan_data):
+        """
+        :param switch: IP or DNS name the switch was scanned at
+        :param hostname: the switch's hostname
+        :param vlan_data: Dict of VLAN -> Dict of port -> list of HostRecord, from scan_device_vlans
+        """
+        scan_time = datetime.now(timezone.utc)
+        with self.lock:
+            columns = self.columns
+            for ports in vlan_data.values():
+                for records in ports.values():
+                    for record in records:
+                        columns["switch"].append(switch)
+                        columns["hostname"].append(hostname)
+                        columns["port"].append(record.port)
+                        columns["vlan"].append(record.vlan)
+                        columns["mac"].append(record.mac)
+                        columns["ip"].append(record.ip)
+                        columns["vendor"].append(record.vendor)
+                        columns["scan_time"].append(scan_time)
+            if len(columns["mac"]) >= self.batch_rows or time.monotonic() - self.flushed >= self.flush_interval:
+                self._flush()
+
+    def _flush(self):
+        # called with the lock held
+        self.flushed = time.monotonic()
+        if not self.columns["mac"]:
+            return
+        batch = pa.Table.from_pydict(self.columns, schema=SCHEMA)
+        # written whole under a temporary name, readers only ever see complete part files
+        path = self.path / f"part-{self.parts:05d}.parquet"
+        temporary = path.with_suffix(".tmp")
+        pq.write_table(batch, temporary, compression="zstd")
+        os.replace(temporary, path)
+        self.parts += 1
+        self.rows += batch.num_rows
+        self.columns = {name: [] for name in SCHEMA.names}
+
+    def close(self):
+        with self.lock:
+            self._flush()
+        logger.debug(f"Wrote {self.rows} host records to {self.path} in {self.parts} files")
+
+
+def scan_runs(directory):
+    """
+    :return: the store's run directories, oldest first
+    """
+    return sorted(path for path in Path(directory).glob("scan-*") if path.is_dir() and RUN_NAME.match(path.name))
+
+
+def latest_scan(runs):
+    """
+    The latest run, or for a sharded run the latest run of each of its shards
+    :param runs: run directories, oldest first
+    """
+    latest = runs[-1]
+    count = RUN_NAME.match(latest.name)["count"]
+    if count is None:
+        return [latest]
+    shards = {}
+    for run in runs:
+        match = RUN_NAME.match(run.name)
+        if match["count"] == count:
+            shards[match["index"]] = run
+    return sorted(shards.values())
+
+
+def load_results(directory, all_scans=False):
+    """
+    :param all_scans: read every run in the store instead of only the latest
+    :return: pyarrow Table
+    """
+    runs = scan_runs(directory)
+    if not runs:
+        raise FileNotFoundError(f"No scans found in {directory}")
+    if not all_scans:
+        runs = latest_scan(runs)
+    files = [path for run in runs for path in sorted(run.glob("part-*.parquet"))]
+    if not files:
+        return SCHEMA.empty_table()
+    return pa.concat_tables(pq.read_table(path, schema=SCHEMA) for path in files)
+
+
+def busiest_ports(table, top=20):
+    """
+    :return: Table of switch, hostname, port, vlan and MAC count, ports with the most MACs first
+    """
+    counts = table.group_by(["switch", "hostname", "port", "vlan"]).aggregate([("mac", "count_distinct")])
+    counts = counts.rename_columns(["switch", "hostname", "port", "vlan", "macs"])
+    return counts.sort_by([("macs", "descending")]).slice(0, top)
+
+
+def find_mac(table, mac):
+    """
+    :param mac: a MAC address in any common notation
+    :return: Table of every row for that MAC, most recent first
+    """
+    value = mac_to_int(mac)
+    if value is None:
+        raise ValueError(f"{mac!r} is not a MAC address")
+    # compare the bare hex digits, whatever notation the switch reported the MAC in
+    stored = pc.replace_substring_regex(pc.utf8_lower(table["mac"]), pattern="[^0-9a-f]", replacement="")
+    rows = table.filter(pc.equal(stored, f"{value:012x}"))
+    return rows.sort_by([("scan_time", "descending")])
+
+
+def vendor_counts(table):
+    """
+    :return: Table of vendor and distinct MAC count, most common first
+    """
+    counts = table.group_by("vendor").aggregate([("mac", "count_distinct")])
+    counts = counts.rename_columns(["vendor", "macs"])
+    return counts.sort_by([("macs", "descending")])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the results stored by switch_finder --store")
+    parser.add_argument("directory", help="The store directory")
+    parser.add_argument("--all-scans", action="store_true", help="Query every run, not only the latest")
+    query = parser.add_mutually_exclusive_group(required=True)
+    query.add_argument("--busiest", type=int, metavar="N", help="The N ports with the most MAC addresses")
+    query.add_argument("--mac", help="Where a MAC address was seen")
+    query.add_argument("--vendors", action="store_true", help="MAC addresses per vendor")
+    args = parser.parse_args()
+
+    table = load_results(args.directory, args.all_scans)
+    if args.busiest:
+        result = busiest_ports(table, args.busiest)
+    elif args.mac:
+        result = find_mac(table, args.mac)
+    else:
+        result = vendor_counts(table)
+    print(result.to_pandas().to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import time
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# marker placed on the queue to tell the flusher to drain and exit
+_STOP = object()
+
+# seconds before a failed batch is tried again, doubled on every failure up to MAX_RETRY_DELAY
+RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 30.0
+
+# tries at the last flush on close() before the updates are given up
+CLOSE_ATTEMPTS = 5
+
+
+class ResultsWriter:
+    """
+    Single writer for per-host results.
+    Worker threads push (key, column, value) updates onto a queue and
+    one flusher thread hands them to the apply callback in batches.
+    A batch is flushed once flush_every updates are pending or
+    flush_interval seconds have passed, and once more on close().
+    A batch that fails, e.g. on a locked database, stays pending and is
+    tried again with backoff, together with the updates queued since
+    """
+
+    def __init__(self, apply, flush_every=50, flush_interval=5.0):
+        """
+        :param apply: callable taking a list of (key, column, value) tuples
+        :param flush_every: flush after this many pending updates
+        :param flush_interval: flush after this many seconds, whatever the count
+        """
+        self.apply = apply
+        self.flush_every = max(int(flush_every), 1)
+        self.flush_interval = float(flush_interval)
+        self.queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="results-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, key, column, value):
+        self.queue.put((key, column, value))
+
+    def close(self):
+        """
+        Flush everything still queued and stop the flusher thread
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self.queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        pending = []
+        failures = 0
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._flush_last(pending)
+                return
+            if item is not None:
+                pending.append(item)
+
+            # after a failure only the backoff deadline triggers the next try
+            if (not failures and len(pending) >= self.flush_every) or time.monotonic() >= deadline:
+                if self._flush(pending):
+                    pending = []
+                    failures = 0
+                    deadline = time.monotonic() + self.flush_interval
+                else:
+                    failures += 1
+                    deadline = time.monotonic() + self.retry_delay(failures)
+
+    @staticmethod
+    def retry_delay(failures):
+        return min(MAX_RETRY_DELAY, RETRY_DELAY * 2 ** (failures - 1))
+
+    def _flush_last(self, pending):
+        for attempt in range(1, CLOSE_ATTEMPTS + 1):
+            if self._flush(pending):
+                return
+            if attempt < CLOSE_ATTEMPTS:
+                time.sleep(self.retry_delay(attempt))
+        logger.error(f"Gave up on {len(pending)} result updates after {CLOSE_ATTEMPTS} tries")
+
+    def _flush(self, pending):
+        """
+        :return: True if pending was applied, or was empty
+        """
+        if not pending:
+            return True
+        try:
+            self.apply(pending)
+        except Exception:
+            # keep the flusher alive, the batch stays pending and is tried again
+            logger.exception(f"Failed to flush {len(pending)} result updates, trying again")
+            return False
+        return True
+
+
+class NullResults:
+    """
+    Results sink for inventories with nowhere to write per-host results,
+    such as a plain text hosts file. Outcomes are still logged by the callers
+    """
+
+    def update_process_column(self, key, result):
+        return "success" if result else "failed"
+
+    def update_sheet(self, key, value, column):
+        return value
+
+    def update_ports_column(self, key, port_info):
+        return " ".join(port_info)
+
+    def close(self):
+        pass
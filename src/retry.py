@@ -0,0 +1,66 @@
+import time
+import random
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RetryPolicy:
+    """
+    Retry an operation with exponential backoff and full jitter.
+    The n-th retry waits a random time between 0 and
+    min(max_delay, base_delay * 2 ** n) seconds, so hosts that failed
+    together don't all come back at the same moment
+    """
+
+    def __init__(self, attempts=1, base_delay=1.0, max_delay=30.0):
+        """
+        :param attempts: total attempts, 1 means no retries
+        :param base_delay: seconds for the first backoff step
+        :param max_delay: upper bound of any single backoff
+        """
+        self.attempts = max(int(attempts), 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, retry):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+    def call(self, func, retry_on, name="operation", on_retry=None):
+        """
+        Call func() until it succeeds, retrying on the given exceptions
+        :param func: callable taking no arguments
+        :param retry_on: exception class or tuple of classes worth retrying
+        :param name: used in the log message, e.g. the host
+        :param on_retry: optional callable(attempt, exception, delay) run before each retry
+        :return: whatever func returns. The last exception is raised once attempts run out
+        """
+        for attempt in range(1, self.attempts + 1):
+            try:
+                return func()
+            except retry_on as e:
+                if attempt == self.attempts:
+                    raise
+                delay = self._before_retry(attempt, e, name, on_retry)
+            time.sleep(delay)
+
+    async def call_async(self, func, retry_on, name="operation", on_retry=None):
+        """
+        Same as call, for a coroutine function
+        """
+        import asyncio
+        for attempt in range(1, self.attempts + 1):
+            try:
+                return await func()
+            except retry_on as e:
+                if attempt == self.attempts:
+                    raise
+                delay = self._before_retry(attempt, e, name, on_retry)
+            await asyncio.sleep(delay)
+
+    def _before_retry(self, attempt, exception, name, on_retry):
+        delay = self.delay(attempt - 1)
+        logger.warning(f"{name}: {type(exception).__name__}, retry {attempt} of {self.attempts - 1} in {delay:.1f}s")
+        if on_retry:
+            on_retry(attempt, exception, delay)
+        return delay
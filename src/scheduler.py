@@ -0,0 +1,209 @@
+import time
+import logging
+import threading
+import ipaddress
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting how often logins may start.
+    rate tokens are added per second, up to burst tokens in the bucket
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(float(burst), 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        """
+        Take a token if one is available
+        :return: 0 if a token was taken, otherwise seconds until one will be
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        # other threads may take the token while we sleep, so check again on waking
+        delay = self.try_acquire()
+        while delay:
+            time.sleep(delay)
+            delay = self.try_acquire()
+
+    async def acquire_async(self):
+        # only the asyncio engine gets here, the thread engine never imports asyncio
+        import asyncio
+        delay = self.try_acquire()
+        while delay:
+            await asyncio.sleep(delay)
+            delay = self.try_acquire()
+
+
+def subnet_key(prefix):
+    """
+    Group hosts by the IPv4/IPv6 network of the given prefix length, e.g. one /24 per site
+    Hosts given by DNS name are grouped by their domain
+    """
+    def key(host):
+        try:
+            address = ipaddress.ip_address(host["host"])
+        except ValueError:
+            return host["host"].partition(".")[2]
+        return str(ipaddress.ip_network(f"{address}/{min(prefix, address.max_prefixlen)}", strict=False))
+    return key
+
+
+class GroupGate:
+    """
+    Admits hosts so at most limit hosts of one group are in progress at once.
+    A host of a full group waits in its group's queue, holding no thread or
+    task, and starts in place of the next host of its group to finish.
+    Other groups keep the workers busy meanwhile
+    """
+
+    def __init__(self, key, limit):
+        self.key = key
+        self.limit = limit
+        self.running = {}
+        self.waiting = {}
+        self.lock = threading.Lock()
+
+    def admit(self, host):
+        """
+        :return: True if host may start now, False if it was queued for its group, see done
+        """
+        group = self.key(host)
+        with self.lock:
+            running = self.running.get(group, 0)
+            if running < self.limit:
+                self.running[group] = running + 1
+                return True
+            self.waiting.setdefault(group, deque()).append(host)
+            return False
+
+    def done(self, host):
+        """
+        :return: the next queued host of the finished host's group, to start in its place, or None
+        """
+        group = self.key(host)
+        with self.lock:
+            waiting = self.waiting.get(group)
+            if waiting:
+                following = waiting.popleft()
+                if not waiting:
+                    del self.waiting[group]
+                return following
+            self.running[group] -= 1
+            if not self.running[group]:
+                del self.running[group]
+            return None
+
+
+class Scheduler:
+    """
+    Decides when each host may start. Limits how many hosts are in progress
+    at once, how fast logins start across the whole run and, optionally,
+    how many hosts of one group (site, subnet) are in progress at once,
+    through the engines' GroupGate. Also passes the connect and command
+    timeouts down to ConnectHandler
+    """
+
+    def __init__(self, max_concurrency=None, login_rate=None, login_burst=1,
+                 group_key=None, group_limit=None, conn_timeout=None, cmd_timeout=None):
+        """
+        :param max_concurrency: hosts in progress at once. None uses the executor default
+        :param login_rate: logins started per second across the run. None for no limit
+        :param login_burst: logins allowed to start back to back before the rate applies
+        :param group_key: callable mapping a host dict to its group, e.g. subnet_key(24)
+        :param group_limit: hosts of one group in progress at once
+        :param conn_timeout: seconds for TCP connect, netmiko's conn_timeout
+        :param cmd_timeout: seconds for a command to complete, netmiko's timeout
+        """
+        self.max_concurrency = max_concurrency
+        self.bucket = TokenBucket(login_rate, login_burst) if login_rate else None
+        self.group_key = group_key
+        self.group_limit = group_limit
+        self.conn_timeout = conn_timeout
+        self.cmd_timeout = cmd_timeout
+
+    def connection_args(self, host):
+        """
+        :return: a copy of the netmiko host dict with the configured timeouts applied
+        """
+        host = dict(host)
+        if self.conn_timeout is not None:
+            host["conn_timeout"] = self.conn_timeout
+        if self.cmd_timeout is not None:
+            host["timeout"] = self.cmd_timeout
+        return host
+
+    def group_gate(self):
+        """
+        :return: a GroupGate for one run, or None if hosts aren't limited per group
+        """
+        if not self.group_key or not self.group_limit:
+            return None
+        return GroupGate(self.group_key, self.group_limit)
+
+    def login(self, connect, *args):
+        """
+        Wait for a login token, then call connect(*args). Every login attempt goes
+        through here, retries and reconnects of stale sessions included
+        """
+        if self.bucket:
+            self.bucket.acquire()
+        return connect(*args)
+
+    async def login_async(self, connect, *args):
+        # login for the asyncio engine, connect is a coroutine function
+        if self.bucket:
+            await self.bucket.acquire_async()
+        return await connect(*args)
+
+    def run_job(self, job, host, *args):
+        """
+        Run job(host, *args) with the timeouts applied.
+        The job takes its login tokens through login
+        """
+        try:
+            return job(self.connection_args(host), *args)
+        except Exception:
+            logger.exception(f"Unhandled error processing {host['host']}")
+
+    async def run_job_async(self, job, host, *args):
+        return await job(self.connection_args(host), *args)
+
+
+def add_scheduler_arguments(parser):
+    parser.add_argument("--concurrency", help="Maximum number of switches processed at once")
+    parser.add_argument("--login-rate", help="Maximum logins started per second across the run")
+    parser.add_argument("--login-burst", help="Logins allowed to start back to back before --login-rate applies. "
+                                              "Default is 1")
+    parser.add_argument("--conn-timeout", help="Seconds allowed for the TCP connection to a switch")
+    parser.add_argument("--cmd-timeout", help="Seconds allowed for a command to complete")
+    parser.add_argument("--subnet-prefix", help="Group switches by subnet of this prefix length, e.g. 24, "
+                                                "for --subnet-limit")
+    parser.add_argument("--subnet-limit", help="Maximum number of switches of one subnet processed at once")
+
+
+def scheduler_from_args(args):
+    return Scheduler(
+        max_concurrency=int(args.concurrency) if args.concurrency else None,
+        login_rate=float(args.login_rate) if args.login_rate else None,
+        login_burst=int(args.login_burst) if args.login_burst else 1,
+        group_key=subnet_key(int(args.subnet_prefix)) if args.subnet_prefix else None,
+        group_limit=int(args.subnet_limit) if args.subnet_limit else None,
+        conn_timeout=float(args.conn_timeout) if args.conn_timeout else None,
+        cmd_timeout=float(args.cmd_timeout) if args.cmd_timeout else None,
+    )
@@ -0,0 +1,181 @@
+import socket
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+# netmiko's own conn_timeout default
+DEFAULT_CONN_TIMEOUT = 5
+
+# netmiko major versions whose private BaseConnection._open steps netmiko_connect calls
+TIMED_NETMIKO_VERSIONS = (3, 4)
+OPEN_STEPS = ("_modify_connection_params", "establish_connection", "_try_session_preparation")
+
+
+def netmiko_exceptions():
+    """
+    netmiko is imported on first use, so runs that never open a session
+    (--help, --from-raw, --offline) don't pay for paramiko and cryptography
+    :return: netmiko's (authentication, timeout) exception classes
+    """
+    try:
+        from netmiko.ssh_exception import NetmikoAuthenticationException, NetmikoTimeoutException
+    except ImportError:
+        raise ImportError('Netmiko package must be installed. `pip install netmiko`')
+    return NetmikoAuthenticationException, NetmikoTimeoutException
+
+
+def default_port(host):
+    """
+    :return: the port netmiko connects to when host gives none, 23 for telnet device types
+    """
+    return 23 if host.get("device_type", "").endswith("_telnet") else 22
+
+
+def timed_phases_supported(host):
+    """
+    The TCP connect, login and prompt detection can only be timed apart over SSH,
+    with a netmiko version whose private connection steps are known
+    """
+    import netmiko
+    try:
+        major = int(netmiko.__version__.split(".")[0])
+    except (AttributeError, ValueError):
+        return False
+    return (major in TIMED_NETMIKO_VERSIONS and all(hasattr(netmiko.BaseConnection, step) for step in OPEN_STEPS)
+            and not host.get("device_type", "").endswith("_telnet"))
+
+
+def netmiko_connect(host, timings=None):
+    """
+    Open a netmiko session to host
+    :param timings: src.timing.Timings. If given, the TCP connect, the SSH handshake and login,
+                    and the prompt detection are timed as separate phases where supported,
+                    otherwise the whole connection is timed as one connect phase
+    """
+    _, NetmikoTimeoutException = netmiko_exceptions()
+    from netmiko import ConnectHandler
+    if timings is None:
+        return ConnectHandler(**host)
+    if not timed_phases_supported(host):
+        with timings.phase("connect", host["host"]):
+            return ConnectHandler(**host)
+
+    # open the socket here, so the TCP connect is timed apart from the SSH handshake
+    with timings.phase("tcp_connect", host["host"]):
+        try:
+            sock = socket.create_connection((host["host"], host.get("port") or default_port(host)),
+                                            timeout=host.get("conn_timeout") or DEFAULT_CONN_TIMEOUT)
+        except OSError as e:
+            # what netmiko raises for a failed TCP connect, so retries apply as before
+            raise NetmikoTimeoutException(f"TCP connection to device failed: {host['host']}: {e!r}")
+    connection = ConnectHandler(**host, sock=sock, auto_connect=False)
+    # the steps of netmiko's BaseConnection._open
+    with timings.phase("ssh_login", host["host"]):
+        connection._modify_connection_params()
+        connection.establish_connection()
+    with timings.phase("prompt", host["host"]):
+        connection._try_session_preparation()
+    return connection
+
+
+class SessionPool:
+    """
+    Keeps authenticated SSH sessions so several phases of work on one device
+    (e.g. discovery with show commands, then a config push) share one login.
+    Every session is disconnected deterministically: when it is released
+    with keep=False, when it is evicted because more than max_idle sessions
+    are idle, when it fails, or by close_all at the end of the run
+    """
+
+    def __init__(self, connect=netmiko_connect, max_idle=100):
+        """
+        :param connect: callable taking a netmiko host dict and returning a connected session
+        :param max_idle: most sessions kept open while not in use, oldest are closed first
+        """
+        self.connect = connect
+        self.max_idle = max_idle
+        self.idle = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.closed = 0
+
+    @staticmethod
+    def key(host):
+        return host["host"], host.get("port"), host.get("username")
+
+    @contextmanager
+    def session(self, host, keep=True):
+        """
+        Borrow a session to host, reusing an idle one when there is one
+        :param host: netmiko host dict
+        :param keep: return the session to the pool afterwards instead of disconnecting it
+        """
+        connection = self._acquire(host)
+        try:
+            yield connection
+        except BaseException:
+            # state of the session is unknown after an error, never reuse it
+            self._disconnect(connection)
+            raise
+        if keep:
+            self._release(host, connection)
+        else:
+            self._disconnect(connection)
+
+    def _acquire(self, host):
+        key = self.key(host)
+        with self.lock:
+            connection = self.idle.pop(key, None)
+        if connection is not None:
+            if self._is_alive(connection):
+                with self.lock:
+                    self.hits += 1
+                return connection
+            with self.lock:
+                self.stale += 1
+            self._disconnect(connection)
+        with self.lock:
+            self.misses += 1
+        return self.connect(host)
+
+    def _release(self, host, connection):
+        evicted = []
+        with self.lock:
+            self.idle[self.key(host)] = connection
+            while len(self.idle) > self.max_idle:
+                evicted.append(self.idle.popitem(last=False)[1])
+        for connection in evicted:
+            self._disconnect(connection)
+
+    @staticmethod
+    def _is_alive(connection):
+        try:
+            return connection.is_alive()
+        except Exception:
+            return False
+
+    def _disconnect(self, connection):
+        try:
+            connection.disconnect()
+        except Exception as e:
+            logger.debug(f"Error disconnecting session: {e!r}")
+        with self.lock:
+            self.closed += 1
+
+    def close_all(self):
+        with self.lock:
+            connections = list(self.idle.values())
+            self.idle.clear()
+        for connection in connections:
+            self._disconnect(connection)
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "stale": self.stale,
+                    "closed": self.closed, "idle": len(self.idle)}
@@ -0,0 +1,144 @@
+"""
+Sharded runs. With --shard i/N each process takes the hosts whose IP
+hashes to shard i of N, so N processes, on one machine or several, cover
+the inventory between them without overlap. A sharded run doesn't write
+the workbook, each process appends its results to its own partial file,
+hosts.shard-i-of-N.jsonl next to the workbook. The partial files are
+merged back into the sheet with one write. Run from the repository root:
+
+    python -m src.sharding hosts.xlsx --sheet "Sheet 1"
+    python -m src.sharding hosts.xlsx --sheet "Sheet 1" hosts.shard-1-of-4.jsonl hosts.shard-2-of-4.jsonl
+"""
+import zlib
+import json
+import logging
+import argparse
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def parse_shard(text):
+    """
+    :param text: 'i/N', shards counted from 1, e.g. '2/4'
+    :return: (i, N)
+    """
+    try:
+        index, count = (int(part) for part in str(text).split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard {text!r}, expected e.g. 2/4")
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard {text!r}, the shard must be from 1 to {max(count, 1)}")
+    return index, count
+
+
+def shard_of(host, count):
+    """
+    The shard, from 1 to count, a host belongs to. The same in every process and on every machine
+    :param host: host IP or DNS name
+    """
+    return zlib.crc32(str(host).encode()) % count + 1
+
+
+def in_shard(hosts, index, count):
+    """
+    Lazily filter netmiko host dicts to those of shard index of count
+    """
+    return (host for host in hosts if shard_of(host["host"], count) == index)
+
+
+def partial_path(spreadsheet, index, count):
+    spreadsheet = Path(spreadsheet)
+    return spreadsheet.with_name(f"{spreadsheet.stem}.shard-{index}-of-{count}.jsonl")
+
+
+class PartialResults:
+    """
+    Results sink of a sharded run. Same interface as ExcelProcessor, but every
+    update is appended to a JSON lines file as it happens, flushed line by line
+    like the Journal, instead of rewriting the workbook
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.file = self.path.open("a", buffering=1)
+
+    def update_process_column(self, key, result):
+        status = "success" if result else "failed"
+        return self.update_sheet(key, status, "status")
+
+    def update_sheet(self, key, value, column):
+        line = json.dumps({"key": key, "column": column, "value": value})
+        with self.lock:
+            self.file.write(line + "\n")
+        return value
+
+    def update_ports_column(self, key, port_info):
+        ports = " ".join(port_info)
+        self.update_sheet(key, ports, "ports")
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def load_partial(path):
+    """
+    :return: list of (key, column, value) updates in the order they were made
+    """
+    updates = []
+    with open(path) as file:
+        for line_number, line in enumerate(file, 1):
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # a run killed mid-write leaves a partial last line
+                logger.debug(f"Skipping unreadable line {line_number} in {path}")
+                continue
+            updates.append((entry["key"], entry["column"], entry["value"]))
+    return updates
+
+
+def merge_partials(spreadsheet, sheet, paths=None):
+    """
+    Apply the updates of every partial file to the sheet and write the workbook once
+    :param paths: partial files. Default is every hosts.shard-*.jsonl next to the workbook
+    :return: number of updates applied
+    """
+    from src.excel_processor import ExcelProcessor
+    spreadsheet = Path(spreadsheet)
+    if not paths:
+        paths = sorted(spreadsheet.parent.glob(f"{spreadsheet.stem}.shard-*.jsonl"))
+    updates = []
+    for path in paths:
+        updates.extend(load_partial(path))
+    if not updates:
+        return 0
+
+    # apply_updates puts every update in the status store, close() writes the workbook once
+    excel = ExcelProcessor(spreadsheet, sheet, None, None, ignore_status=True, flush_every=len(updates) + 1,
+                           flush_interval=10 ** 6)
+    try:
+        excel.apply_updates(updates)
+    finally:
+        excel.close()
+    return len(updates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the partial results of a sharded run into the workbook")
+    parser.add_argument("spreadsheet", help="The hosts workbook the shards were run against")
+    parser.add_argument("partials", nargs="*", help="Partial result files. Default is every "
+                                                    "<workbook>.shard-*.jsonl next to the workbook")
+    parser.add_argument("--sheet", default="Sheet 1", help="The sheet to update. Default is Sheet 1")
+    args = parser.parse_args()
+
+    count = merge_partials(args.spreadsheet, args.sheet, args.partials)
+    print(f"Merged {count} updates into {args.spreadsheet}")
+
+
+if __name__ == '__main__':
+    main()
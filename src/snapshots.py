@@ -0,0 +1,127 @@
+"""
+Per-switch snapshots of the MAC -> port -> IP mapping, and the changes between them.
+
+A snapshot is a gzipped JSON file per switch in the snapshot directory.
+Port names are stored once each and entries refer to them by position:
+
+    {"hostname": "sw1", "ports": ["Gi1/0/1", ...],
+     "entries": [[vlan, "0011.2233.4455", port position, "10.60.0.1" or null], ...]}
+"""
+import gzip
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from src.files import write_atomic
+
+logger = logging.getLogger(__name__)
+
+ADDED = "added"
+REMOVED = "removed"
+MOVED = "moved"
+
+CHANGES_FILE = "changes.jsonl"
+
+
+def snapshot_from_scan(vlan_data):
+    """
+    :param vlan_data: Dict of VLAN -> Dict of port -> list of HostRecord, from scan_device_vlans
+    :return: Dict of (vlan, mac) -> (port, ip)
+    """
+    return {(vlan, record.mac): (port, record.ip)
+            for vlan, ports in vlan_data.items()
+            for port, records in ports.items()
+            for record in records}
+
+
+def diff_snapshots(old, new):
+    """
+    Compare two snapshots
+    :return: list of (change, vlan, mac, old (port, ip) or None, new (port, ip) or None),
+             in VLAN then MAC order. A MAC whose port or IP changed counts as moved
+    """
+    changes = []
+    for key in sorted(old.keys() | new.keys()):
+        before = old.get(key)
+        after = new.get(key)
+        if before == after:
+            continue
+        if before is None:
+            changes.append((ADDED, *key, None, after))
+        elif after is None:
+            changes.append((REMOVED, *key, before, None))
+        else:
+            changes.append((MOVED, *key, before, after))
+    return changes
+
+
+class SnapshotStore:
+    """
+    Keeps the latest snapshot of each switch and records the changes found against it
+    in changes.jsonl, one JSON line per change
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        # line buffered, like the journal
+        self.changes_file = (self.directory / CHANGES_FILE).open("a", buffering=1)
+
+    def path(self, switch):
+        return self.directory / f"{switch}.json.gz"
+
+    def load(self, switch):
+        """
+        :return: the switch's last snapshot, or None if there isn't one
+        """
+        path = self.path(switch)
+        if not path.is_file():
+            return None
+        try:
+            with gzip.open(path, "rt") as file:
+                data = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.error(f"Ignoring unreadable snapshot {path}: {e!r}")
+            return None
+        ports = data["ports"]
+        return {(vlan, mac): (ports[port], ip) for vlan, mac, port, ip in data["entries"]}
+
+    def save(self, switch, hostname, snapshot):
+        ports = {}
+        entries = []
+        for (vlan, mac), (port, ip) in sorted(snapshot.items()):
+            entries.append([vlan, mac, ports.setdefault(port, len(ports)), ip])
+        data = json.dumps({"hostname": hostname, "ports": list(ports), "entries": entries}, separators=(",", ":"))
+        write_atomic(self.path(switch), gzip.compress(data.encode()))
+
+    def update(self, switch, hostname, snapshot):
+        """
+        Diff the switch's new snapshot against its last one, record the changes and
+        keep the new snapshot
+        :return: list of changes from diff_snapshots, or None if this is the switch's first snapshot
+        """
+        previous = self.load(switch)
+        changes = None if previous is None else diff_snapshots(previous, snapshot)
+        if changes:
+            now = round(time.time(), 3)
+            lines = []
+            for change, vlan, mac, before, after in changes:
+                entry = {"time": now, "switch": switch, "hostname": hostname, "change": change,
+                         "vlan": vlan, "mac": mac}
+                if before:
+                    entry["old_port"], entry["old_ip"] = before
+                if after:
+                    entry["port"], entry["ip"] = after
+                lines.append(json.dumps(entry) + "\n")
+            with self.lock:
+                self.changes_file.write("".join(lines))
+        self.save(switch, hostname, snapshot)
+        return changes
+
+    def close(self):
+        with self.lock:
+            if self.changes_file is not None:
+                self.changes_file.close()
+                self.changes_file = None
@@ -0,0 +1,180 @@
+"""
+Per-host status of a workbook inventory, kept in SQLite while a run is in
+progress. The sheet's hosts are imported when it is loaded, results are
+written to the store as they arrive and exported back to the sheet once,
+when the run finishes, so the workbook is read and written once per run
+whatever the number of hosts.
+
+The store is hosts.status.db next to hosts.xlsx, in WAL mode, so it can
+be read with the sqlite3 shell during a run and several processes can
+write to it. Results of a run killed before its export are written to
+the sheet the next time it is loaded, or with:
+
+    python -m src.status_store hosts.xlsx --sheet "Sheet 1"
+"""
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# the sheet columns results are written to
+COLUMNS = ("status", "ports")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hosts (
+    ip TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    hostname TEXT,
+    status TEXT,
+    ports TEXT,
+    updated REAL
+) WITHOUT ROWID
+"""
+
+
+def store_path(spreadsheet):
+    spreadsheet = Path(spreadsheet)
+    return spreadsheet.with_name(f"{spreadsheet.stem}.status.db")
+
+
+class StatusStore:
+    """
+    Thread-safe, every thread writes through its own connection.
+    A row's updated time is set by every result written to it and cleared
+    once the results are exported, so unexported results survive a killed run
+    """
+
+    def __init__(self, path, timeout=30.0):
+        """
+        :param path: database file, created if missing
+        :param timeout: seconds a writer waits for another to commit before failing
+        """
+        self.path = Path(path)
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.connections = []
+        with self.connection() as connection:
+            connection.execute(SCHEMA)
+
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(str(self.path), timeout=self.timeout, check_same_thread=False)
+            # WAL lets readers and the writer work at the same time, NORMAL syncs on checkpoints only
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def import_hosts(self, rows):
+        """
+        Add the sheet's hosts, or refresh those already stored. A host's status is only
+        taken from the sheet while the store holds no unexported result for it, so
+        results written by another process sharing the store are never lost
+        :param rows: iterable of (position, ip, hostname, status). The first row of a duplicate IP is kept
+        :return: number of hosts in the sheet
+        """
+        seen = set()
+
+        def first_rows():
+            for row in rows:
+                if row[1] not in seen:
+                    seen.add(row[1])
+                    yield row
+
+        with self.connection() as connection:
+            connection.executemany(
+                "INSERT INTO hosts (position, ip, hostname, status) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (ip) DO UPDATE SET position = excluded.position, hostname = excluded.hostname, "
+                "status = CASE WHEN updated IS NULL THEN excluded.status ELSE status END",
+                first_rows())
+        return len(seen)
+
+    def update_many(self, updates):
+        """
+        Write a batch of results in one transaction
+        :param updates: list of (key, column, value) tuples, column one of COLUMNS
+        :return: number of updates that matched a host
+        """
+        now = time.time()
+        by_column = {}
+        for key, column, value in updates:
+            if column not in COLUMNS:
+                logger.error(f"Not storing {column} for {key}, results are only kept for {', '.join(COLUMNS)}")
+                continue
+            by_column.setdefault(column, []).append((value, now, key))
+
+        applied = 0
+        with self.connection() as connection:
+            for column, params in by_column.items():
+                # column is one of COLUMNS, never caller text
+                cursor = connection.executemany(f"UPDATE hosts SET {column} = ?, updated = ? WHERE ip = ?", params)
+                applied += cursor.rowcount
+        if applied < sum(len(params) for params in by_column.values()):
+            logger.debug(f"{self.path}: some updated hosts are not in the inventory")
+        return applied
+
+    def get(self, ip):
+        """
+        :return: Dict of the host's row, or None if it isn't in the inventory
+        """
+        cursor = self.connection().execute(
+            "SELECT ip, position, hostname, status, ports, updated FROM hosts WHERE ip = ?", (ip,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip(("ip", "position", "hostname", "status", "ports", "updated"), row))
+
+    def unexported(self):
+        """
+        :return: (list of (key, column, value) updates written since the last export, in sheet order,
+                  time to pass to mark_exported once they are written)
+        """
+        until = time.time()
+        cursor = self.connection().execute(
+            "SELECT ip, status, ports FROM hosts WHERE updated IS NOT NULL ORDER BY position")
+        updates = []
+        for ip, status, ports in cursor:
+            updates.append((ip, "status", status))
+            if ports is not None:
+                updates.append((ip, "ports", ports))
+        return updates, until
+
+    def mark_exported(self, until):
+        """
+        :param until: the time returned by unexported. Results written since stay unexported
+        """
+        with self.connection() as connection:
+            connection.execute("UPDATE hosts SET updated = NULL WHERE updated <= ?", (until,))
+
+    def close(self):
+        with self.lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+        self.local = threading.local()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the results of an interrupted run from the status store "
+                                                 "to the workbook")
+    parser.add_argument("spreadsheet", help="The hosts workbook")
+    parser.add_argument("--sheet", default="Sheet 1", help="The sheet to update. Default is Sheet 1")
+    args = parser.parse_args()
+
+    # loading the sheet writes out whatever the store holds
+    from src.excel_processor import ExcelProcessor
+    excel = ExcelProcessor(args.spreadsheet, args.sheet, None, None, ignore_status=True)
+    excel.close()
+    print(f"Exported {excel.recovered} updates from {excel.store.path} into {args.spreadsheet}")
+
+
+if __name__ == '__main__':
+    main()
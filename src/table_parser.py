@@ -0,0 +1,287 @@
+"""
+Single pass parsers for 'show mac address-table' and 'show ip arp'.
+
+Entries are matched with one multi-line regex over the raw output, so
+no list of lines is built. Columns are found by content rather than by
+position, which covers the IOS, IOS-XE and NX-OS layouts:
+
+    IOS/IOS-XE   60    0011.2233.4455    DYNAMIC     Gi1/0/1
+    IOS-XE       60    0011.2233.4455    DYNAMIC pv  Gi1/0/1
+    Cat6k       *  60  0011.2233.4455    dynamic  Yes     0   Gi1/1
+    NX-OS       * 60     0011.2233.4455   dynamic  0         F      F    Eth1/1
+
+    IOS         Internet  10.60.0.1   5   0011.2233.4455  ARPA   Vlan60
+    NX-OS       10.60.0.1       00:03:12  0011.2233.4455  Vlan60
+"""
+import re
+import sys
+import socket
+from array import array
+from collections import namedtuple, OrderedDict
+from src.cisco_switches import VendorLookup
+from src.oui_index import load_oui_index, mac_to_int
+
+# VendorLookup over the vendor index of a parser process, see init_scan_worker
+_worker_vendors = None
+
+# VLANs a parser process partitions by, see init_scan_worker
+_worker_vlans = None
+
+# whether a parser process builds CompactHosts, see init_scan_worker
+_worker_compact = False
+
+# the type name must match the attribute so records can be pickled back from parser processes
+HostRecord = namedtuple("HostRecord", "ip, mac, port, vendor, vlan", defaults=(None,))
+
+_MAC = r"(?:[0-9a-fA-F]{4}\.[0-9a-fA-F]{4}\.[0-9a-fA-F]{4}|(?:[0-9a-fA-F]{2}[:-]){5}[0-9a-fA-F]{2})"
+
+MAC_ENTRY = re.compile(
+    r"^[ \t*+GORC~]*(?P<vlan>\d+|-|All|N/A)[ \t]+(?P<mac>" + _MAC + r")[ \t]+(?P<type>\w+)"
+    r"[ \t]+[^\n]*?(?P<port>\S+)[ \t\r]*$",
+    re.MULTILINE,
+)
+
+ARP_ENTRY = re.compile(
+    r"^[ \t*]*(?:Internet[ \t]+)?(?P<ip>\d{1,3}(?:\.\d{1,3}){3})[ \t]+\S+[ \t]+(?P<mac>" + _MAC + r")",
+    re.MULTILINE,
+)
+
+
+def iter_mac_entries(output, dynamic_only=True):
+    """
+    Lazily yield (vlan, mac, port) for each entry of 'show mac address-table'
+    :param dynamic_only: skip static, system and other non dynamic entries
+    """
+    for match in MAC_ENTRY.finditer(output):
+        if dynamic_only and match.group("type").lower() != "dynamic":
+            continue
+        yield match.group("vlan", "mac", "port")
+
+
+def iter_arp_entries(output):
+    """
+    Lazily yield (ip, mac) for each complete entry of 'show ip arp'
+    """
+    for match in ARP_ENTRY.finditer(output):
+        yield match.group("ip", "mac")
+
+
+def parse_vlan_list(text):
+    """
+    Parse a VLAN list such as '10,20,60-80'
+    :return: sorted tuple of VLAN ids
+    """
+    vlans = set()
+    for part in str(text).split(","):
+        first, _, last = part.strip().partition("-")
+        try:
+            first = int(first)
+            last = int(last) if last else first
+        except ValueError:
+            raise ValueError(f"Invalid VLAN {part.strip()!r} in {text!r}")
+        if not 1 <= first <= last <= 4094:
+            raise ValueError(f"Invalid VLAN range {part.strip()!r} in {text!r}")
+        vlans.update(range(first, last + 1))
+    return tuple(sorted(vlans))
+
+
+def _vendor_lookup(vendors):
+    # a VendorLookup is shared across calls, anything else gets a cache for this call
+    return vendors if isinstance(vendors, VendorLookup) else VendorLookup(vendors)
+
+
+def _order_ports(ports):
+    # sorted is stable, so ports with the same count stay in the order they were first seen
+    ordered = sorted(ports.items(), key=lambda item: len(item[1]), reverse=True)
+    return OrderedDict((port, list(records.values())) for port, records in ordered if records)
+
+
+def scan_device(mac_output, arp_output, vendors):
+    """
+    Build the per-port host records of one device in a single pass over its MAC table.
+    Replaces line_parser, sort_by_mac, count_mac_address_by_port,
+    parse_mac_and_arp_data, map_hosts_to_ip and sort_and_order_data
+    :param mac_output: raw 'show mac address-table' output
+    :param arp_output: raw 'show ip arp' output, or None
+    :param vendors: VendorLookup, OuiIndex or vendor dict, see find_mac_vendor
+    :return: OrderedDict of port -> list of HostRecord, ports with the most MACs first
+    """
+    ip_by_mac = {mac: ip for ip, mac in iter_arp_entries(arp_output)} if arp_output else {}
+
+    # port -> {mac: record}. A MAC seen twice keeps only its last port, as sort_by_mac did
+    ports = {}
+    port_of = {}
+    for _, mac, port in iter_mac_entries(mac_output):
+        previous = port_of.get(mac)
+        if previous is not None:
+            del ports[previous][mac]
+        port_of[mac] = port
+        ports.setdefault(port, {})[mac] = None
+
+    # every vendor of the device in one call
+    vendor_of = dict(zip(port_of, _vendor_lookup(vendors).lookup_many(port_of)))
+    for port, records in ports.items():
+        for mac in records:
+            records[mac] = HostRecord(ip_by_mac.get(mac), mac, port, vendor_of[mac])
+    return _order_ports(ports)
+
+
+def scan_device_vlans(mac_output, arp_output, vendors, vlans):
+    """
+    scan_device for several VLANs at once. One pass over an unfiltered MAC table
+    partitions its entries by VLAN, entries of other VLANs are skipped
+    :param vlans: VLAN ids to report
+    :return: OrderedDict of VLAN id -> OrderedDict of port -> list of HostRecord,
+             in VLAN order, VLANs without any entries left out
+    """
+    ip_by_mac = {mac: ip for ip, mac in iter_arp_entries(arp_output)} if arp_output else {}
+    wanted = {str(vlan): vlan for vlan in vlans}
+
+    # vlan -> port -> {mac: record}. Within a VLAN a MAC seen twice keeps only its last port
+    by_vlan = {}
+    port_of = {}
+    for vlan_name, mac, port in iter_mac_entries(mac_output):
+        vlan = wanted.get(vlan_name)
+        if vlan is None:
+            continue
+        ports = by_vlan.setdefault(vlan, {})
+        previous = port_of.get((vlan, mac))
+        if previous is not None:
+            del ports[previous][mac]
+        port_of[vlan, mac] = port
+        ports.setdefault(port, {})[mac] = None
+
+    # every vendor of the device in one call
+    macs = {mac: None for _, mac in port_of}
+    vendor_of = dict(zip(macs, _vendor_lookup(vendors).lookup_many(macs)))
+    for vlan, ports in by_vlan.items():
+        for port, records in ports.items():
+            for mac in records:
+                records[mac] = HostRecord(ip_by_mac.get(mac), mac, port, vendor_of[mac], vlan)
+    return OrderedDict((vlan, _order_ports(by_vlan[vlan])) for vlan in sorted(by_vlan))
+
+
+class CompactHosts:
+    """
+    The host records of one port, held in arrays rather than one HostRecord
+    and three strings per MAC: about 20 bytes per MAC instead of 250.
+    Behaves as a read-only list of HostRecord, built on the fly. MACs come
+    back in Cisco notation (0011.2233.4455) whatever the switch printed
+    """
+    __slots__ = ("port", "vlan", "macs", "ips", "vendors")
+
+    def __init__(self, port, vlan=None):
+        self.port = port
+        self.vlan = vlan
+        self.macs = array("Q")
+        # IPv4 addresses as integers, 0 for no ARP entry
+        self.ips = array("L")
+        # interned vendor names, shared by every record of the run
+        self.vendors = []
+
+    def append(self, mac, ip, vendor):
+        self.macs.append(mac)
+        self.ips.append(ip)
+        self.vendors.append(vendor)
+
+    def __len__(self):
+        return len(self.macs)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        mac = self.macs[position]
+        ip = self.ips[position]
+        return HostRecord(socket.inet_ntoa(ip.to_bytes(4, "big")) if ip else None,
+                          f"{mac >> 32 & 0xFFFF:04x}.{mac >> 16 & 0xFFFF:04x}.{mac & 0xFFFF:04x}",
+                          self.port, self.vendors[position], self.vlan)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __getstate__(self):
+        return self.port, self.vlan, self.macs, self.ips, self.vendors
+
+    def __setstate__(self, state):
+        self.port, self.vlan, self.macs, self.ips, self.vendors = state
+        self.port = sys.intern(self.port)
+        self.vendors = [sys.intern(vendor) for vendor in self.vendors]
+
+
+def _ip_to_int(ip):
+    try:
+        return int.from_bytes(socket.inet_aton(ip), "big")
+    except OSError:
+        return 0
+
+
+def scan_device_vlans_compact(mac_output, arp_output, vendors, vlans):
+    """
+    scan_device_vlans for low memory runs. Same result, but each port's
+    records are a CompactHosts and MACs and IPs are held as integers while parsing
+    """
+    ip_by_mac = {}
+    if arp_output:
+        for ip, mac in iter_arp_entries(arp_output):
+            ip_by_mac[mac_to_int(mac)] = _ip_to_int(ip)
+    wanted = {str(vlan): vlan for vlan in vlans}
+    vendors = _vendor_lookup(vendors)
+
+    # vlan -> {mac: port} in the order MACs were last seen, and vlan -> ports in the order first seen
+    macs_by_vlan = {}
+    ports_by_vlan = {}
+    for vlan_name, mac, port in iter_mac_entries(mac_output):
+        vlan = wanted.get(vlan_name)
+        if vlan is None:
+            continue
+        value = mac_to_int(mac)
+        port = sys.intern(port)
+        macs = macs_by_vlan.setdefault(vlan, {})
+        # a MAC seen twice keeps only its last port, and moves to the end of it
+        macs.pop(value, None)
+        macs[value] = port
+        ports_by_vlan.setdefault(vlan, {}).setdefault(port, None)
+
+    result = OrderedDict()
+    for vlan in sorted(macs_by_vlan):
+        ports = {port: CompactHosts(port, vlan) for port in ports_by_vlan[vlan]}
+        macs = macs_by_vlan[vlan]
+        # every vendor of the VLAN in one call, 12 hex digits is a notation VendorLookup keys on
+        found = vendors.lookup_many([f"{value:012x}" for value in macs])
+        for (value, port), vendor in zip(macs.items(), found):
+            ports[port].append(value, ip_by_mac.get(value, 0), vendor)
+        result[vlan] = OrderedDict(sorted(((port, hosts) for port, hosts in ports.items() if hosts),
+                                          key=lambda item: len(item[1]), reverse=True))
+    return result
+
+
+def init_scan_worker(vendor_file, vlans=None, compact=False):
+    """
+    Process pool initializer. Memory-maps the vendor index once per parser process
+    :param vlans: if given, scan_raw_output partitions the output by these VLANs
+    :param compact: build CompactHosts instead of lists of HostRecord. Needs vlans
+    """
+    global _worker_vendors, _worker_vlans, _worker_compact
+    _worker_vendors = VendorLookup(load_oui_index(vendor_file))
+    _worker_vlans = vlans
+    _worker_compact = compact
+
+
+def scan_raw_output(mac_output, arp_output):
+    """
+    scan_device, scan_device_vlans or scan_device_vlans_compact,
+    for a parser process set up with init_scan_worker
+    """
+    if _worker_vlans and _worker_compact:
+        return scan_device_vlans_compact(mac_output, arp_output, _worker_vendors, _worker_vlans)
+    if _worker_vlans:
+        return scan_device_vlans(mac_output, arp_output, _worker_vendors, _worker_vlans)
+    return scan_device(mac_output, arp_output, _worker_vendors)
+
+
+def scan_counters():
+    """
+    Vendor cache hits and misses of this parser process since the last call,
+    for AnalysisPipeline's counters
+    """
+    return _worker_vendors.take_counts() if _worker_vendors is not None else {}
@@ -0,0 +1,106 @@
+"""
+Per-host, per-phase timings of a run.
+
+Each phase (TCP connect, SSH handshake and login, prompt detection,
+commands, parsing, the Excel write) is recorded as a span. At the end
+of the run summary() reports p50/p95/p99 per phase, the slowest hosts
+and the hosts per second achieved, and write_chrome_trace() exports
+the spans for chrome://tracing or https://ui.perfetto.dev
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+def percentile(ordered, fraction):
+    """
+    Nearest-rank percentile
+    :param ordered: sorted list of values, not empty
+    :param fraction: e.g. 0.95
+    """
+    rank = max(int(round(fraction * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class Timings:
+    """
+    Collects (phase, host, start, duration, thread) spans from any thread.
+    Times are seconds from when the Timings was created
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        # list.append is atomic, so spans can be added from any thread without a lock
+        self.spans = []
+
+    @contextmanager
+    def phase(self, name, host=None):
+        """
+        Time the with block as phase name of host. Failed phases are recorded too
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.spans.append((name, host, start - self.origin, end - start, threading.get_ident()))
+
+    def add(self, name, host, duration, thread=None):
+        """
+        Record a phase timed elsewhere, e.g. in a parser process, as having just ended
+        """
+        end = time.perf_counter() - self.origin
+        self.spans.append((name, host, end - duration, duration, thread))
+
+    def elapsed(self):
+        return time.perf_counter() - self.origin
+
+    def summary(self, slowest=10):
+        """
+        :param slowest: number of slowest hosts to list
+        :return: the report as lines of text
+        """
+        wall = self.elapsed()
+        phases = {}
+        per_host = {}
+        for name, host, _, duration, _ in self.spans:
+            phases.setdefault(name, []).append(duration)
+            if host is not None:
+                per_host[host] = per_host.get(host, 0.0) + duration
+
+        lines = [f"{'phase':<16}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}{'total':>11}"]
+        for name, durations in phases.items():
+            durations.sort()
+            lines.append(f"{name:<16}{len(durations):>8}"
+                         f"{percentile(durations, 0.50):>10.3f}{percentile(durations, 0.95):>10.3f}"
+                         f"{percentile(durations, 0.99):>10.3f}{durations[-1]:>10.3f}{sum(durations):>11.2f}")
+
+        if per_host:
+            lines.append("Slowest hosts, seconds over all phases:")
+            for host, total in sorted(per_host.items(), key=lambda item: item[1], reverse=True)[:slowest]:
+                lines.append(f"\t{host}: {total:.3f}")
+        lines.append(f"{len(per_host)} hosts in {wall:.2f}s, {len(per_host) / wall if wall else 0:.1f} hosts/sec")
+        return lines
+
+    def write_chrome_trace(self, path):
+        """
+        Write the spans in Chrome's trace event format, one complete event per span
+        """
+        pid = os.getpid()
+        events = []
+        for name, host, start, duration, thread in self.spans:
+            events.append({
+                "name": name,
+                "cat": "host",
+                "ph": "X",
+                "ts": round(start * 1e6),
+                "dur": round(duration * 1e6),
+                "pid": pid,
+                # phases timed in parser processes have no thread here
+                "tid": thread if thread is not None else "parser",
+                "args": {"host": host},
+            })
+        with open(path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
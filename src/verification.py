@@ -0,0 +1,214 @@
+"""
+Declarative verification of command output.
+
+A command set carries its own success criteria as directive lines among
+the commands, which are never sent to the switch:
+
+    ! forbid: Loop guard
+    ! expect-re: Loopguard Default\\s+is disabled
+
+'expect' patterns must appear in the output, 'forbid' patterns must not.
+The plain forms are literal strings, the '-re' forms regular expressions.
+A pattern matches within one line of output, as the checks in
+src.cisco_switches do.
+
+One alternation of every pattern finds, in a single pass, the lines any
+of them may match. Each pattern is then confirmed on its own on those
+lines only, so matches of different patterns may overlap and a pattern's
+groups and inline flags mean what they would alone. Patterns with
+backreferences or named groups can't share the alternation and are
+searched on their own. The output is checked either whole with
+Verifier.verify or chunk by chunk as it arrives with Verifier.stream,
+which reports a forbidden match as soon as it is seen so the run can stop
+there
+"""
+import re
+import typing
+
+EXPECT = "expect"
+FORBID = "forbid"
+
+# what IOS prints for a command it didn't take. Checked on every block push,
+# where the commands are sent without waiting to see each one accepted
+IOS_ERROR_PATTERNS = ("% Invalid input", "% Incomplete command", "% Ambiguous command")
+
+DIRECTIVE = re.compile(r"!\s*(?P<kind>expect|forbid)(?P<regex>-re)?\s*:\s?(?P<pattern>.*)$")
+
+# what keeps a regex out of the combined alternation, where group numbers and names are shared
+BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=")
+# global inline flags, which must start a pattern, become scoped flags in the alternation
+GLOBAL_FLAGS = re.compile(r"\(\?([aiLmsux]+)\)")
+
+
+class Rule(typing.NamedTuple):
+    kind: str
+    pattern: str
+    regex: bool = False
+
+    def __str__(self):
+        return f"{self.kind}{'-re' if self.regex else ''}: {self.pattern}"
+
+
+def ios_error_rules():
+    return [Rule(FORBID, pattern) for pattern in IOS_ERROR_PATTERNS]
+
+
+def parse_command_set(file):
+    """
+    Split a commands file into the commands to send and the verification directives
+    :param file: iterable of lines
+    :return: (list of commands, list of Rules)
+    """
+    cmds = []
+    rules = []
+    for line in file:
+        line = line.strip()
+        directive = DIRECTIVE.match(line)
+        if directive is None:
+            cmds.append(line)
+            continue
+        rules.append(Rule(directive["kind"], directive["pattern"], bool(directive["regex"])))
+    return cmds, rules
+
+
+class Verdict(typing.NamedTuple):
+    forbidden: tuple
+    missing: tuple
+
+    @property
+    def passed(self):
+        return not self.forbidden and not self.missing
+
+    def reasons(self):
+        return [f"found {rule}" for rule in self.forbidden] + [f"missing {rule}" for rule in self.missing]
+
+
+def _alternative(rule, pattern):
+    """
+    :param pattern: the rule compiled alone
+    :return: the rule's pattern as one alternative of the combined prefilter, or None if it must be searched alone
+    """
+    if not rule.regex:
+        return re.escape(rule.pattern)
+    if pattern.groupindex or BACKREFERENCE.search(rule.pattern):
+        return None
+    flags = GLOBAL_FLAGS.match(rule.pattern)
+    source = f"(?{flags[1]}:{rule.pattern[flags.end():]})" if flags else f"(?:{rule.pattern})"
+    try:
+        re.compile(source)
+    except re.error:
+        return None
+    return source
+
+
+class Verifier:
+    """
+    The rules of one command set, each compiled once, and the prefilter
+    combining them. Raises re.error for an invalid pattern
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.patterns = [re.compile(rule.pattern if rule.regex else re.escape(rule.pattern), re.MULTILINE)
+                         for rule in self.rules]
+        alternatives = [_alternative(rule, pattern) for rule, pattern in zip(self.rules, self.patterns)]
+        # indexes of the rules found through the prefilter, and of those searched alone
+        self.combined = [i for i, source in enumerate(alternatives) if source is not None]
+        self.alone = [i for i, source in enumerate(alternatives) if source is None]
+        self.prefilter = re.compile("|".join(alternatives[i] for i in self.combined), re.MULTILINE) \
+            if self.combined else None
+
+    def stream(self):
+        return VerificationStream(self)
+
+    def verify(self, output):
+        stream = self.stream()
+        stream.feed(output)
+        return stream.close()
+
+
+class VerificationStream:
+    """
+    Verifies output fed to it in chunks of any size. Only whole lines are
+    scanned, the part after the last newline waits for the next chunk
+    """
+
+    def __init__(self, verifier):
+        self.verifier = verifier
+        self.pending = ""
+        self.matched = set()
+        self.forbidden = []
+
+    @property
+    def failed(self):
+        return bool(self.forbidden)
+
+    def feed(self, chunk):
+        """
+        :return: True once a forbidden pattern has been seen, the rest of the run can be skipped
+        """
+        text = self.pending + chunk
+        end = text.rfind("\n") + 1
+        self.pending = text[end:]
+        self._scan(text, end)
+        return self.failed
+
+    def close(self):
+        """
+        Scan what is left and return the Verdict
+        """
+        self._scan(self.pending, len(self.pending))
+        self.pending = ""
+        rules = self.verifier.rules
+        missing = tuple(rule for i, rule in enumerate(rules) if rule.kind == EXPECT and i not in self.matched)
+        return Verdict(tuple(self.forbidden), missing)
+
+    def _scan(self, text, end):
+        """
+        Match the rules against text[:end], which is whole lines
+        """
+        if not end:
+            return
+        verifier = self.verifier
+        waiting = [i for i in verifier.combined if i not in self.matched]
+        position = 0
+        while waiting:
+            match = verifier.prefilter.search(text, position, end)
+            if match is None:
+                break
+            # no pattern matches before the leftmost match of any of them, so only the lines
+            # it spans need confirming, overlapping matches of other patterns included
+            start = text.rfind("\n", 0, match.start()) + 1
+            stop = _line_end(text, max(match.end() - 1, match.start()), end)
+            waiting = [i for i in waiting if not self._confirm(i, text, start, stop)]
+            position = stop + 1
+
+        for i in verifier.alone:
+            if i in self.matched:
+                continue
+            match = verifier.patterns[i].search(text, 0, end)
+            if match is not None:
+                self._confirm(i, text, text.rfind("\n", 0, match.start()) + 1, end)
+
+    def _confirm(self, i, text, start, stop):
+        """
+        Match rule i within each line of text[start:stop] and record it if it matches
+        :return: True if it matched
+        """
+        pattern = self.verifier.patterns[i]
+        while start < stop:
+            line_end = _line_end(text, start, stop)
+            if pattern.search(text, start, line_end):
+                self.matched.add(i)
+                rule = self.verifier.rules[i]
+                if rule.kind == FORBID:
+                    self.forbidden.append(rule)
+                return True
+            start = line_end + 1
+        return False
+
+
+def _line_end(text, position, end):
+    # position of the newline ending the line at position, or end
+    line_end = text.find("\n", position, end)
+    return end if line_end < 0 else line_end
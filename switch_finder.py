@@ -1,21 +1,30 @@
+import os
 import sys
 if not sys.version_info.major == 3 and sys.version_info.minor >= 7:
     print("Python 3.7 or higher is required.")
     exit(0)
 
+import re
 import logging
 import argparse
-import concurrent.futures
+from functools import partial
 from pathlib import Path
-from collections import Counter
-import src.cisco_switches as sw
-from src.excel_processor import ExcelProcessor
-
-try:
-    from netmiko import ConnectHandler
-    from netmiko.ssh_exception import NetmikoAuthenticationException, NetmikoTimeoutException
-except ImportError:
-    raise ImportError('Netmiko package must be installed. `pip install netmiko`')
+from src.inventory import open_inventory, is_spreadsheet
+from src.results_writer import NullResults
+from src.engines import run_threaded
+from src.scheduler import add_scheduler_arguments, scheduler_from_args
+from src.retry import RetryPolicy
+from src.journal import Journal, STARTED, SUCCESS, FAILED
+from src.sharding import parse_shard, in_shard, partial_path, PartialResults
+from src.sessions import SessionPool, netmiko_connect, netmiko_exceptions
+from src.timing import Timings
+from src.logging_setup import setup_logging, LogBlock
+from src.output_cache import OutputCache, NullCache
+from src.snapshots import SnapshotStore, snapshot_from_scan, ADDED, REMOVED
+from src.oui_index import load_oui_index
+from src.table_parser import init_scan_worker, scan_raw_output, scan_counters, parse_vlan_list
+from src.pipeline import AnalysisPipeline, RawOutput, load_raw_outputs
+from src.verification import Verifier, parse_command_set, ios_error_rules
 
 from datetime import datetime
 startTime = datetime.now().strftime('%a %b %d %H:%M:%S %Y')
@@ -27,41 +36,105 @@ parser.add_argument("cmd_file", help="Commands to be sent to the switch. One per
 parser.add_argument("--username", help="Username for switch login")
 parser.add_argument("--password", help="Password for switch login")
 parser.add_argument("--threshold", help="Threshold defining how many MACs on a port make it worth investigating")
-parser.add_argument("--vlan", help="The VLAN to check")
+parser.add_argument("--vlan", help="The VLANs to check, e.g. 60 or 10,20,60-80. Default is 60")
 parser.add_argument("--log-file", help="Log file")
+parser.add_argument("--log-json", action="store_true", help="Write the log file as JSON lines")
+parser.add_argument("--trace", help="Write the timing of every phase of every host to this file "
+                                    "as a Chrome trace (chrome://tracing)")
+add_scheduler_arguments(parser)
+parser.add_argument("--retries", help="Retries for a switch that times out on connect. Default is 0")
+parser.add_argument("--retry-delay", help="Base seconds of the exponential backoff between retries. Default is 2")
+parser.add_argument("--journal", help="Append-only file recording each switch's progress. "
+                                      "Switches recorded as successful are skipped on the next run")
+parser.add_argument("--shard", help="Process only shard i of N of the hosts, e.g. 2/4, so N runs split the "
+                                    "inventory. Results go to a partial file merged with python -m src.sharding")
+parser.add_argument("--push-config", action="store_true",
+                    help="After the scan, send the commands in cmd_file to each switch and save, over the same login")
+parser.add_argument("--parse-workers", help="Processes parsing switch output. Default is one per CPU, "
+                                            "0 parses in the SSH threads")
+parser.add_argument("--low-memory", action="store_true",
+                    help="Hold each port's hosts in compact arrays and queue less output for the parsers")
+parser.add_argument("--save-raw", help="Directory to save each switch's raw output in, for re-analysis later")
+parser.add_argument("--from-raw", help="Re-analyse the raw output saved by --save-raw instead of contacting switches")
+parser.add_argument("--store", help="Directory of Parquet files recording every MAC address found, "
+                                    "for fleet-wide queries. Needs pyarrow")
+parser.add_argument("--diff", help="Directory of per-switch snapshots. Only log what changed since the "
+                                   "last snapshot instead of every MAC address on each port")
+parser.add_argument("--cache", help="Directory caching show command output between runs")
+parser.add_argument("--cache-ttl", help="Seconds cached MAC and ARP tables stay fresh. Default is 300. "
+                                        "Hostnames stay fresh for a day")
+parser.add_argument("--cache-size", help="Most megabytes of output kept in the cache. Default is 512")
+parser.add_argument("--offline", action="store_true",
+                    help="Analyse the output in --cache, however old, instead of contacting switches")
+parser.add_argument("--flush-every", help="Write results to the status store after this many updates. Default is 50")
+parser.add_argument("--flush-interval", help="Write results to the status store at least every N seconds. Default is 5")
 args = parser.parse_args()
 
 if not args.hosts_file or not args.cmd_file:
     print("You must specify both a host file and command file")
     exit(1)
 
+if args.offline and not args.cache:
+    print("--offline replays the output cache, --cache must be given too")
+    exit(1)
+
 username = args.username if args.username else None
 password = args.password if args.password else None
+scheduler = scheduler_from_args(args)
+retry_policy = RetryPolicy(attempts=int(args.retries) + 1 if args.retries else 1,
+                           base_delay=float(args.retry_delay) if args.retry_delay else 2.0)
+journal = Journal(args.journal)
+try:
+    shard = parse_shard(args.shard) if args.shard else None
+except ValueError as e:
+    print(e)
+    exit(1)
+# sessions are opened through open_connection and all disconnected when main() finishes
+sessions = SessionPool(connect=lambda host: open_connection(host))
+timings = Timings()
+trace_file = args.trace if args.trace else None
+push_config = args.push_config
+parse_workers = int(args.parse_workers) if args.parse_workers else None
+low_memory = args.low_memory
+save_raw_dir = args.save_raw if args.save_raw else None
+store_dir = args.store if args.store else None
+snapshots = SnapshotStore(args.diff) if args.diff else None
+from_raw_dir = args.from_raw if args.from_raw else None
+flush_every = int(args.flush_every) if args.flush_every else 50
+flush_interval = float(args.flush_interval) if args.flush_interval else 5.0
 threshold = int(args.threshold) if args.threshold else 1
-vlan = args.vlan if args.vlan else 60
+try:
+    vlans = parse_vlan_list(args.vlan if args.vlan else 60)
+except ValueError as e:
+    print(e)
+    exit(1)
 
-mac_command = f"show mac address-table vlan {vlan}"
-arp_command = f"show ip arp vlan {vlan}"
+if len(vlans) == 1:
+    mac_command = f"show mac address-table vlan {vlans[0]}"
+    arp_command = f"show ip arp vlan {vlans[0]}"
+else:
+    # one unfiltered table per switch, partitioned by VLAN when parsed
+    mac_command = "show mac address-table"
+    arp_command = "show ip arp"
 hostname_command = "show run | i hostname"
+# names of the commands in the timing report
+command_phases = {mac_command: "show_mac", arp_command: "show_arp", hostname_command: "show_hostname"}
 
-# Build the logger
-log_file = args.log_file if args.log_file else 'results.log'
-
-file_handler = logging.FileHandler(log_file)
-stream_handler = logging.StreamHandler(sys.stdout)
-file_handler.setLevel(logging.DEBUG)
-stream_handler.setLevel(logging.DEBUG)
-# formatting for loggers
-# file_handler_format = logging.Formatter('%(levelname)s - %(asctime)s - %(message)s')
-file_handler_format = logging.Formatter('%(message)s')
-stream_handler_format = logging.Formatter('%(message)s')
-file_handler.setFormatter(file_handler_format)
-stream_handler.setFormatter(stream_handler_format)
+offline = args.offline
+if args.cache:
+    cache_ttl = float(args.cache_ttl) if args.cache_ttl else 300.0
+    # the hostname almost never changes, the tables do
+    cache = OutputCache(args.cache,
+                        ttls={hostname_command: 24 * 3600, mac_command: cache_ttl, arp_command: cache_ttl},
+                        max_bytes=int(float(args.cache_size) * 1024 * 1024) if args.cache_size else 512 * 1024 * 1024)
+else:
+    cache = NullCache()
 
+# Build the logger. One listener thread writes the log for every module, the terminal only shows this script's
+log_file = args.log_file if args.log_file else 'results.log'
+setup_logging(log_file, stream_level=logging.DEBUG, file_format='%(message)s', stream_format='%(message)s',
+              json_lines=args.log_json, stream_loggers=("__main__",))
 logger = logging.getLogger(__name__)
-logger.addHandler(file_handler)
-logger.addHandler(stream_handler)
-logger.setLevel(logging.DEBUG)
 
 
 # the files
@@ -70,103 +143,298 @@ cmd_path = Path() / args.cmd_file
 data_files_dir = "data_files"
 vendor_mac_file = "vendor-mac-data.txt"
 vendor_mac = Path() / data_files_dir / vendor_mac_file
+# switches whose output is held at once with --low-memory, being read, queued or parsed, per parser
+LOW_MEMORY_OUTPUTS_PER_PARSER = 4
+# hosts whose --push-config output failed verification, their scan doesn't mark them successful
+failed_pushes = set()
 
 
 def main():
     logger.debug(f"Starting switch scan at {startTime}")
+    logger.debug(f"Scanning VLANs {', '.join(str(vlan) for vlan in vlans)}")
     # open and read files, and handle errors if necessary
     try:
-        excel = ExcelProcessor(hosts_path, "Sheet_name", username, password, ignore_status=True)
-        hosts = excel.run_sheet_read()
-        # with hosts_path.open() as file:
-        #     hosts = sw.parse_hosts_file(file, username, password)
+        # hosts are yielded while the inventory is still being read
+        hosts = open_inventory(hosts_path, "Sheet_name", username, password, ignore_status=True)
     except (FileExistsError, FileNotFoundError):
         logger.error(f"Hosts file {hosts_path.name} not found or failed to open")
         return
 
-    # try:
-    #     with cmd_path.open() as file:
-    #         cmds = sw.parse_commands_file(file)
-    # except (FileExistsError, FileNotFoundError):
-    #     logger.error(f"Commands file {cmd_path.name} not found or failed to open")
-    #     exit(1)
+    # resume: skip anything a previous run already completed, without touching the sheet
+    completed = journal.completed()
+    if completed:
+        logger.debug(f"Skipping {len(completed)} hosts already completed in {journal.path}")
+        hosts = (host for host in hosts if host["host"] not in completed)
+
+    if shard:
+        hosts = in_shard(hosts, *shard)
+
+    if is_spreadsheet(hosts_path) and shard:
+        # shards never write the workbook, each appends to its own file for merging afterwards
+        excel = PartialResults(partial_path(hosts_path, *shard))
+    elif is_spreadsheet(hosts_path):
+        # pandas is only imported for workbooks, text and CSV inventories start faster without it
+        from src.excel_processor import ExcelProcessor
+        excel = ExcelProcessor(hosts_path, "Sheet_name", username, password, ignore_status=True,
+                               flush_every=flush_every, flush_interval=flush_interval, stream=True,
+                               timings=timings)
+    else:
+        excel = NullResults()
+
+    cmds = None
+    verifier = None
+    if push_config:
+        try:
+            with cmd_path.open() as file:
+                cmds, rules = parse_command_set(file)
+        except (FileExistsError, FileNotFoundError):
+            logger.error(f"Commands file {cmd_path.name} not found or failed to open")
+            exit(1)
+        # the same checks as command_sender: the file's own directives and the errors IOS prints
+        try:
+            verifier = Verifier(rules + ios_error_rules())
+        except re.error as e:
+            logger.error(f"Invalid pattern in commands file {cmd_path.name}: {e}")
+            exit(1)
+
+    if store_dir:
+        # pyarrow is optional, only the result store needs it
+        from src.result_store import ResultStore
+        store = ResultStore(store_dir, shard=shard)
+    else:
+        store = None
 
-    mac_vendors = sw.read_and_parse_mac_vendor_file(vendor_mac)
+    # SSH threads only collect raw output, parsing runs on a process pool.
+    # Each parser memory-maps the vendor index, compiled here once into data_files/vendor-mac-data.idx
+    load_oui_index(vendor_mac)
+    # low memory: the outputs being read count too, see run_ssh_connection
+    max_pending = LOW_MEMORY_OUTPUTS_PER_PARSER * (parse_workers or os.cpu_count() or 1) if low_memory else None
+    if max_pending and (scheduler.max_concurrency or 0) > max_pending:
+        logger.warning(f"--low-memory holds the output of {max_pending} switches at once, "
+                       f"so at most {max_pending} are scanned at once, not --concurrency {scheduler.max_concurrency}")
+    pipeline = AnalysisPipeline(
+        scan_raw_output,
+        on_result=partial(record_scan, excel=excel, store=store),
+        on_error=lambda raw, exception: set_status(raw.host, False, excel),
+        workers=parse_workers,
+        max_pending=max_pending,
+        initializer=init_scan_worker,
+        initargs=(vendor_mac, vlans, low_memory),
+        counters=scan_counters,
+        raw_dir=save_raw_dir,
+        timings=timings,
+    )
     # Here we are using threading, as we are I/O bound.
-    # Netmiko and Paramiko are blocking, so asyncio not possible
-    # On an asyncio note, asyncssh package looks interesting
+    # The scheduler caps concurrency and the login rate and sets the timeouts
     # loop over all hosts and execute necessary commands
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        for host in hosts:
-            # run_ssh_connection(host, mac_vendors, excel)
-            executor.submit(run_ssh_connection, host, mac_vendors, excel)
+    try:
+        if from_raw_dir:
+            # re-analyse the output saved by an earlier --save-raw run, no switch is contacted
+            for raw in load_raw_outputs(from_raw_dir):
+                pipeline.submit(raw)
+        elif offline:
+            # replay the cached output, no switch is contacted
+            for host in hosts:
+                replay_cached_output(host, pipeline, excel)
+        else:
+            # fail now, not once per host, if netmiko is missing
+            netmiko_exceptions()
+            # run_ssh_connection(host, pipeline, excel, cmds, verifier) for every host
+            run_threaded(run_ssh_connection, hosts, pipeline, excel, cmds, verifier, scheduler=scheduler)
+    finally:
+        # wait for the parsers, then flush outstanding results and save excel file to disk
+        pipeline.close()
+        sessions.close_all()
+        logger.debug(f"Session pool: {sessions.stats()}")
+        logger.debug(f"Vendor lookups: {pipeline.stats()}")
+        cache.close()
+        logger.debug(f"Output cache: {cache.stats()}")
+        if store is not None:
+            store.close()
+        if snapshots is not None:
+            snapshots.close()
+        excel.close()
+        journal.close()
 
-    excel.write_to_file()
-    # print script execution duration
-    # print(datetime.now() - startTime)
+    report_timings()
 
 
-def run_ssh_connection(host, mac_vendors, excel):
+def run_ssh_connection(host, pipeline, excel, cmds=None, verifier=None):
     """
-    Connect to the host and execute the list of commands
-    Log results
+    Connect to the host and collect the output of the MAC, ARP and hostname commands
+    The output is handed to the analysis pipeline, parsing happens there
+    If cmds is given, push them and save the config afterwards, reusing the same session
     :param host: DNS or IP address of a host
-    :param mac_vendors: dict of macs and vendors
+    :param pipeline: the AnalysisPipeline parsing the output
     :param excel: the excel reader object. Used for updating status in each row
+    :param cmds: optional list of config commands for the remediation phase
+    :param verifier: src.verification.Verifier checking the output of the remediation
     :return: None
     """
+    NetmikoAuthenticationException, NetmikoTimeoutException = netmiko_exceptions()
+    journal.record(host["host"], STARTED)
+    # low memory: wait for a parser slot before reading, so however many threads there are
+    # only max_pending switches' output is held at once
+    reserved = low_memory and pipeline.reserve()
     try:
-        connection = ConnectHandler(**host)
-        mac_address_ouput = connection.send_command(mac_command)
-        arp_output = connection.send_command(arp_command)
-        hostname = connection.send_command(hostname_command).split()[1]
-    except NetmikoAuthenticationException:
-        logger.error(f"Auth error exception as {host['host']}")
-        excel.update_process_column(host["host"], False)
-        return 1
-    except NetmikoTimeoutException:
-        logger.error(f"Timeout error exception {host['host']}")
-        excel.update_process_column(host["host"], False)
-        return 1
-
-    # determine whether the results are as expected, and log
-    if mac_address_ouput is not None:
-        data = sw.line_parser(mac_address_ouput)
-        mac_addresses = sw.sort_by_mac(data)
-        port_count = sw.count_mac_address_by_port(data)
-        ordered_ports = Counter(port_count).most_common()
-
-        if arp_output is not None:
-            data = sw.line_parser(arp_output, search_term="Internet")
-            ip_information = sw.parse_mac_and_arp_data(data)
-            host_data = sw.map_hosts_to_ip(mac_addresses, ip_information, mac_vendors)
-            ordered_data = sw.sort_and_order_data(ordered_ports, host_data)
-            parse_and_display_output(ordered_data, hostname, host, excel)
-            excel.update_process_column(host["host"], True)
+        try:
+            # discovery. Keep the session for the remediation phase if there is one
+            outputs = run_show_commands(host, (mac_command, arp_command, hostname_command), keep=bool(cmds))
+            mac_address_ouput = outputs[mac_command]
+            arp_output = outputs[arp_command]
+            hostname = outputs[hostname_command].split()[1]
+
+            # remediation, over the same login
+            if cmds:
+                verification = verifier.stream()
+                with sessions.session(host, keep=False) as connection:
+                    with timings.phase("send_config_set", host["host"]):
+                        output = connection.send_config_set(cmds)
+                    # don't save a config the switch rejected
+                    if not verification.feed(output):
+                        with timings.phase("save_config", host["host"]):
+                            verification.feed(connection.save_config())
+                verdict = verification.close()
+                if verdict.passed:
+                    logger.debug(f"Pushed configuration to {host['host']}")
+                else:
+                    logger.error(f"Failed to push configuration to {host['host']}: {', '.join(verdict.reasons())}")
+                    failed_pushes.add(host["host"])
+        except NetmikoAuthenticationException:
+            logger.error(f"Auth error exception as {host['host']}")
+            set_status(host["host"], False, excel)
+            return 1
+        except NetmikoTimeoutException:
+            logger.error(f"Timeout error exception {host['host']}")
+            set_status(host["host"], False, excel)
+            return 1
+
+        if mac_address_ouput is None:
+            set_status(host["host"], False, excel)
+            return False
+
+        # blocks while the parsers are saturated, unless the slot is already reserved.
+        # submit gives a reserved slot back whatever happens, so it is no longer ours to release
+        reserved, handed_over = False, reserved
+        pipeline.submit(RawOutput(host["host"], hostname, mac_address_ouput, arp_output), reserved=handed_over)
         return True
+    finally:
+        if reserved:
+            pipeline.release()
+
+
+def run_show_commands(host, commands, keep=False):
+    """
+    Run show commands on host, taking any output still fresh in the cache.
+    Logs in only if at least one command has to be sent
+    :return: Dict of command -> output
+    """
+    outputs = {command: cache.get(host["host"], command) for command in commands}
+    missing = [command for command, output in outputs.items() if output is None]
+    if missing:
+        with sessions.session(host, keep=keep) as connection:
+            for command in missing:
+                with timings.phase(command_phases.get(command, "send_command"), host["host"]):
+                    outputs[command] = connection.send_command(command)
+                cache.put(host["host"], command, outputs[command])
+    return outputs
+
+
+def replay_cached_output(host, pipeline, excel):
+    # --offline: analyse whatever output the cache holds for host, however old
+    outputs = [cache.get(host["host"], command, any_age=True)
+               for command in (mac_command, arp_command, hostname_command)]
+    if None in outputs:
+        logger.error(f"No cached output for {host['host']}")
+        set_status(host["host"], False, excel)
+        return False
+    mac_address_ouput, arp_output, hostname_output = outputs
+    pipeline.submit(RawOutput(host["host"], hostname_output.split()[1], mac_address_ouput, arp_output))
+    return True
 
-    excel.update_process_column(host["host"], False)
-    return False
 
+def open_connection(host):
+    # connect, retrying timeouts as configured. Every attempt waits for a login token
+    _, NetmikoTimeoutException = netmiko_exceptions()
+    return retry_policy.call(lambda: scheduler.login(netmiko_connect, host, timings), NetmikoTimeoutException,
+                             host["host"], on_retry=journal.retry_recorder(host["host"]))
 
-def parse_and_display_output(ordered_data, hostname, host, excel):
+
+def record_scan(raw, vlan_data, excel, store=None):
+    # called with each parsed device from the analysis pipeline
+    if snapshots is None:
+        parse_and_display_output(vlan_data, raw.hostname, raw.host, excel)
+    else:
+        # diff mode logs only the changes, the sheet still gets the busy ports
+        parse_and_display_output(vlan_data, raw.hostname, raw.host, excel, log_hosts=False)
+        display_changes(snapshots.update(raw.host, raw.hostname, snapshot_from_scan(vlan_data)), raw.hostname, raw.host)
+    if store is not None:
+        store.add_device(raw.host, raw.hostname, vlan_data)
+    # the scan succeeded, the host only counts as done if its remediation did too
+    set_status(raw.host, raw.host not in failed_pushes, excel)
+
+
+def parse_and_display_output(vlan_data, hostname, ip, excel, log_hosts=True):
+    """
+    Log the ports over the threshold in each VLAN and write them to the ports column
+    :param vlan_data: Dict of VLAN -> ordered Dict of port -> host records, from scan_device_vlans
+    :param log_hosts: log the ports and every host on them, not only write the ports column
+    """
     excel_port_record = []
-    for port_data, value in ordered_data.items():
-        port_count = len(value)
-
-        if port_count > threshold:
-            ip = host["host"]
-            port_count_info = f"{port_data}: {port_count}"
-            excel_port_record.append(port_count_info)
-            logging_msg = f"{hostname} ({ip}) Port: {port_count_info} Addresses"
-            logger.info(logging_msg)
-
-            for host_info in value:
-                logging_msg = f"\tMAC: {host_info.mac} \tIP: {host_info.ip} \tVendor: {host_info.vendor} "
-                logger.info(logging_msg)
-
-            # write host specific port info to excel
-            excel.update_ports_column(ip, excel_port_record)
+    # the switch's lines are written together, never mixed with another switch's
+    with LogBlock(logger, ip) as block:
+        for vlan, ordered_data in vlan_data.items():
+            for port_data, value in ordered_data.items():
+                port_count = len(value)
+
+                if port_count > threshold:
+                    port_count_info = f"{port_data}: {port_count}"
+                    # the VLAN is only spelled out when there is more than one
+                    excel_port_record.append(port_count_info if len(vlans) == 1 else f"Vlan{vlan} {port_count_info}")
+                    if not log_hosts:
+                        continue
+                    logging_msg = f"{hostname} ({ip}) VLAN: {vlan} Port: {port_count_info} Addresses"
+                    block.info(logging_msg)
+
+                    for host_info in value:
+                        logging_msg = f"\tMAC: {host_info.mac} \tIP: {host_info.ip} \tVendor: {host_info.vendor} "
+                        block.info(logging_msg)
+
+    if excel_port_record:
+        # write host specific port info to excel
+        excel.update_ports_column(ip, excel_port_record)
+
+
+def display_changes(changes, hostname, ip):
+    if changes is None:
+        logger.info(f"{hostname} ({ip}) First snapshot taken")
+        return
+    with LogBlock(logger, ip) as block:
+        for change, vlan, mac, before, after in changes:
+            if change == ADDED:
+                logging_msg = f"{hostname} ({ip}) VLAN: {vlan} Added MAC: {mac} Port: {after[0]} IP: {after[1]}"
+            elif change == REMOVED:
+                logging_msg = f"{hostname} ({ip}) VLAN: {vlan} Removed MAC: {mac} Port: {before[0]} IP: {before[1]}"
+            else:
+                logging_msg = (f"{hostname} ({ip}) VLAN: {vlan} Moved MAC: {mac} "
+                               f"Port: {before[0]} -> {after[0]} IP: {before[1]} -> {after[1]}")
+            block.info(logging_msg)
+
+
+def report_timings():
+    # p50/p95/p99 per phase, the slowest hosts and hosts/sec
+    with LogBlock(logger) as block:
+        for line in timings.summary():
+            block.debug(line)
+    if trace_file:
+        timings.write_chrome_trace(trace_file)
+        logger.debug(f"Wrote timing trace to {trace_file}")
+
+
+def set_status(ip, result, excel):
+    # record the outcome in the sheet and the journal
+    excel.update_process_column(ip, result)
+    journal.record(ip, SUCCESS if result else FAILED)
 
 
 if __name__ == '__main__':
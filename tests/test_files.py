@@ -0,0 +1,40 @@
+import os
+import stat
+from src.files import write_atomic
+from src.oui_index import build_index
+from src.output_cache import OutputCache
+from src.snapshots import SnapshotStore
+
+
+def mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def default_mode():
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def test_write_atomic_replaces_the_file_with_the_umask_applied(tmp_path):
+    path = tmp_path / "shared"
+    path.write_bytes(b"old")
+    write_atomic(path, b"data")
+    assert path.read_bytes() == b"data"
+    assert mode(path) == default_mode()
+    assert os.listdir(tmp_path) == ["shared"]
+
+
+def test_index_cache_and_snapshots_are_readable_by_others(tmp_path):
+    source = tmp_path / "vendors.txt"
+    source.write_text("001BC5\tVendor\n")
+    build_index(source, tmp_path / "vendors.idx")
+    cache = OutputCache(tmp_path / "cache", default_ttl=60)
+    cache.put("10.0.0.1", "show mac address-table", "table")
+    cache.close()
+    SnapshotStore(tmp_path / "snapshots").save("10.0.0.1", "sw1", {})
+
+    written = [tmp_path / "vendors.idx", tmp_path / "cache" / "index.json",
+               *(tmp_path / "cache" / "objects").iterdir(), tmp_path / "snapshots" / "10.0.0.1.json.gz"]
+    assert len(written) == 4
+    assert all(mode(path) == default_mode() for path in written)
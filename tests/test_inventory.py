@@ -0,0 +1,62 @@
+import pytest
+from src.inventory import clean_value, is_spreadsheet, iter_inventory_hosts, open_inventory
+
+
+def test_clean_value_strips_and_drops_empty_cells():
+    assert clean_value(" 10.0.0.7 ") == "10.0.0.7"
+    assert clean_value(float("nan")) is None
+    assert clean_value("  ") is None
+    assert clean_value("null") is None
+    assert clean_value(None) is None
+    assert clean_value(7) == 7
+
+
+def test_rows_are_cleaned_skipped_and_deduplicated():
+    rows = [
+        {"hostname": "sw1", "status": None, "ip": " 10.0.0.1"},
+        {"hostname": "sw2", "status": " success ", "ip": "10.0.0.2"},
+        {"hostname": None, "status": None, "ip": "10.0.0.3"},
+        {"hostname": "sw4", "status": "failed", "ip": "null"},
+        {"hostname": "sw5", "status": "failed", "ip": "10.0.0.1"},
+        {"hostname": "sw6", "status": "failed", "ip": "10.0.0.6"},
+    ]
+    hosts = iter_inventory_hosts(rows, "admin", "secret")
+    assert [host["host"] for host in hosts] == ["10.0.0.1", "10.0.0.6"]
+    hosts = iter_inventory_hosts(rows, "admin", "secret", ignore_status=True)
+    assert [host["host"] for host in hosts] == ["10.0.0.1", "10.0.0.2", "10.0.0.6"]
+
+
+def test_rows_are_consumed_as_hosts_are_taken():
+    consumed = []
+
+    def rows():
+        for i in range(1, 4):
+            consumed.append(i)
+            yield {"hostname": f"sw{i}", "status": None, "ip": f"10.0.0.{i}"}
+
+    hosts = iter_inventory_hosts(rows(), "admin", "secret")
+    assert next(hosts)["host"] == "10.0.0.1"
+    assert consumed == [1]
+
+
+def test_text_inventory(tmp_path):
+    path = tmp_path / "hosts.txt"
+    path.write_text("10.0.0.1\n\n 10.0.0.2 \n")
+    hosts = list(open_inventory(path, None, "admin", "secret"))
+    assert hosts == [
+        {"device_type": "cisco_ios", "host": "10.0.0.1", "username": "admin", "password": "secret"},
+        {"device_type": "cisco_ios", "host": "10.0.0.2", "username": "admin", "password": "secret"},
+    ]
+
+
+def test_csv_inventory(tmp_path):
+    path = tmp_path / "hosts.csv"
+    path.write_text("hostname,status,ip\nsw1,,10.0.0.1\nsw2,success,10.0.0.2\n")
+    assert [host["host"] for host in open_inventory(path, None, "admin", "secret")] == ["10.0.0.1"]
+    assert not is_spreadsheet(path)
+    assert is_spreadsheet(tmp_path / "hosts.xlsx")
+
+
+def test_a_missing_inventory_fails_on_open(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        open_inventory(tmp_path / "missing.txt", None, "admin", "secret")
@@ -0,0 +1,58 @@
+import json
+from src.journal import FAILED, RETRY, STARTED, SUCCESS, Journal, load_states
+
+
+def test_states_are_replayed_in_order(tmp_path):
+    journal = Journal(tmp_path / "journal.jsonl")
+    journal.record("10.0.0.1", STARTED)
+    journal.retry_recorder("10.0.0.1")(1, TimeoutError(), 0.5)
+    journal.record("10.0.0.1", SUCCESS)
+    journal.record("10.0.0.2", STARTED)
+    journal.record("10.0.0.2", FAILED)
+    journal.close()
+    assert load_states(tmp_path / "journal.jsonl") == {"10.0.0.1": SUCCESS, "10.0.0.2": FAILED}
+    lines = [json.loads(line) for line in (tmp_path / "journal.jsonl").read_text().splitlines()]
+    assert lines[1]["state"] == RETRY and lines[1]["attempt"] == 1 and lines[1]["error"] == "TimeoutError"
+
+
+def test_resume_after_a_partial_journal(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    # the run was killed with one host done and one in progress
+    first = Journal(path)
+    first.record("10.0.0.1", STARTED)
+    first.record("10.0.0.1", SUCCESS)
+    first.record("10.0.0.2", STARTED)
+    first.close()
+
+    second = Journal(path)
+    assert second.completed() == {"10.0.0.1"}
+    second.record("10.0.0.2", SUCCESS)
+    second.close()
+    assert Journal(path).completed() == {"10.0.0.1", "10.0.0.2"}
+
+
+def test_a_truncated_last_line_is_skipped(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = Journal(path)
+    journal.record("10.0.0.1", SUCCESS)
+    journal.close()
+    with path.open("a") as file:
+        file.write('{"time": 1.0, "host": "10.0.0.2", "sta')
+    assert load_states(path) == {"10.0.0.1": SUCCESS}
+
+
+def test_a_journal_without_a_path_records_nothing(tmp_path):
+    journal = Journal()
+    journal.record("10.0.0.1", SUCCESS)
+    journal.close()
+    assert journal.completed() == set()
+    assert load_states(tmp_path / "missing.jsonl") == {}
+
+
+def test_a_run_resumed_after_a_truncated_line_keeps_its_first_record(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    path.write_text('{"time": 1.0, "host": "10.0.0.1", "state": "success"}\n{"time": 2.0, "host": "10.0.0.2", "sta')
+    journal = Journal(path)
+    journal.record("10.0.0.2", SUCCESS)
+    journal.close()
+    assert load_states(path) == {"10.0.0.1": SUCCESS, "10.0.0.2": SUCCESS}
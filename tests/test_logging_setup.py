@@ -0,0 +1,71 @@
+import json
+import queue
+import logging
+import pytest
+from src.logging_setup import JsonFormatter, LineFormatter, LogBlock, LoggerFilter, RecordQueue, setup_logging
+
+
+def record(message, name="src.test", level=logging.INFO, **extra):
+    return logging.makeLogRecord({"name": name, "levelno": level, "levelname": logging.getLevelName(level),
+                                  "msg": message, **extra})
+
+
+def test_queue_is_bounded_by_message_length():
+    records = RecordQueue(maxsize=10)
+    records.put_nowait(record("12345"))
+    records.put_nowait(record("1234"))
+    assert records.qsize() == 11
+    # past its bound a record isn't let in, it waits or is refused
+    with pytest.raises(queue.Full):
+        records.put_nowait(record("1"))
+    with pytest.raises(queue.Full):
+        records.put(record("1"), timeout=0.01)
+    assert records.get_nowait().msg == "12345"
+    records.put_nowait(record("1"))
+    assert [records.get_nowait().msg for _ in range(2)] == ["1234", "1"]
+    assert records.empty()
+
+
+def test_a_record_larger_than_the_bound_gets_through_on_its_own():
+    records = RecordQueue(maxsize=10)
+    records.put_nowait(record("x" * 100))
+    with pytest.raises(queue.Full):
+        records.put_nowait(record("y"))
+    records.get_nowait()
+    records.put_nowait(None)
+    assert records.qsize() == 1
+
+
+def test_block_lines_below_the_level_are_left_out():
+    block = record("ignored", lines=[(logging.DEBUG, "vlan 10"), (logging.ERROR, "timed out")])
+    assert LineFormatter("%(levelname)s %(message)s").format(block) == "DEBUG vlan 10\nERROR timed out"
+    assert LineFormatter("%(levelname)s %(message)s", logging.INFO).format(block) == "ERROR timed out"
+
+
+def test_json_lines_carry_the_host():
+    line = json.loads(JsonFormatter().format(record("connected", host="10.0.0.1")))
+    assert (line["level"], line["logger"], line["message"], line["host"]) == ("INFO", "src.test", "connected", "10.0.0.1")
+
+
+def test_other_loggers_only_pass_warnings():
+    only_main = LoggerFilter(["__main__"])
+    assert only_main.filter(record("scanning", name="__main__"))
+    assert not only_main.filter(record("scanning", name="src.pipeline"))
+    assert only_main.filter(record("failed", name="src.pipeline", level=logging.WARNING))
+
+
+def test_a_block_is_written_as_one_run_of_lines(tmp_path):
+    log_file = tmp_path / "results.log"
+    name = "test_logging_setup"
+    listener = setup_logging(log_file, stream_level=logging.CRITICAL, file_format="%(message)s", loggers=(name,))
+    logger = logging.getLogger(name)
+    try:
+        with LogBlock(logger, host="10.0.0.1") as block:
+            block.info("first")
+            logger.info("between")
+            block.info("second")
+    finally:
+        listener.stop()
+        logger.handlers.clear()
+        logger.propagate = True
+    assert log_file.read_text().splitlines() == ["between", "first", "second"]
@@ -0,0 +1,89 @@
+import os
+import random
+import shutil
+from pathlib import Path
+import pytest
+from src.cisco_switches import read_and_parse_mac_vendor_file, find_mac_vendor, VendorLookup, VENDOR_NOT_FOUND
+from src.oui_index import build_index, load_oui_index, index_path, mac_to_int, parse_prefix, OuiIndex
+
+VENDOR_FILE = Path(__file__).parent.parent / "data_files" / "vendor-mac-data.txt"
+
+
+def notations(value):
+    digits = f"{value:012x}"
+    pairs = [digits[i:i + 2] for i in range(0, 12, 2)]
+    return (f"{digits[:4]}.{digits[4:8]}.{digits[8:]}", ":".join(pairs).upper(), "-".join(pairs), digits)
+
+
+@pytest.fixture(scope="module")
+def vendors(tmp_path_factory):
+    source = tmp_path_factory.mktemp("oui") / VENDOR_FILE.name
+    shutil.copy(VENDOR_FILE, source)
+    return read_and_parse_mac_vendor_file(source), load_oui_index(source)
+
+
+def test_mac_to_int():
+    for mac in notations(0x001122334455):
+        assert mac_to_int(mac) == 0x001122334455
+    assert mac_to_int("0011.2233.44") is None
+    assert mac_to_int("zz11.2233.4455") is None
+
+
+def test_parse_prefix():
+    assert parse_prefix("00:1B:C5") == (24, 0x001BC5)
+    assert parse_prefix("001BC50") == (28, 0x001BC50)
+    assert parse_prefix("00:1B:C5:00:00:00/36") == (36, 0x001BC5000)
+    with pytest.raises(ValueError):
+        parse_prefix("001B")
+
+
+def test_index_matches_the_dict(vendors):
+    table, index = vendors
+    assert len(index) == len(table)
+    rng = random.Random(1)
+    for oui in table:
+        value = int(oui, 16) << 24 | rng.getrandbits(24)
+        for mac in notations(value):
+            assert find_mac_vendor(mac, index) == find_mac_vendor(mac, table)
+    unknown = next(value for value in range(2 ** 24) if f"{value:06X}" not in table)
+    assert find_mac_vendor(notations(unknown << 24)[0], index) == VENDOR_NOT_FOUND
+
+
+def test_vendor_lookup_matches_the_dict(vendors):
+    table, index = vendors
+    rng = random.Random(2)
+    macs = [notations(int(oui, 16) << 24 | rng.getrandbits(24))[rng.randrange(4)]
+            for oui in rng.sample(sorted(table), 2000)] * 2
+    expected = [find_mac_vendor(mac, table) for mac in macs]
+    lookup = VendorLookup(index)
+    assert lookup.lookup_many(macs) == expected
+    assert VendorLookup(table).lookup_many(macs) == expected
+    # the second pass over the MACs is served from the cache
+    assert lookup.take_counts() == {"vendor_hits": 2000, "vendor_misses": 2000}
+    assert VendorLookup(index, max_size=100).lookup_many(macs) == expected
+
+
+def test_longest_prefix_wins(tmp_path):
+    source = tmp_path / "vendors.txt"
+    source.write_text("001BC5\tOUI owner\n001BC50\tMA-M owner\n00:1B:C5:00:10:00/36\tMA-S owner\n")
+    build_index(source, index_path(source))
+    index = OuiIndex(index_path(source))
+    assert index.lookup("001b.c500.1234") == "MA-S owner"
+    assert index.lookup("001b.c500.2234") == "MA-M owner"
+    assert index.lookup("001b.c510.0000") == "OUI owner"
+    assert index.refined_ouis() == {0x001BC5}
+    lookup = VendorLookup(index)
+    assert lookup.lookup_many(["001b.c500.1234", "001b.c500.2234", "001b.c510.0000", "001b.c500.1999"]) == \
+        ["MA-S owner", "MA-M owner", "OUI owner", "MA-S owner"]
+
+
+def test_index_is_rebuilt_when_the_source_changes(tmp_path):
+    source = tmp_path / "vendors.txt"
+    source.write_text("001BC5\tFirst\n")
+    assert load_oui_index(source)["001BC5"] == "First"
+    source.write_text("001BC5\tSecond\n")
+    # older than the new text file
+    target = index_path(source)
+    stat = source.stat()
+    os.utime(target, (stat.st_atime - 10, stat.st_mtime - 10))
+    assert load_oui_index(source)["001BC5"] == "Second"
@@ -0,0 +1,80 @@
+import os
+import time
+from src import output_cache
+from src.files import write_atomic
+from src.output_cache import OutputCache
+
+MAC = "show mac address-table"
+
+
+def test_hit_within_ttl_and_miss_after(tmp_path):
+    cache = OutputCache(tmp_path, ttls={MAC: 60})
+    cache.put("10.0.0.1", MAC, "table")
+    assert cache.get("10.0.0.1", MAC) == "table"
+    cache.entries[("10.0.0.1", MAC)] = cache.entries[("10.0.0.1", MAC)][:1] + (time.time() - 120, 5)
+    assert cache.get("10.0.0.1", MAC) is None
+    assert cache.get("10.0.0.1", MAC, any_age=True) == "table"
+
+
+def test_index_survives_close(tmp_path):
+    cache = OutputCache(tmp_path, default_ttl=60)
+    cache.put("10.0.0.1", MAC, "table")
+    cache.close()
+    assert OutputCache(tmp_path, default_ttl=60).get("10.0.0.1", MAC) == "table"
+
+
+def test_processes_sharing_a_cache_keep_each_others_entries(tmp_path):
+    first = OutputCache(tmp_path, default_ttl=60)
+    second = OutputCache(tmp_path, default_ttl=60)
+    first.put("10.0.0.1", MAC, "first table")
+    second.put("10.0.0.2", MAC, "second table")
+    first.close()
+    second.close()
+
+    cache = OutputCache(tmp_path, default_ttl=60)
+    assert cache.get("10.0.0.1", MAC) == "first table"
+    assert cache.get("10.0.0.2", MAC) == "second table"
+
+
+def test_close_leaves_objects_of_runs_still_going(tmp_path):
+    running = OutputCache(tmp_path, default_ttl=60)
+    closing = OutputCache(tmp_path, default_ttl=60)
+    running.put("10.0.0.1", MAC, "not in the index yet")
+    closing.close()
+    running.close()
+    assert OutputCache(tmp_path, default_ttl=60).get("10.0.0.1", MAC) == "not in the index yet"
+
+
+def test_close_removes_old_unreferenced_objects(tmp_path):
+    cache = OutputCache(tmp_path, default_ttl=60)
+    cache.put("10.0.0.1", MAC, "old table")
+    cache.put("10.0.0.1", MAC, "new table")
+    cache.close()
+    old = [path for path in (tmp_path / "objects").iterdir() if path.read_text() == "old table"]
+    past = time.time() - 3600
+    os.utime(old[0], (past, past))
+
+    OutputCache(tmp_path, default_ttl=60).close()
+    assert [path.read_text() for path in (tmp_path / "objects").iterdir()] == ["new table"]
+
+
+def test_eviction_keeps_the_cache_under_max_bytes(tmp_path):
+    cache = OutputCache(tmp_path, default_ttl=60, max_bytes=10)
+    cache.put("10.0.0.1", MAC, "123456")
+    cache.put("10.0.0.2", MAC, "abcdef")
+    assert cache.get("10.0.0.1", MAC) is None
+    assert cache.get("10.0.0.2", MAC) == "abcdef"
+
+
+def test_objects_are_written_without_the_cache_lock(tmp_path, monkeypatch):
+    cache = OutputCache(tmp_path)
+    locked = []
+
+    def write(path, data):
+        locked.append(cache.lock.locked())
+        write_atomic(path, data)
+
+    monkeypatch.setattr(output_cache, "write_atomic", write)
+    cache.put("10.0.0.1", MAC, "mac")
+    assert locked == [False]
+    assert cache.get("10.0.0.1", MAC, any_age=True) == "mac"
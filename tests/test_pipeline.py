@@ -0,0 +1,49 @@
+import pytest
+from concurrent.futures.process import BrokenProcessPool
+from src.pipeline import AnalysisPipeline, RawOutput
+
+RAW = RawOutput("10.0.0.1", "sw1", "mac table", "arp table")
+
+
+def count(mac_output, arp_output):
+    return len(mac_output) + len(arp_output)
+
+
+class BrokenExecutor:
+    def submit(self, *args):
+        raise BrokenProcessPool("a parser process died")
+
+
+def free_slots(pipeline):
+    return pipeline.slots._value
+
+
+def test_inline_parse_gives_a_reserved_slot_back_once():
+    results = []
+    pipeline = AnalysisPipeline(count, lambda raw, result: results.append((raw.host, result)), workers=0,
+                                max_pending=2)
+    assert pipeline.reserve()
+    pipeline.submit(RAW, reserved=True)
+    assert results == [("10.0.0.1", 18)]
+    assert free_slots(pipeline) == 2
+
+
+def test_a_failed_submit_gives_a_reserved_slot_back_once():
+    pipeline = AnalysisPipeline(count, lambda raw, result: None, workers=0, max_pending=2)
+    pipeline.executor = BrokenExecutor()
+    pipeline.reserve()
+    # the real error comes out, not the ValueError of a semaphore released twice
+    with pytest.raises(BrokenProcessPool):
+        pipeline.submit(RAW, reserved=True)
+    assert free_slots(pipeline) == 2
+    with pytest.raises(BrokenProcessPool):
+        pipeline.submit(RAW)
+    assert free_slots(pipeline) == 2
+
+
+def test_a_failed_raw_save_gives_a_reserved_slot_back_once(tmp_path):
+    pipeline = AnalysisPipeline(count, lambda raw, result: None, workers=0, max_pending=2, raw_dir=tmp_path)
+    pipeline.reserve()
+    with pytest.raises(OSError):
+        pipeline.submit(RAW._replace(host="missing/10.0.0.1"), reserved=True)
+    assert free_slots(pipeline) == 2
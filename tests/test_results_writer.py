@@ -0,0 +1,93 @@
+import sqlite3
+import threading
+from src import results_writer
+from src.results_writer import ResultsWriter
+
+
+class FlakyStore:
+    """
+    apply callback failing the first failures calls, like a locked database
+    """
+
+    def __init__(self, failures=1):
+        self.failures = failures
+        self.calls = 0
+        self.rows = []
+        self.applied = threading.Event()
+
+    def apply(self, updates):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise sqlite3.OperationalError("database is locked")
+        self.rows.extend(updates)
+        self.applied.set()
+
+
+def test_batches_are_flushed_in_order_on_close():
+    store = FlakyStore(failures=0)
+    writer = ResultsWriter(store.apply, flush_every=2, flush_interval=60)
+    for i in range(5):
+        writer.put(f"10.0.0.{i}", "status", "success")
+    writer.close()
+    assert [key for key, _, _ in store.rows] == [f"10.0.0.{i}" for i in range(5)]
+
+
+def test_a_failed_batch_is_applied_later(monkeypatch):
+    monkeypatch.setattr(results_writer, "RETRY_DELAY", 0.01)
+    store = FlakyStore(failures=1)
+    writer = ResultsWriter(store.apply, flush_every=2, flush_interval=60)
+    writer.put("10.0.0.1", "status", "success")
+    writer.put("10.0.0.2", "status", "failed")
+    assert store.applied.wait(5)
+    writer.put("10.0.0.3", "status", "success")
+    writer.close()
+    assert store.rows == [("10.0.0.1", "status", "success"), ("10.0.0.2", "status", "failed"),
+                          ("10.0.0.3", "status", "success")]
+
+
+def test_close_retries_the_last_batch(monkeypatch):
+    monkeypatch.setattr(results_writer, "RETRY_DELAY", 0.01)
+    store = FlakyStore(failures=2)
+    writer = ResultsWriter(store.apply, flush_every=100, flush_interval=60)
+    writer.put("10.0.0.1", "status", "success")
+    writer.close()
+    assert store.rows == [("10.0.0.1", "status", "success")]
+    assert store.calls == 3
+
+
+def test_a_full_batch_is_flushed_before_close():
+    store = FlakyStore(failures=0)
+    writer = ResultsWriter(store.apply, flush_every=2, flush_interval=60)
+    writer.put("10.0.0.1", "status", "success")
+    writer.put("10.0.0.2", "status", "success")
+    assert store.applied.wait(5)
+    assert store.calls == 1
+    writer.close()
+
+
+def test_a_partial_batch_is_flushed_after_the_interval():
+    store = FlakyStore(failures=0)
+    writer = ResultsWriter(store.apply, flush_every=100, flush_interval=0.05)
+    writer.put("10.0.0.1", "status", "success")
+    assert store.applied.wait(5)
+    assert store.rows == [("10.0.0.1", "status", "success")]
+    writer.close()
+
+
+def test_updates_from_many_threads_are_all_applied():
+    store = FlakyStore(failures=0)
+    writer = ResultsWriter(store.apply, flush_every=7, flush_interval=60)
+
+    def work(thread):
+        for i in range(50):
+            writer.put(f"10.0.{thread}.{i}", "status", "success")
+
+    threads = [threading.Thread(target=work, args=(thread,)) for thread in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.close()
+    assert len(store.rows) == len(set(store.rows)) == 400
+    # one writer applying batches, never one update at a time
+    assert store.calls <= 400 // 7 + 1
@@ -0,0 +1,64 @@
+import asyncio
+import pytest
+from src import retry
+from src.retry import RetryPolicy
+
+
+def failing(failures, exception=TimeoutError):
+    calls = []
+
+    def func():
+        calls.append(len(calls) + 1)
+        if len(calls) <= failures:
+            raise exception("timed out")
+        return "done"
+    return func, calls
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(retry.time, "sleep", slept.append)
+    return slept
+
+
+def test_delays_stay_within_the_backoff_bounds():
+    policy = RetryPolicy(attempts=10, base_delay=1.0, max_delay=5.0)
+    for retry_number, bound in enumerate([1, 2, 4, 5, 5, 5]):
+        for _ in range(100):
+            assert 0 <= policy.delay(retry_number) <= bound
+
+
+def test_call_retries_until_success(sleeps):
+    func, calls = failing(2)
+    retries = []
+    policy = RetryPolicy(attempts=3, base_delay=0.5)
+    assert policy.call(func, TimeoutError, on_retry=lambda attempt, e, delay: retries.append(attempt)) == "done"
+    assert calls == [1, 2, 3]
+    assert retries == [1, 2]
+    assert len(sleeps) == 2 and sleeps[0] <= 0.5 and sleeps[1] <= 1.0
+
+
+def test_call_raises_the_last_error_once_attempts_run_out(sleeps):
+    func, calls = failing(5)
+    with pytest.raises(TimeoutError):
+        RetryPolicy(attempts=3).call(func, TimeoutError)
+    assert calls == [1, 2, 3]
+
+
+def test_other_errors_are_not_retried(sleeps):
+    func, calls = failing(1, exception=ValueError)
+    with pytest.raises(ValueError):
+        RetryPolicy(attempts=3).call(func, TimeoutError)
+    assert calls == [1]
+    assert sleeps == []
+
+
+def test_call_async_retries_until_success():
+    func, calls = failing(1)
+
+    async def func_async():
+        return func()
+
+    assert asyncio.run(RetryPolicy(attempts=2, base_delay=0).call_async(func_async, TimeoutError)) == "done"
+    assert calls == [1, 2]
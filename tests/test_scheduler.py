@@ -0,0 +1,188 @@
+import time
+import asyncio
+import threading
+import pytest
+import src.scheduler
+from src.engines import run_asyncio, run_threaded
+from src.retry import RetryPolicy
+from src.scheduler import Scheduler, TokenBucket, subnet_key
+from src.sessions import SessionPool
+
+
+class CountingScheduler(Scheduler):
+    """
+    Scheduler counting the login tokens taken
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(login_rate=1000, login_burst=100, **kwargs)
+        self.tokens = 0
+        acquire, acquire_async = self.bucket.acquire, self.bucket.acquire_async
+
+        def counted():
+            self.tokens += 1
+            acquire()
+
+        async def counted_async():
+            self.tokens += 1
+            await acquire_async()
+
+        self.bucket.acquire, self.bucket.acquire_async = counted, counted_async
+
+
+def flaky_connect(failures):
+    attempts = []
+
+    def connect(host):
+        attempts.append(host)
+        if len(attempts) <= failures:
+            raise TimeoutError(host)
+        return f"session to {host}"
+    return connect, attempts
+
+
+def test_every_retried_login_takes_a_token():
+    scheduler = CountingScheduler()
+    connect, attempts = flaky_connect(2)
+    session = RetryPolicy(attempts=3, base_delay=0).call(lambda: scheduler.login(connect, "10.0.0.1"), TimeoutError)
+    assert session == "session to 10.0.0.1"
+    assert len(attempts) == scheduler.tokens == 3
+
+
+def test_every_retried_async_login_takes_a_token():
+    scheduler = CountingScheduler()
+    connect, attempts = flaky_connect(1)
+
+    async def connect_async():
+        return connect("10.0.0.1")
+
+    policy = RetryPolicy(attempts=2, base_delay=0)
+    asyncio.run(policy.call_async(lambda: scheduler.login_async(connect_async), TimeoutError))
+    assert len(attempts) == scheduler.tokens == 2
+
+
+def test_reconnecting_a_stale_session_takes_a_token():
+    class Session:
+        alive = True
+
+        def is_alive(self):
+            return self.alive
+
+        def disconnect(self):
+            pass
+
+    scheduler = CountingScheduler()
+    pool = SessionPool(connect=lambda host: scheduler.login(lambda: Session()))
+    host = {"host": "10.0.0.1"}
+    with pool.session(host) as session:
+        session.alive = False
+    with pool.session(host):
+        pass
+    with pool.session(host):
+        pass
+    # the first login, the reconnect of the stale session, then a reused session
+    assert scheduler.tokens == 2
+
+
+def test_jobs_take_no_token_without_a_login():
+    scheduler = CountingScheduler()
+    assert scheduler.run_job(lambda host: host["host"], {"host": "10.0.0.1"}) == "10.0.0.1"
+    assert scheduler.tokens == 0
+
+
+class FakeClock:
+    """
+    Stands in for the time module, sleeping by moving the clock forward
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_login_rate_is_capped(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(src.scheduler, "time", clock)
+    bucket = TokenBucket(rate=2, burst=2)
+    starts = []
+    for _ in range(6):
+        bucket.acquire()
+        starts.append(clock.now)
+    # the burst back to back, then one login every 1/rate seconds
+    assert starts == [0.0, 0.0, 0.5, 1.0, 1.5, 2.0]
+
+
+class GroupRecorder:
+    """
+    Job recording the order hosts start in and the most hosts of one group in progress at once
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.starts = []
+        self.running = {}
+        self.most = {}
+        self.lock = threading.Lock()
+
+    def enter(self, host):
+        group = self.key(host)
+        with self.lock:
+            self.starts.append(host["host"])
+            self.running[group] = self.running.get(group, 0) + 1
+            self.most[group] = max(self.most.get(group, 0), self.running[group])
+
+    def leave(self, host):
+        with self.lock:
+            self.running[self.key(host)] -= 1
+
+    def __call__(self, host):
+        self.enter(host)
+        time.sleep(0.05)
+        self.leave(host)
+
+    async def run_async(self, host):
+        self.enter(host)
+        await asyncio.sleep(0.05)
+        self.leave(host)
+
+
+def site_sorted_hosts():
+    # one busy site first, as a site sorted inventory would list it
+    return [{"host": f"10.0.1.{i}"} for i in range(1, 7)] + [{"host": "10.0.2.1"}]
+
+
+def test_threaded_groups_are_capped_without_blocking_other_groups():
+    scheduler = Scheduler(max_concurrency=3, group_key=subnet_key(24), group_limit=2)
+    recorder = GroupRecorder(scheduler.group_key)
+    run_threaded(recorder, site_sorted_hosts(), scheduler=scheduler)
+    assert sorted(recorder.starts) == sorted(host["host"] for host in site_sorted_hosts())
+    assert max(recorder.most.values()) == 2
+    # the other site starts on the free thread rather than behind the busy site
+    assert recorder.starts.index("10.0.2.1") == 2
+
+
+def test_asyncio_groups_are_capped_without_blocking_other_groups():
+    scheduler = Scheduler(max_concurrency=3, group_key=subnet_key(24), group_limit=2)
+    recorder = GroupRecorder(scheduler.group_key)
+    run_asyncio(recorder.run_async, site_sorted_hosts(), scheduler=scheduler)
+    assert sorted(recorder.starts) == sorted(host["host"] for host in site_sorted_hosts())
+    assert max(recorder.most.values()) == 2
+    assert recorder.starts.index("10.0.2.1") == 2
+
+
+def test_queued_hosts_still_run_when_the_inventory_fails():
+    scheduler = Scheduler(max_concurrency=2, group_key=subnet_key(24), group_limit=1)
+    recorder = GroupRecorder(scheduler.group_key)
+
+    def hosts():
+        yield from site_sorted_hosts()[:3]
+        raise OSError("inventory unreadable")
+
+    with pytest.raises(OSError):
+        run_threaded(recorder, hosts(), scheduler=scheduler)
+    assert sorted(recorder.starts) == ["10.0.1.1", "10.0.1.2", "10.0.1.3"]
@@ -0,0 +1,62 @@
+import pytest
+from src.sharding import parse_shard, shard_of, in_shard, partial_path, PartialResults, load_partial, merge_partials
+
+HOSTS = [{"host": f"10.0.{i >> 8}.{i & 255}"} for i in range(1000)]
+
+
+def test_parse_shard():
+    assert parse_shard("2/4") == (2, 4)
+    assert parse_shard("1/1") == (1, 1)
+    for text in ("0/4", "5/4", "1/0", "2", "a/b", "1/2/3"):
+        with pytest.raises(ValueError):
+            parse_shard(text)
+
+
+def test_shards_partition_the_hosts():
+    shards = [list(in_shard(HOSTS, index, 4)) for index in range(1, 5)]
+    assert sorted(host["host"] for shard in shards for host in shard) == sorted(host["host"] for host in HOSTS)
+    # crc32 spreads them roughly evenly
+    assert all(150 < len(shard) < 350 for shard in shards)
+    assert all(shard_of(host["host"], 4) == index for index, shard in enumerate(shards, 1) for host in shard)
+
+
+def test_partial_path(tmp_path):
+    assert partial_path(tmp_path / "hosts.xlsx", 2, 4) == tmp_path / "hosts.shard-2-of-4.jsonl"
+
+
+def test_partial_results_round_trip(tmp_path):
+    path = partial_path(tmp_path / "hosts.xlsx", 1, 2)
+    results = PartialResults(path)
+    results.update_process_column("10.0.0.1", True)
+    results.update_ports_column("10.0.0.1", ["Gi1/0/1: 12", "Gi1/0/2: 9"])
+    results.update_process_column("10.0.0.2", False)
+    results.close()
+    assert load_partial(path) == [("10.0.0.1", "status", "success"), ("10.0.0.1", "ports", "Gi1/0/1: 12 Gi1/0/2: 9"),
+                                  ("10.0.0.2", "status", "failed")]
+
+
+def test_load_partial_skips_a_truncated_last_line(tmp_path):
+    path = partial_path(tmp_path / "hosts.xlsx", 1, 2)
+    results = PartialResults(path)
+    results.update_process_column("10.0.0.1", True)
+    results.close()
+    with open(path, "a") as file:
+        file.write('{"key": "10.0.0.2", "col')
+    assert load_partial(path) == [("10.0.0.1", "status", "success")]
+
+
+def test_merge_partials_writes_every_shard(tmp_path):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("openpyxl")
+    spreadsheet = tmp_path / "hosts.xlsx"
+    pd.DataFrame({"hostname": ["a", "b", "c"], "ip": ["10.0.0.1", "10.0.0.2", "10.0.0.3"],
+                  "status": [None, None, None], "ports": [None, None, None]}).to_excel(
+        spreadsheet, sheet_name="Sheet 1", index=False)
+    for index, (key, result) in enumerate((("10.0.0.1", True), ("10.0.0.3", False)), 1):
+        results = PartialResults(partial_path(spreadsheet, index, 2))
+        results.update_process_column(key, result)
+        results.close()
+
+    assert merge_partials(spreadsheet, "Sheet 1") == 2
+    sheet = pd.read_excel(spreadsheet, sheet_name="Sheet 1")
+    assert list(sheet["status"].fillna("")) == ["success", "", "failed"]
@@ -0,0 +1,59 @@
+import json
+from src.snapshots import ADDED, MOVED, REMOVED, CHANGES_FILE, SnapshotStore, diff_snapshots, snapshot_from_scan
+from src.table_parser import HostRecord
+
+OLD = {
+    (10, "0011.2233.4455"): ("Gi1/0/1", "10.60.0.1"),
+    (10, "0011.2233.4466"): ("Gi1/0/2", None),
+    (20, "0011.2233.4477"): ("Gi1/0/3", "10.70.0.3"),
+}
+NEW = {
+    (10, "0011.2233.4455"): ("Gi1/0/1", "10.60.0.1"),
+    (10, "0011.2233.4466"): ("Gi1/0/5", None),
+    (20, "0011.2233.4488"): ("Gi1/0/3", "10.70.0.4"),
+}
+
+
+def test_diff_of_two_snapshots():
+    assert diff_snapshots(OLD, NEW) == [
+        (MOVED, 10, "0011.2233.4466", ("Gi1/0/2", None), ("Gi1/0/5", None)),
+        (REMOVED, 20, "0011.2233.4477", ("Gi1/0/3", "10.70.0.3"), None),
+        (ADDED, 20, "0011.2233.4488", None, ("Gi1/0/3", "10.70.0.4")),
+    ]
+    assert diff_snapshots(OLD, OLD) == []
+
+
+def test_snapshot_from_scan():
+    vlan_data = {10: {"Gi1/0/1": [HostRecord("10.60.0.1", "0011.2233.4455", "Gi1/0/1", "Cisco", 10)]}}
+    assert snapshot_from_scan(vlan_data) == {(10, "0011.2233.4455"): ("Gi1/0/1", "10.60.0.1")}
+
+
+def test_snapshots_round_trip(tmp_path):
+    store = SnapshotStore(tmp_path)
+    assert store.load("10.0.0.1") is None
+    store.save("10.0.0.1", "sw1", OLD)
+    assert store.load("10.0.0.1") == OLD
+    store.close()
+
+
+def test_update_records_the_changes_against_the_last_snapshot(tmp_path):
+    store = SnapshotStore(tmp_path)
+    assert store.update("10.0.0.1", "sw1", OLD) is None
+    assert store.update("10.0.0.1", "sw1", NEW) == diff_snapshots(OLD, NEW)
+    assert store.update("10.0.0.1", "sw1", NEW) == []
+    store.close()
+    lines = [json.loads(line) for line in (tmp_path / CHANGES_FILE).read_text().splitlines()]
+    assert [(line["change"], line["mac"]) for line in lines] == [
+        (MOVED, "0011.2233.4466"), (REMOVED, "0011.2233.4477"), (ADDED, "0011.2233.4488")]
+    assert lines[0]["old_port"] == "Gi1/0/2" and lines[0]["port"] == "Gi1/0/5"
+    assert "port" not in lines[1] and lines[2]["ip"] == "10.70.0.4"
+    reopened = SnapshotStore(tmp_path)
+    assert reopened.load("10.0.0.1") == NEW
+    reopened.close()
+
+
+def test_an_unreadable_snapshot_counts_as_none(tmp_path):
+    store = SnapshotStore(tmp_path)
+    store.path("10.0.0.1").write_bytes(b"not gzip")
+    assert store.load("10.0.0.1") is None
+    store.close()
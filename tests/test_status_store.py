@@ -0,0 +1,81 @@
+import threading
+import pytest
+from src.status_store import StatusStore, store_path
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = StatusStore(tmp_path / "hosts.status.db")
+    yield store
+    store.close()
+
+
+def hosts(count):
+    return [(i, f"10.0.0.{i}", f"sw{i}", None) for i in range(count)]
+
+
+def test_store_path_is_next_to_the_workbook(tmp_path):
+    assert store_path(tmp_path / "hosts.xlsx") == tmp_path / "hosts.status.db"
+
+
+def test_import_keeps_the_first_row_of_a_duplicate_ip(store):
+    assert store.import_hosts([(0, "10.0.0.1", "first", None), (1, "10.0.0.1", "second", None)]) == 1
+    assert store.get("10.0.0.1")["hostname"] == "first"
+
+
+def test_update_many_writes_known_columns_of_known_hosts(store):
+    store.import_hosts(hosts(3))
+    applied = store.update_many([("10.0.0.1", "status", "success"), ("10.0.0.2", "ports", "Gi1/0/1: 3"),
+                                 ("10.9.9.9", "status", "failed"), ("10.0.0.0", "vendor", "x")])
+    assert applied == 2
+    assert store.get("10.0.0.1")["status"] == "success"
+    assert store.get("10.0.0.2")["ports"] == "Gi1/0/1: 3"
+    assert store.get("10.9.9.9") is None
+
+
+def test_unexported_until_marked(store):
+    store.import_hosts(hosts(3))
+    store.update_many([("10.0.0.2", "status", "failed"), ("10.0.0.1", "status", "success")])
+    updates, until = store.unexported()
+    # in sheet order
+    assert updates == [("10.0.0.1", "status", "success"), ("10.0.0.2", "status", "failed")]
+    store.mark_exported(until)
+    assert store.unexported()[0] == []
+
+
+def test_reimport_keeps_results_of_another_process(tmp_path):
+    path = tmp_path / "hosts.status.db"
+    first, second = StatusStore(path), StatusStore(path)
+    try:
+        first.import_hosts(hosts(3))
+        first.update_many([("10.0.0.1", "status", "success")])
+        # a second process opening the same workbook
+        second.import_hosts(hosts(3))
+        assert second.get("10.0.0.1")["status"] == "success"
+        assert second.unexported()[0] == [("10.0.0.1", "status", "success")]
+    finally:
+        first.close()
+        second.close()
+
+
+def test_reimport_takes_the_sheet_status_of_exported_hosts(store):
+    store.import_hosts(hosts(2))
+    store.update_many([("10.0.0.1", "status", "success")])
+    store.mark_exported(store.unexported()[1])
+    store.import_hosts([(0, "10.0.0.0", "sw0", None), (1, "10.0.0.1", "sw1", None)])
+    assert store.get("10.0.0.1")["status"] is None
+
+
+def test_concurrent_writers(store):
+    store.import_hosts(hosts(200))
+
+    def write(first):
+        for i in range(first, 200, 4):
+            store.update_many([(f"10.0.0.{i}", "status", "success")])
+
+    threads = [threading.Thread(target=write, args=(first,)) for first in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(store.unexported()[0]) == 200
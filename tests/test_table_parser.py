@@ -0,0 +1,86 @@
+import pickle
+import pytest
+from src.cisco_switches import VENDOR_NOT_FOUND
+from benchmarks.synthetic_output import mac_table, arp_table, mac_address
+from src.table_parser import (iter_mac_entries, iter_arp_entries, parse_vlan_list, scan_device, scan_device_vlans,
+                              scan_device_vlans_compact, HostRecord)
+
+VENDORS = {"005056": "VMware"}
+
+MAC_LAYOUTS = "\n".join([
+    "Vlan    Mac Address       Type        Ports",
+    "  60    0011.2233.4455    DYNAMIC     Gi1/0/1",
+    "  60    0011.2233.4456    DYNAMIC pv  Gi1/0/2",
+    "*  60  0011.2233.4457    dynamic  Yes     0   Gi1/3",
+    "* 60     0011.2233.4458   dynamic  0         F      F    Eth1/4",
+    " All    0100.0ccc.cccc    STATIC      CPU",
+    "Total Mac Addresses for this criterion: 5",
+])
+
+
+def test_mac_entries_of_each_layout():
+    assert list(iter_mac_entries(MAC_LAYOUTS)) == [
+        ("60", "0011.2233.4455", "Gi1/0/1"),
+        ("60", "0011.2233.4456", "Gi1/0/2"),
+        ("60", "0011.2233.4457", "Gi1/3"),
+        ("60", "0011.2233.4458", "Eth1/4"),
+    ]
+
+
+def test_mac_entries_with_static():
+    assert ("All", "0100.0ccc.cccc", "CPU") in iter_mac_entries(MAC_LAYOUTS, dynamic_only=False)
+
+
+def test_arp_entries_of_ios_and_nxos():
+    output = "\r\n".join([
+        "Protocol  Address          Age (min)  Hardware Addr   Type   Interface",
+        "Internet  10.60.0.1          5   0011.2233.4455  ARPA   Vlan60",
+        "Internet  10.60.0.9          -   Incomplete      ARPA",
+        "10.60.0.2       00:03:12  0011.2233.4456  Vlan60",
+    ])
+    assert list(iter_arp_entries(output)) == [("10.60.0.1", "0011.2233.4455"), ("10.60.0.2", "0011.2233.4456")]
+
+
+def test_parse_vlan_list():
+    assert parse_vlan_list("60") == (60,)
+    assert parse_vlan_list("20, 10,60-62,61") == (10, 20, 60, 61, 62)
+    for text in ("", "a", "0", "10-5", "4095"):
+        with pytest.raises(ValueError):
+            parse_vlan_list(text)
+
+
+def test_scan_device_orders_ports_by_count_and_maps_ips():
+    result = scan_device(mac_table(10, ports=3), arp_table(4), VENDORS)
+    assert [(port, len(records)) for port, records in result.items()] == [("Gi1/0/1", 4), ("Gi1/0/2", 3),
+                                                                          ("Gi1/0/3", 3)]
+    first = result["Gi1/0/1"][0]
+    assert first == HostRecord("10.60.0.0", mac_address(0x00505600_0000), "Gi1/0/1", "VMware")
+    assert result["Gi1/0/1"][-1].ip is None
+
+
+def test_scan_device_keeps_the_last_port_of_a_moved_mac():
+    output = "\n".join(["  60    0011.2233.4455    DYNAMIC     Gi1/0/1",
+                        "  60    0011.2233.4455    DYNAMIC     Gi1/0/2"])
+    result = scan_device(output, None, VENDORS)
+    assert list(result) == ["Gi1/0/2"]
+    assert result["Gi1/0/2"][0].vendor == VENDOR_NOT_FOUND
+
+
+def test_scan_device_vlans_skips_other_vlans():
+    output = mac_table(4, vlan=10) + "\r\n" + mac_table(2, vlan=60) + "\r\n" + mac_table(3, vlan=99)
+    result = scan_device_vlans(output, None, VENDORS, (60, 10))
+    assert list(result) == [10, 60]
+    assert sum(len(records) for records in result[10].values()) == 4
+    assert {record.vlan for records in result[60].values() for record in records} == {60}
+
+
+def test_compact_matches_scan_device_vlans():
+    output = mac_table(50, vlan=10, ports=7) + "\r\n" + mac_table(30, vlan=60, ports=5)
+    arp = arp_table(20, vlan=10)
+    expected = scan_device_vlans(output, arp, VENDORS, (10, 60))
+    compact = pickle.loads(pickle.dumps(scan_device_vlans_compact(output, arp, VENDORS, (10, 60))))
+    assert list(compact) == list(expected)
+    for vlan, ports in expected.items():
+        assert list(compact[vlan]) == list(ports)
+        for port, records in ports.items():
+            assert list(compact[vlan][port]) == records
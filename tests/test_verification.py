@@ -0,0 +1,92 @@
+import re
+import pytest
+from src.verification import Verifier, Rule, EXPECT, FORBID, parse_command_set, ios_error_rules
+
+
+def test_parse_command_set_splits_directives():
+    cmds, rules = parse_command_set(["interface Gi1/0/1\n", "! forbid: Loop guard\n",
+                                     "! expect-re: Loopguard Default\\s+is disabled\n", "exit\n"])
+    assert cmds == ["interface Gi1/0/1", "exit"]
+    assert rules == [Rule(FORBID, "Loop guard"), Rule(EXPECT, r"Loopguard Default\s+is disabled", regex=True)]
+
+
+def test_forbidden_overlapping_expected_match():
+    verifier = Verifier([Rule(EXPECT, "Loopguard Default"), Rule(FORBID, "Default is enabled")])
+    verdict = verifier.verify("Loopguard Default is enabled\n")
+    assert not verdict.passed
+    assert verdict.forbidden == (Rule(FORBID, "Default is enabled"),)
+    assert verdict.missing == ()
+
+
+def test_forbidden_overlapping_expected_match_other_order():
+    verifier = Verifier([Rule(FORBID, "up down"), Rule(EXPECT, "status up")])
+    verdict = verifier.verify("Gi1/0/1 status up down\n")
+    assert verdict.forbidden == (Rule(FORBID, "up down"),)
+    assert verdict.missing == ()
+
+
+def test_backreference_and_inline_flags():
+    verifier = Verifier([Rule(EXPECT, "ready"),
+                         Rule(FORBID, r"(\w+) \1", regex=True),
+                         Rule(FORBID, r"(?i)invalid", regex=True)])
+    assert verifier.verify("ready\n").passed
+    assert verifier.verify("ready\nerror error\n").forbidden == (Rule(FORBID, r"(\w+) \1", regex=True),)
+    assert verifier.verify("ready\n% INVALID input\n").forbidden == (Rule(FORBID, r"(?i)invalid", regex=True),)
+
+
+def test_pattern_matches_within_one_line():
+    verifier = Verifier([Rule(EXPECT, r"Loopguard\s+is disabled", regex=True)])
+    assert verifier.verify("Loopguard   is disabled").passed
+    assert not verifier.verify("Loopguard\nis disabled\n").passed
+
+
+def test_missing_expected_pattern():
+    verdict = Verifier([Rule(EXPECT, "Building configuration")]).verify("write mem\n")
+    assert verdict.missing == (Rule(EXPECT, "Building configuration"),)
+    assert verdict.reasons() == ["missing expect: Building configuration"]
+
+
+def test_stream_reports_forbidden_as_soon_as_the_line_is_complete():
+    stream = Verifier(ios_error_rules()).stream()
+    assert not stream.feed("sw1(config)#interface Gi1/0/9\n% Inva")
+    assert stream.feed("lid input detected at '^' marker.\n")
+    assert not stream.close().passed
+
+
+def test_stream_checks_the_last_line_on_close():
+    stream = Verifier([Rule(EXPECT, "[OK]")]).stream()
+    stream.feed("Building configuration...\n[O")
+    stream.feed("K]")
+    assert stream.close().passed
+
+
+def test_invalid_pattern_raises():
+    with pytest.raises(re.error):
+        Verifier([Rule(FORBID, "(unclosed", regex=True)])
+
+
+def test_rules_share_one_prefilter_unless_they_need_their_own_groups():
+    verifier = Verifier([Rule(EXPECT, "ready"), Rule(FORBID, r"(?i)invalid", regex=True),
+                         Rule(FORBID, r"(\w+) \1", regex=True), Rule(FORBID, r"(?P<word>x)", regex=True)])
+    assert verifier.combined == [0, 1]
+    assert verifier.alone == [2, 3]
+
+
+def test_a_match_hidden_by_another_in_the_prefilter_is_confirmed():
+    verifier = Verifier([Rule(EXPECT, "Gi1/0/1 status up"), Rule(FORBID, "up down"), Rule(EXPECT, "status"),
+                         Rule(FORBID, "err-disabled")])
+    verdict = verifier.verify("Gi1/0/1 status up down\nGi1/0/2 status err-disabled\n")
+    assert verdict.forbidden == (Rule(FORBID, "up down"), Rule(FORBID, "err-disabled"))
+    assert verdict.missing == ()
+
+
+def test_anchors_apply_to_each_line():
+    verifier = Verifier([Rule(EXPECT, r"^\[OK\]$", regex=True), Rule(FORBID, r"^%", regex=True)])
+    assert verifier.verify("Building configuration...\n[OK]\nsw1#\n").passed
+    assert verifier.verify("sw1(config)#foo\n% Invalid input\n[OK]\n").forbidden == (Rule(FORBID, r"^%", regex=True),)
+    assert not verifier.verify("  [OK] \n").passed
+
+
+def test_a_match_across_lines_in_the_prefilter_is_confirmed_per_line():
+    verifier = Verifier([Rule(EXPECT, r"enabled\s+\S+", regex=True), Rule(EXPECT, "Gi1/0/2")])
+    assert verifier.verify("Loop guard enabled\nGi1/0/2 enabled on port\n").passed